@@ -1,10 +1,11 @@
 # Group 1, March 16, 2026
 
+import os
 import time
+import random
 import socket, pickle
 import numpy as np
 from reversi import reversi
-from random import choice
 
 def calculate_final_score(board):
     black_tiles = 0
@@ -122,18 +123,44 @@ CHOSEN_HEURISTIC = heuristic_nic
 TIME_LIMIT = 4.0  # seconds per move
 MAX_DEPTH = 12  # hard cap; iterative deepening rarely reaches this
 
+# Reproducible mode for benchmarking. REVERSI_NODE_LIMIT=<n> limits each move to n minimax
+# nodes instead of TIME_LIMIT, and REVERSI_SEED=<s> seeds the choice between tied moves from
+# s and the position. With both set, a position always gives the same move on any machine.
+NODE_LIMIT = int(os.environ['REVERSI_NODE_LIMIT']) if os.environ.get('REVERSI_NODE_LIMIT') else None
+SEED = os.environ.get('REVERSI_SEED')
+rng = random.Random(SEED)
+node_count = 0
+node_limit = None  # node_count value at which the current search stops (node-limited mode)
+# The limits are checked every CHECK_INTERVAL nodes (as in src/minimax_alpha_beta_h_nic.py)
+# rather than reading the clock at every node; a node limit is still checked on the exact node.
+CHECK_INTERVAL = 64
+next_check = 0     # node_count value of the next check
+
 
 class TimeUp(Exception):
     """Raised inside minimax when the deadline has been exceeded."""
     pass
 
 
+def check_limits(deadline):
+    """Raise TimeUp if the search is out of nodes (or, without NODE_LIMIT, time), else schedule the next check."""
+    global next_check
+    if node_limit is not None:
+        if node_count > node_limit:
+            raise TimeUp()
+    elif time.time() >= deadline:
+        raise TimeUp()
+    next_check = node_count + CHECK_INTERVAL
+    if node_limit is not None:
+        next_check = min(next_check, node_limit + 1)
+
+
 def minimax(board, game, depth, alpha, beta, maximizing_player, player, deadline, heuristic):
     """
     Minimax search with alpha-beta pruning and a hard time deadline.
 
-    Raises TimeUp if the deadline is exceeded so the caller can fall back to
-    the best move found at the previous completed depth.
+    Raises TimeUp if the deadline (or, with NODE_LIMIT, the node budget) is exceeded so the
+    caller can fall back to the best move found at the previous completed depth.
 
     Args:
         board:             current board state (np.ndarray)
@@ -149,8 +176,10 @@ def minimax(board, game, depth, alpha, beta, maximizing_player, player, deadline
     Returns:
         (score, best_move) tuple
     """
-    if time.time() >= deadline:
-        raise TimeUp()
+    global node_count
+    node_count += 1
+    if node_count >= next_check:
+        check_limits(deadline)
 
     current_piece = player if maximizing_player else -player
 
@@ -214,7 +243,7 @@ def minimax(board, game, depth, alpha, beta, maximizing_player, player, deadline
             if beta <= alpha:
                 break  # Beta cutoff
 
-        best_move = choice(best_move_list)[1]
+        best_move = rng.choice(best_move_list)[1]
         return max_eval, best_move
     else:  # essentially doing the same as above but looking for the "worst" score (the score that is most detrimental to us)
         min_eval = float('inf')
@@ -237,7 +266,13 @@ def minimax(board, game, depth, alpha, beta, maximizing_player, player, deadline
 
 
 def get_best_move(board, game, player, heuristic):
+    global node_limit, next_check
     deadline = time.time() + TIME_LIMIT
+    node_limit = node_count + NODE_LIMIT if NODE_LIMIT is not None else None
+    next_check = node_count  # the first node checks
+    if SEED is not None:
+        # Seeded from the position as well, so the move does not depend on earlier moves
+        rng.seed(f'{SEED}:{player}:{board.tobytes().hex()}')
     best_move = get_legal_moves(game, player)[0]  # safe fallback
 
     for depth in range(1, MAX_DEPTH + 1):
@@ -0,0 +1,179 @@
+import os
+import sys
+import json
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+from position import Position
+from renderers import read_recording
+
+# Game analysis: re-search every position of recorded games and report how good each
+# played move was.
+#
+# Games are read from the JSON-lines recordings written with --record (renderers.GameRecorder).
+# Every (position, played move) is searched with minimax's multi-PV mode to a fixed depth or
+# node budget, in parallel worker processes. Positions are identified by their bitboard key,
+# so a position that occurs in several games (openings, transpositions) is searched once,
+# and finished results are kept in an analysis cache file so later runs skip them too.
+#
+# For each move the report shows the played move's score and rank, the best move (or the best
+# alternative when the played move was best) and the swing: how much worse the played move
+# scored than the best one, from the mover's point of view.
+#
+#     python3 src/analysis.py recordings/*.jsonl --depth 4
+#     python3 src/analysis.py game.jsonl --nodes 20000 --top 5 --workers 4
+
+DEFAULT_CACHE = os.path.join('analysis', 'cache.jsonl')
+INACCURACY = 30.0     # swing marked '?'
+BLUNDER = 100.0       # swing marked '??'
+
+
+# ── Worker ────────────────────────────────────────────────────────────────────
+
+def _analyse(job):
+    """Multi-PV search of one (position key, played move). Runs in a worker process."""
+    key, played, depth, node_limit, k = job
+    import minimax_alpha_beta_h_nic as search
+    from position_cache import PositionStore
+
+    global _table
+    if '_table' not in globals():
+        # One memory-only transposition table per worker, shared by all its positions
+        _table = PositionStore(None)
+    result = search.multi_pv_search(Position(*key), search.CHOSEN_HEURISTIC, k, tuple(played),
+                                    depth=depth, node_limit=node_limit, cache=_table)
+    if result is None:
+        return None
+    reached, lines, played_score, played_rank = result
+    return {'depth': reached, 'lines': [[list(move), score] for move, score in lines],
+            'played_score': played_score, 'played_rank': played_rank,
+            'moves': len(Position(*key).legal_moves())}
+
+
+# ── Games ─────────────────────────────────────────────────────────────────────
+
+def game_moves(path):
+    """The moves of a recorded game as (ply, position before the move, played move), passes left out."""
+    moves = []
+    previous = None
+    for ply, move, turn, board in read_recording(path):
+        if previous is not None and move is not None and move != [-1, -1]:
+            moves.append((ply, Position.from_board(previous[1], previous[0]), tuple(move)))
+        previous = (turn, board)
+    return moves
+
+
+def _cache_key(position, move, settings):
+    return f"{position.white:x}:{position.black:x}:{position.turn}:{move[0]}{move[1]}:{settings}"
+
+
+def load_cache(path):
+    cache = {}
+    if path and os.path.exists(path):
+        with open(path) as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    cache[record['key']] = record['result']
+    return cache
+
+
+def analyse_games(paths, depth=None, node_limit=None, k=3, workers=None, cache_path=DEFAULT_CACHE):
+    """
+    Analyse every move of the recorded games.
+
+    Returns:
+        {path: [(ply, position, played move, result dict or None)]}, and the number of
+        positions searched in this run (the rest came from the cache or another game)
+    """
+    from minimax_alpha_beta_h_nic import CHOSEN_HEURISTIC
+    settings = f"{CHOSEN_HEURISTIC.__name__}:d{depth}:n{node_limit}:k{k}"
+    games = {path: game_moves(path) for path in paths}
+    cache = load_cache(cache_path)
+
+    jobs = {}
+    for moves in games.values():
+        for _, position, move in moves:
+            key = _cache_key(position, move, settings)
+            if key not in cache and key not in jobs:
+                jobs[key] = (position.key(), move, depth, node_limit, k)
+
+    if jobs:
+        if cache_path:
+            os.makedirs(os.path.dirname(cache_path) or '.', exist_ok=True)
+        out = open(cache_path, 'a') if cache_path else None
+        with ProcessPoolExecutor(workers or os.cpu_count() or 1) as pool:
+            for key, result in zip(jobs, pool.map(_analyse, jobs.values(), chunksize=4)):
+                cache[key] = result
+                if out is not None and result is not None:
+                    out.write(json.dumps({'key': key, 'result': result}) + '\n')
+        if out is not None:
+            out.close()
+
+    report = {path: [(ply, position, move, cache.get(_cache_key(position, move, settings)))
+                     for ply, position, move in moves]
+              for path, moves in games.items()}
+    return report, len(jobs)
+
+
+# ── Report ────────────────────────────────────────────────────────────────────
+
+def format_game(path, moves):
+    """Per-move report of one game, plus mean loss and mistakes per side."""
+    lines = [f"Game {path}",
+             f"{'ply':>4} {'side':<5} {'played':<7} {'score':>8} {'rank':>6}  {'best':<7} {'score':>8} "
+             f"{'swing':>7}  top moves"]
+    totals = {1: [0.0, 0, 0, 0], -1: [0.0, 0, 0, 0]}   # loss, moves, inaccuracies, blunders
+    for ply, position, move, result in moves:
+        side = 'White' if position.turn == 1 else 'Black'
+        if result is None:
+            lines.append(f"{ply:>4} {side:<5} {str(move):<7} (not analysed)")
+            continue
+        best_move, best_score = result['lines'][0]
+        best_move = tuple(best_move)
+        if best_move == move and len(result['lines']) > 1:
+            # Played the best move: show the best alternative instead
+            alternative, alternative_score = result['lines'][1]
+            best_label, best_value = f"{tuple(alternative)}", alternative_score
+        else:
+            best_label, best_value = f"{best_move}", best_score
+        swing = max(0.0, best_score - result['played_score'])
+        mark = '??' if swing >= BLUNDER else '?' if swing >= INACCURACY else ''
+        top = ', '.join(f"{tuple(m)} {s:+.0f}" for m, s in result['lines'])
+        lines.append(f"{ply:>4} {side:<5} {str(move):<7} {result['played_score']:>+8.1f} "
+                     f"{result['played_rank']:>3}/{result['moves']:<2}  {best_label:<7} {best_value:>+8.1f} "
+                     f"{swing:>7.1f}{mark:<2} {top}")
+        total = totals[position.turn]
+        total[0] += swing
+        total[1] += 1
+        total[2] += mark == '?'
+        total[3] += mark == '??'
+    for turn, (loss, count, inaccuracies, blunders) in totals.items():
+        if count:
+            lines.append(f"{'White' if turn == 1 else 'Black'}: mean swing {loss / count:.1f} over {count} moves, "
+                         f"{inaccuracies} inaccuracies (?), {blunders} blunders (??)")
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Re-search recorded games and report the quality of every move.')
+    parser.add_argument('games', nargs='+', help='game recordings (JSON lines written with --record)')
+    parser.add_argument('--depth', type=int, default=None, help='search depth (default 4 without --nodes)')
+    parser.add_argument('--nodes', type=int, default=None, help='node budget per position instead of a depth')
+    parser.add_argument('--top', type=int, default=3, help='number of best moves listed per position')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--cache', default=DEFAULT_CACHE, help="analysis cache file ('' to disable)")
+    args = parser.parse_args()
+
+    depth = args.depth if args.depth is not None or args.nodes is not None else 4
+    report, searched = analyse_games(args.games, depth, args.nodes, args.top, args.workers, args.cache)
+    for path, moves in report.items():
+        print(format_game(path, moves))
+        print()
+    total = sum(len(moves) for moves in report.values())
+    print(f"{total} moves in {len(report)} games, {searched} positions searched "
+          f"({total - searched} from the cache or shared with another game)")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,228 @@
+import numpy as np
+
+# Vectorized move generation for many boards at once.
+#
+# Boards are stacked into an (N, 8, 8) array with the same encoding as reversi.board
+# (1 = white, -1 = black, 0 = empty). Squares are numbered x * 8 + y.
+#
+# Move generation shifts whole stacks of own/opponent masks along each direction.
+# Playing moves uses RAYS[square, direction, k], the square k + 1 steps from `square`
+# in `direction` (or 64 once the ray leaves the board): boards are flattened to 65
+# columns with an always-empty column 64, so reading the rays of every played square
+# is one fancy-indexing operation and the flips follow from the opponent run lengths.
+
+DIRECTIONS = [(1, 1), (1, 0), (1, -1), (0, 1), (0, -1), (-1, 1), (-1, 0), (-1, -1)]
+OFF_BOARD = 64
+
+
+def _build_rays():
+    rays = np.full((64, 8, 7), OFF_BOARD, dtype=np.intp)
+    for square in range(64):
+        x, y = divmod(square, 8)
+        for d, (dx, dy) in enumerate(DIRECTIONS):
+            for k in range(7):
+                cx, cy = x + dx * (k + 1), y + dy * (k + 1)
+                if not (0 <= cx <= 7 and 0 <= cy <= 7):
+                    break
+                rays[square, d, k] = cx * 8 + cy
+    return rays
+
+
+RAYS = _build_rays()
+
+
+def _relative(boards, pieces):
+    """Flatten boards to (N, 65) from each mover's point of view: own = 1, opponent = -1."""
+    boards = np.asarray(boards)
+    n = boards.shape[0]
+    flat = np.zeros((n, 65), dtype=np.int8)
+    flat[:, :64] = boards.reshape(n, 64) * np.asarray(pieces).reshape(n, 1)
+    return flat
+
+
+def _ray_runs(values):
+    """
+    For ray values (..., 8, 7) seen from the mover, return (run, valid): the length of the
+    opponent run starting next to the square, and whether an own disc closes it.
+    """
+    run = np.cumprod(values == -1, axis=-1).sum(axis=-1)
+    closing = np.take_along_axis(values, np.minimum(run, 6)[..., None], axis=-1)[..., 0]
+    valid = (run > 0) & (run < 7) & (closing == 1)
+    return run, valid
+
+
+def _shifted(padded, dx, dy):
+    """View of a board stack padded by 7 where element [x, y] is the square (x + dx, y + dy)."""
+    return padded[:, 7 + dx:15 + dx, 7 + dy:15 + dy]
+
+
+def flip_counts(boards, pieces):
+    """
+    Number of discs each move would flip, for every square of every board.
+
+    Works on whole (N, 8, 8) masks shifted along each direction, so the cost is a few
+    hundred numpy operations regardless of N.
+
+    Args:
+        boards: (N, 8, 8) array of boards
+        pieces: (N,) piece to move on each board (1 or -1)
+
+    Returns:
+        (N, 64) int array, 0 where the move is illegal
+    """
+    boards = np.asarray(boards)
+    n = boards.shape[0]
+    relative = boards.reshape(n, 8, 8) * np.asarray(pieces).reshape(n, 1, 1)
+    own = np.pad(relative == 1, ((0, 0), (7, 7), (7, 7)))
+    opponent = np.pad(relative == -1, ((0, 0), (7, 7), (7, 7)))
+
+    counts = np.zeros((n, 8, 8), dtype=np.int64)
+    for dx, dy in DIRECTIONS:
+        run = _shifted(opponent, dx, dy)
+        for k in range(2, 8):
+            if not run.any():
+                break
+            counts += (run & _shifted(own, k * dx, k * dy)) * (k - 1)
+            run = run & _shifted(opponent, k * dx, k * dy)
+    counts[relative != 0] = 0
+    return counts.reshape(n, 64)
+
+
+# Bitboards: bit x * 8 + y of a uint64 is square (x, y). Shifting a whole bitboard moves every
+# disc one step in a direction; the column masks stop discs wrapping from one row to the next.
+NOT_COL_0 = np.uint64(0xFEFEFEFEFEFEFEFE)
+NOT_COL_7 = np.uint64(0x7F7F7F7F7F7F7F7F)
+
+
+def to_bitboards(boards, pieces):
+    """Return (own, opponent) uint64 bitboards of shape (N,) from each mover's point of view."""
+    boards = np.asarray(boards)
+    n = boards.shape[0]
+    relative = boards.reshape(n, 64) * np.asarray(pieces).reshape(n, 1)
+    own = np.packbits(relative == 1, axis=1, bitorder='little').view('<u8')[:, 0]
+    opponent = np.packbits(relative == -1, axis=1, bitorder='little').view('<u8')[:, 0]
+    return own, opponent
+
+
+def from_bitboard(bits):
+    """Unpack (N,) uint64 bitboards into an (N, 64) bool array."""
+    bits = np.ascontiguousarray(bits, dtype='<u8')
+    return np.unpackbits(bits.view(np.uint8).reshape(-1, 8), axis=1, bitorder='little').astype(bool)
+
+
+def shift(bits, dx, dy):
+    """Move every set bit one square in direction (dx, dy), dropping bits that leave the board."""
+    amount = dx * 8 + dy
+    if amount > 0:
+        bits = bits << np.uint64(amount)
+    else:
+        bits = bits >> np.uint64(-amount)
+    if dy == 1:
+        bits = bits & NOT_COL_0
+    elif dy == -1:
+        bits = bits & NOT_COL_7
+    return bits
+
+
+def _direction_groups():
+    # The 8 directions split by shift direction, as (amounts, masks) columns of shape (4, 1):
+    # shifting an (N,) stack by a column broadcasts to (4, N), i.e. four directions per operation
+    groups = []
+    for left in (True, False):
+        amounts, masks = [], []
+        for dx, dy in DIRECTIONS:
+            amount = dx * 8 + dy
+            if (amount > 0) == left:
+                amounts.append(abs(amount))
+                masks.append(NOT_COL_0 if dy == 1 else NOT_COL_7 if dy == -1 else ~np.uint64(0))
+        groups.append((left, np.array(amounts, dtype=np.uint64)[:, None], np.array(masks, dtype=np.uint64)[:, None]))
+    return groups
+
+
+DIRECTION_GROUPS = _direction_groups()
+
+
+def move_bitboards(own, opponent):
+    """Legal moves of `own` as (N,) uint64 bitboards."""
+    empty = ~(own | opponent)
+    moves = np.zeros_like(own)
+    for left, amounts, masks in DIRECTION_GROUPS:
+        if left:
+            step = lambda bits: (bits << amounts) & masks
+        else:
+            step = lambda bits: (bits >> amounts) & masks
+        run = step(own) & opponent
+        for _ in range(5):
+            run |= step(run) & opponent
+        moves |= np.bitwise_or.reduce(step(run) & empty, axis=0)
+    return moves
+
+
+def flip_bitboards(own, opponent, squares):
+    """
+    Discs flipped when `own` plays on `squares`, as (N,) uint64 bitboards (0 where nothing is flipped).
+
+    Args:
+        own, opponent: (N,) uint64 bitboards
+        squares:       (N,) square played on each board
+    """
+    own = np.asarray(own, dtype=np.uint64)
+    opponent = np.asarray(opponent, dtype=np.uint64)
+    start = np.left_shift(np.uint64(1), np.asarray(squares, dtype=np.uint64))
+    flips = np.zeros_like(own)
+    for left, amounts, masks in DIRECTION_GROUPS:
+        if left:
+            step = lambda bits: (bits << amounts) & masks
+        else:
+            step = lambda bits: (bits >> amounts) & masks
+        # The opponent run next to the square in each direction, kept if an own disc closes it
+        run = step(start) & opponent
+        for _ in range(5):
+            run |= step(run) & opponent
+        closed = (step(run) & own) != 0
+        flips |= np.bitwise_or.reduce(np.where(closed, run, np.uint64(0)), axis=0)
+    return flips
+
+
+def legal_masks(boards, pieces):
+    """(N, 64) bool array of legal moves for the piece to move on each board."""
+    return from_bitboard(move_bitboards(*to_bitboards(boards, pieces)))
+
+
+def play_moves(boards, pieces, squares):
+    """
+    Play one move on each board, in place.
+
+    Args:
+        boards:  (N, 8, 8) array of boards, modified in place
+        pieces:  (N,) piece to move on each board
+        squares: (N,) square to play on each board, or -1 to leave that board alone
+
+    Returns:
+        (N,) number of discs flipped on each board (0 for boards left alone or illegal moves)
+    """
+    boards = np.asarray(boards)
+    pieces = np.asarray(pieces)
+    squares = np.asarray(squares)
+    flipped = np.zeros(len(squares), dtype=np.int64)
+
+    moving = np.flatnonzero(squares >= 0)
+    if len(moving) == 0:
+        return flipped
+
+    flat = _relative(boards[moving], pieces[moving])
+    rays = RAYS[squares[moving]]                                  # (M, 8, 7)
+    values = np.take_along_axis(flat[:, None, :], rays.reshape(len(moving), 1, 56), axis=-1)
+    run, valid = _ray_runs(values.reshape(len(moving), 8, 7))
+    flips = (np.arange(7) < run[..., None]) & valid[..., None]    # (M, 8, 7)
+    counts = flips.sum(axis=(1, 2))
+    legal = counts > 0
+
+    view = boards.reshape(boards.shape[0], 64)
+    rows = np.broadcast_to(moving[:, None, None], flips.shape)[flips]
+    view[rows, rays[flips]] = pieces[rows]
+    played = moving[legal]
+    view[played, squares[played]] = pieces[played]
+
+    flipped[moving] = counts
+    return flipped
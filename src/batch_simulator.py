@@ -0,0 +1,194 @@
+import io
+import sys
+import time
+import contextlib
+import itertools
+import numpy as np
+from reversi import reversi
+
+import batch_engine
+from utils import WEIGHT_MATRIX
+
+# Simulator for many games at once.
+#
+# N games are held as arrays (boards, side to move, consecutive passes, finished mask)
+# and every step plays one move in each unfinished game with batch_engine. Moves come
+# from batched policies: callables  policy(boards, pieces, legal) -> squares  that see
+# the (M, 8, 8) boards of the M unfinished games, the side to move on each, and their
+# (M, 64) legal-move masks, and return one square (x * 8 + y) per game. A game with no
+# legal move passes whatever the policy says; the rules are the same as AutoGameServer
+# (an illegal move counts as a pass, two passes in a row end the game).
+
+
+class BatchSimulator:
+    """
+    N simultaneous games.
+
+    Args:
+        n:      number of games, all starting from the initial position
+        boards: optional (N, 8, 8) starting boards instead
+        pieces: side to move on each starting board (default: white everywhere)
+    """
+
+    def __init__(self, n=None, boards=None, pieces=None):
+        if boards is None:
+            boards = np.repeat(reversi().board[None], n, axis=0)
+        self.boards = np.array(boards, dtype=np.int8)
+        self.n = len(self.boards)
+        self.pieces = np.ones(self.n, dtype=np.int8) if pieces is None else np.array(pieces, dtype=np.int8)
+        self.passes = np.zeros(self.n, dtype=np.int8)
+        self.done = np.zeros(self.n, dtype=bool)
+        self.plies = 0
+
+    def active(self):
+        """Indices of the games that are still running."""
+        return np.flatnonzero(~self.done)
+
+    def step(self, policy, games=None):
+        """
+        Play one move (or pass) in every running game, or only in `games` if given.
+
+        Returns:
+            (M,) squares played in the games that moved, -1 for passes
+        """
+        games = self.active() if games is None else games
+        if len(games) == 0:
+            return np.zeros(0, dtype=np.intp)
+
+        boards = self.boards[games]
+        pieces = self.pieces[games]
+        legal = batch_engine.legal_masks(boards, pieces)
+        has_move = legal.any(axis=1)
+
+        squares = np.asarray(policy(boards, pieces, legal), dtype=np.intp)
+        squares = np.where(has_move, squares, -1)
+        # Same as the servers: an illegal move is treated as a pass
+        chosen = legal[np.arange(len(games)), np.clip(squares, 0, 63)]
+        squares = np.where(chosen & (squares >= 0), squares, -1)
+
+        batch_engine.play_moves(boards, pieces, squares)
+        self.boards[games] = boards
+
+        self.passes[games] = np.where(squares >= 0, 0, self.passes[games] + 1)
+        self.pieces[games] = -pieces
+        self.done[games] = self.passes[games] >= 2
+        self.plies += 1
+        return squares
+
+    def run(self, white_policy, black_policy=None, max_plies=None):
+        """Play every game to the end (or for max_plies steps), white and black using their own policies."""
+        black_policy = black_policy or white_policy
+        steps = 0
+        while not self.done.all() and (max_plies is None or steps < max_plies):
+            games = self.active()
+            if white_policy is black_policy:
+                self.step(white_policy, games)
+            else:
+                white = games[self.pieces[games] == 1]
+                black = games[self.pieces[games] == -1]
+                self.step(white_policy, white)
+                self.step(black_policy, black)
+            steps += 1
+
+    def disc_difference(self):
+        """(N,) white discs minus black discs."""
+        return self.boards.reshape(self.n, 64).sum(axis=1, dtype=np.int64)
+
+    def winners(self):
+        """(N,) 1 where white won, -1 where black won, 0 for draws (meaningful once the games are done)."""
+        return np.sign(self.disc_difference())
+
+
+# ── Batched policies ──────────────────────────────────────────────────────────
+
+def random_policy(rng=None):
+    """Uniformly random legal move."""
+    rng = rng or np.random.default_rng()
+
+    def policy(boards, pieces, legal):
+        keys = np.where(legal, rng.random(legal.shape), -1.0)
+        return np.argmax(keys, axis=1)
+    return policy
+
+
+def weighted_policy(weights=np.exp(WEIGHT_MATRIX.ravel() / 50.0), rng=None):
+    """Random legal move with probability proportional to the square's weight."""
+    rng = rng or np.random.default_rng()
+    exponents = 1.0 / np.asarray(weights, dtype=float).ravel()
+
+    def policy(boards, pieces, legal):
+        # The largest u ** (1 / w) is picked with probability w / sum(w)
+        keys = np.where(legal, rng.random(legal.shape) ** exponents, -1.0)
+        return np.argmax(keys, axis=1)
+    return policy
+
+
+def greedy_policy(boards, pieces, legal):
+    """Move that flips the most discs, like greedy_player."""
+    return np.argmax(batch_engine.flip_counts(boards, pieces), axis=1)
+
+
+# ── Openings ──────────────────────────────────────────────────────────────────
+
+OPENING_CHUNK = 256   # candidate openings simulated per batch by random_openings
+
+
+def random_openings(count, plies, seed=None):
+    """
+    Generate `count` distinct positions reached by `plies` random moves from the start.
+
+    Candidates are simulated in chunks of OPENING_CHUNK, chunk k with its own generator seeded
+    by (seed, k), so the sequence does not depend on `count`: the first n openings are the same
+    for any count >= n (a match resumed with more pairs keeps its openings).
+
+    Returns:
+        (boards, pieces): (count, 8, 8) boards and the side to move on each; fewer than
+        `count` if there are not that many distinct positions at that depth
+    """
+    seen = {}
+    for chunk in itertools.count():
+        found = len(seen)
+        rng = np.random.default_rng(None if seed is None else [seed, chunk])
+        sim = BatchSimulator(OPENING_CHUNK)
+        sim.run(random_policy(rng), max_plies=plies)
+        for board, piece, done in zip(sim.boards, sim.pieces, sim.done):
+            if not done and len(seen) < count:
+                seen.setdefault((board.tobytes(), int(piece)), (board, piece))
+        if len(seen) >= count or len(seen) == found:
+            break
+    openings = list(seen.values())
+    return np.stack([b for b, _ in openings]), np.array([p for _, p in openings])
+
+
+# ── Benchmark ─────────────────────────────────────────────────────────────────
+
+def benchmark(games=256):
+    """Games/sec of random self-play in the simulator against looping AutoGameServer."""
+    from reversi_auto_server import AutoGameServer
+
+    rng = np.random.default_rng(0)
+    start = time.time()
+    sim = BatchSimulator(games)
+    sim.run(random_policy(rng))
+    batched = games / (time.time() - start)
+
+    def random_player(turn, board, game):
+        legal = batch_engine.legal_masks(board[None], [turn])[0]
+        if not legal.any():
+            return [-1, -1]
+        return list(divmod(int(rng.choice(np.flatnonzero(legal))), 8))
+
+    looped_games = max(games // 16, 1)
+    start = time.time()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(looped_games):
+            AutoGameServer(random_player, random_player).play_game()
+    looped = looped_games / (time.time() - start)
+
+    print(f"BatchSimulator: {batched:8.0f} games/s ({games} games)")
+    print(f"AutoGameServer: {looped:8.0f} games/s ({looped_games} games)")
+    print(f"Speedup:        {batched / looped:8.1f}x")
+
+
+if __name__ == '__main__':
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 256)
@@ -0,0 +1,150 @@
+import sys
+import time
+import random
+
+from position import Position, move_bits, flip_bits
+from features import odd_regions
+
+# Exact endgame solver.
+#
+# Searches to the end of the game with alpha-beta on the final disc difference (own discs
+# minus opponent discs, empties not counted, the same way the servers score a game). Moves
+# are ordered fastest-first (fewest replies for the opponent) and then by parity (moves into
+# odd empty regions first). The search is bounded by a node budget: if it runs out the
+# solve gives up with SolveBudgetExceeded instead of taking an unknown amount of time.
+#
+# With the window (-1, 1) the solve only proves win / draw / loss, which needs far fewer
+# nodes than the exact score and is all adjudication needs.
+#
+#     python3 src/endgame.py [positions] [empties]    nodes and time per solve on random positions
+
+# Below this many empties fastest-first ordering costs more than it saves; parity alone is used
+FASTEST_FIRST_EMPTIES = 7
+
+
+class SolveBudgetExceeded(Exception):
+    """Raised when a solve visits more nodes than its budget."""
+    pass
+
+
+class _Solver:
+    def __init__(self, node_budget):
+        self.node_budget = node_budget
+        self.nodes = 0
+
+    def ordered_moves(self, own, opponent, moves):
+        """(square, flips) of every move in `moves`, in the order they should be searched."""
+        empties = 64 - (own | opponent).bit_count()
+        odd = odd_regions(own, opponent)
+        scored = []
+        while moves:
+            low = moves & -moves
+            square = low.bit_length() - 1
+            flips = flip_bits(own, opponent, square)
+            key = 0 if odd & low else 1
+            if empties >= FASTEST_FIRST_EMPTIES:
+                key += 2 * move_bits(opponent & ~flips, own | flips | low).bit_count()
+            scored.append((key, square, flips))
+            moves ^= low
+        scored.sort()
+        return [(square, flips) for _, square, flips in scored]
+
+    def search(self, own, opponent, alpha, beta, passed=False):
+        """
+        Returns:
+            (score for the side to move, best line as a list of squares, -1 for a pass)
+        """
+        self.nodes += 1
+        if self.node_budget is not None and self.nodes > self.node_budget:
+            raise SolveBudgetExceeded(self.nodes)
+
+        moves = move_bits(own, opponent)
+        if not moves:
+            if passed:
+                return own.bit_count() - opponent.bit_count(), []
+            score, line = self.search(opponent, own, -beta, -alpha, True)
+            return -score, [-1] + line
+
+        best, best_line = -65, []
+        for square, flips in self.ordered_moves(own, opponent, moves):
+            score, line = self.search(opponent & ~flips, own | flips | (1 << square), -beta, -alpha)
+            score = -score
+            if score > best:
+                best, best_line = score, [square] + line
+                if score > alpha:
+                    alpha = score
+                    if alpha >= beta:
+                        break
+        return best, best_line
+
+
+def solve(position, alpha=-64, beta=64, node_budget=None):
+    """
+    Solve `position` to the end of the game within the window (alpha, beta).
+
+    Args:
+        position:    Position to solve
+        alpha, beta: search window; (-1, 1) proves only win / draw / loss
+        node_budget: maximum number of nodes, or None for no limit
+
+    Returns:
+        (score, line, nodes): the final disc difference for the side to move (exact if it lies
+        inside the window, otherwise a bound on the side of the window it fell), the moves of a
+        line that reaches it as (x, y) tuples (None for a pass), and the number of nodes searched
+
+    Raises:
+        SolveBudgetExceeded if the node budget runs out first
+    """
+    solver = _Solver(node_budget)
+    own, opponent = position.own_and_opponent()
+    score, squares = solver.search(own, opponent, alpha, beta)
+    line = [None if square == -1 else divmod(square, 8) for square in squares]
+    return score, line, solver.nodes
+
+
+def solve_outcome(position, node_budget=None):
+    """
+    Prove the result of `position` with perfect play from both sides.
+
+    Returns:
+        (winner, line, nodes): winner is 1 (white), -1 (black) or 0 (draw); line and nodes as in solve()
+
+    Raises:
+        SolveBudgetExceeded if the node budget runs out first
+    """
+    score, line, nodes = solve(position, -1, 1, node_budget)
+    winner = 0 if score == 0 else position.turn if score > 0 else -position.turn
+    return winner, line, nodes
+
+
+# ── Benchmark ─────────────────────────────────────────────────────────────────
+
+def random_endgames(count, empties, seed=0):
+    """Positions with `empties` empty squares (side to move has a move) reached by random play."""
+    rng = random.Random(seed)
+    positions = []
+    while len(positions) < count:
+        position = Position.initial()
+        while position.empties() > empties and not position.is_game_over():
+            moves = position.legal_moves()
+            position = position.play(rng.choice(moves) if moves else None)
+        if position.empties() == empties and position.moves():
+            positions.append(position)
+    return positions
+
+
+def benchmark(count=20, empties=12):
+    """Nodes and seconds per win/draw/loss solve on random positions with `empties` empty squares."""
+    positions = random_endgames(count, empties, seed=9)
+    total_nodes = 0
+    start = time.perf_counter()
+    for position in positions:
+        _, _, nodes = solve_outcome(position)
+        total_nodes += nodes
+    elapsed = time.perf_counter() - start
+    print(f"{len(positions)} positions with {empties} empties: {total_nodes / len(positions):.0f} nodes, "
+          f"{elapsed / len(positions) * 1000:.1f} ms per solve, {total_nodes / elapsed:.0f} nodes/s")
+
+
+if __name__ == '__main__':
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 20, int(sys.argv[2]) if len(sys.argv) > 2 else 12)
@@ -1,6 +1,7 @@
 
 import socket, pickle
 from reversi import reversi
+from utils import read_request
 
 # The main function is only called when running in visual mode.
 def main():
@@ -14,7 +15,7 @@ def main():
         # turn : 1 --> you are playing as white | -1 --> you are playing as black
         # board : 8*8 numpy array
         data = game_socket.recv(4096)
-        turn, board = pickle.loads(data)
+        turn, board = read_request(data, game)
 
         # Turn = 0 indicates game ended
         if turn == 0:
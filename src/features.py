@@ -0,0 +1,233 @@
+import sys
+import time
+
+from position import Position, SHIFTS, FULL, _shift
+
+# Board features computed on bitboards (see position.py: bit x * 8 + y is square (x, y)).
+#
+#   stable discs   discs that can never be flipped again. Discs on the four edges can only
+#                  be flipped along their edge, so they are looked up in a table of every
+#                  edge pattern; the stable set is then grown inwards: a disc is stable when,
+#                  on each of its four lines, the line is full or a neighbour on that line is
+#                  a stable disc of the same colour.
+#   frontier       discs next to an empty square, found by shifting the empty mask in all
+#                  eight directions.
+#   parity         empty regions (8-connected) found by flood fill. In the endgame the side
+#                  that moves last in a region tends to win it, so moves into regions with an
+#                  odd number of empties are usually tried first.
+#
+# All functions take (own, opponent) bitboards; extract(board, player) returns everything at
+# once for heuristics with the usual heuristic(board, player) signature.
+#
+#     python3 src/features.py [positions]    per-feature microbenchmark
+
+ROW_0 = 0xFF
+COL_0 = 0x0101010101010101
+
+
+# ── Edge table ────────────────────────────────────────────────────────────────
+
+def _line_flips(own, opponent, square):
+    """Discs flipped along an 8-square line when `own` plays on `square`."""
+    flips = 0
+    for step in (1, -1):
+        run = 0
+        cursor = square + step
+        while 0 <= cursor < 8 and opponent >> cursor & 1:
+            run |= 1 << cursor
+            cursor += step
+        if 0 <= cursor < 8 and own >> cursor & 1:
+            flips |= run
+    return flips
+
+
+def _build_edge_table():
+    """
+    EDGE_STABLE[own << 8 | opponent] = the discs of an edge pattern that stay put whatever is
+    played on the edge afterwards. Any empty square may be taken by either colour (a move can
+    be legal through the other directions without flipping anything on the edge).
+    """
+    memo = {}
+
+    def stable(own, opponent):
+        key = own << 8 | opponent
+        if key in memo:
+            return memo[key]
+        discs = own | opponent
+        result = discs
+        empty = ~discs & 0xFF
+        square = 0
+        while empty and result:
+            if empty & 1:
+                for mover, other in ((own, opponent), (opponent, own)):
+                    flips = _line_flips(mover, other, square)
+                    after = stable(mover | flips | 1 << square, other & ~flips)
+                    result &= after & ~flips
+            empty >>= 1
+            square += 1
+        memo[key] = result
+        return result
+
+    table = [0] * (1 << 16)
+    for own in range(256):
+        for opponent in range(256):
+            if not own & opponent:
+                table[own << 8 | opponent] = stable(own, opponent)
+    return table
+
+
+EDGE_STABLE = _build_edge_table()
+
+
+def _column(bits, column):
+    """Squares (0..7, column) of a bitboard as an 8-bit line."""
+    line = 0
+    bits >>= column
+    for x in range(8):
+        line |= (bits >> (8 * x) & 1) << x
+    return line
+
+
+def _column_bits(line, column):
+    """Inverse of _column: spread an 8-bit line back onto a column of the board."""
+    bits = 0
+    for x in range(8):
+        if line >> x & 1:
+            bits |= 1 << (8 * x + column)
+    return bits
+
+
+def edge_stable(own, opponent):
+    """Stable discs (both colours) on the four edges."""
+    stable = EDGE_STABLE[(own & ROW_0) << 8 | (opponent & ROW_0)]
+    stable |= EDGE_STABLE[(own >> 56) << 8 | (opponent >> 56)] << 56
+    for column in (0, 7):
+        line = EDGE_STABLE[_column(own, column) << 8 | _column(opponent, column)]
+        stable |= _column_bits(line, column)
+    return stable
+
+
+# ── Full lines ────────────────────────────────────────────────────────────────
+
+def _build_lines():
+    # The lines of each axis: rows, columns, diagonals (x - y constant), anti-diagonals (x + y constant)
+    rows = [ROW_0 << (8 * x) for x in range(8)]
+    columns = [COL_0 << y for y in range(8)]
+    diagonals = [sum(1 << (8 * x + y) for x in range(8) for y in range(8) if x - y == d) for d in range(-7, 8)]
+    anti_diagonals = [sum(1 << (8 * x + y) for x in range(8) for y in range(8) if x + y == s) for s in range(15)]
+    return rows, columns, diagonals, anti_diagonals
+
+
+AXES = _build_lines()
+# Pairs of opposite directions in SHIFTS for each axis, in the same order as AXES
+AXIS_SHIFTS = [
+    [SHIFTS[3], SHIFTS[4]],   # (0, 1) and (0, -1): along a row
+    [SHIFTS[1], SHIFTS[6]],   # (1, 0) and (-1, 0): along a column
+    [SHIFTS[0], SHIFTS[7]],   # (1, 1) and (-1, -1)
+    [SHIFTS[2], SHIFTS[5]],   # (1, -1) and (-1, 1)
+]
+
+
+def full_lines(occupied):
+    """For each axis, the squares whose line along that axis has no empty square."""
+    return [sum(line for line in lines if occupied & line == line) for lines in AXES]
+
+
+# ── Features ──────────────────────────────────────────────────────────────────
+
+def stable_discs(own, opponent):
+    """Bitboard of the stable discs of both colours."""
+    occupied = own | opponent
+    full = full_lines(occupied)
+    stable = edge_stable(own, opponent) | (occupied & full[0] & full[1] & full[2] & full[3])
+
+    result = 0
+    for colour in (own, opponent):
+        grown = stable & colour
+        while True:
+            protected = colour
+            for axis in range(4):
+                (amount_a, mask_a), (amount_b, mask_b) = AXIS_SHIFTS[axis]
+                protected &= full[axis] | _shift(grown, amount_a, mask_a) | _shift(grown, amount_b, mask_b)
+            new = grown | protected
+            if new == grown:
+                break
+            grown = new
+        result |= grown
+    return result
+
+
+def frontier(own, opponent):
+    """(own frontier, opponent frontier): discs with at least one empty neighbour."""
+    empty = ~(own | opponent) & FULL
+    near_empty = 0
+    for amount, mask in SHIFTS:
+        near_empty |= _shift(empty, amount, mask)
+    return own & near_empty, opponent & near_empty
+
+
+def empty_regions(own, opponent):
+    """Bitboards of the 8-connected regions of empty squares."""
+    empty = ~(own | opponent) & FULL
+    regions = []
+    while empty:
+        region = empty & -empty
+        while True:
+            grown = region
+            for amount, mask in SHIFTS:
+                grown |= _shift(region, amount, mask)
+            grown &= empty
+            if grown == region:
+                break
+            region = grown
+        regions.append(region)
+        empty &= ~region
+    return regions
+
+
+def odd_regions(own, opponent):
+    """Union of the empty regions with an odd number of squares."""
+    mask = 0
+    for region in empty_regions(own, opponent):
+        if region.bit_count() & 1:
+            mask |= region
+    return mask
+
+
+def extract(board, player):
+    """All features of `board` from `player`'s point of view, as counts."""
+    position = Position.from_board(board, player)
+    own, opponent = position.own_and_opponent()
+    stable = stable_discs(own, opponent)
+    own_frontier, opponent_frontier = frontier(own, opponent)
+    regions = empty_regions(own, opponent)
+    return {
+        'stable': (stable & own).bit_count(),
+        'opponent_stable': (stable & opponent).bit_count(),
+        'frontier': own_frontier.bit_count(),
+        'opponent_frontier': opponent_frontier.bit_count(),
+        'regions': len(regions),
+        'odd_regions': sum(region.bit_count() & 1 for region in regions),
+    }
+
+
+# ── Microbenchmark ────────────────────────────────────────────────────────────
+
+def benchmark(count=300):
+    """Microseconds per call of each feature on self-play positions."""
+    from probcut import self_play_positions
+
+    positions = [Position.from_board(board, turn).own_and_opponent()
+                 for board, turn in self_play_positions(count, seed=6)]
+    for name, feature in [('edge_stable', edge_stable), ('stable_discs', stable_discs),
+                          ('frontier', frontier), ('empty_regions', empty_regions),
+                          ('odd_regions', odd_regions)]:
+        start = time.perf_counter()
+        for own, opponent in positions:
+            feature(own, opponent)
+        elapsed = time.perf_counter() - start
+        print(f"{name:<14} {elapsed / len(positions) * 1e6:8.1f} us")
+
+
+if __name__ == '__main__':
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 300)
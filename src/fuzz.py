@@ -0,0 +1,378 @@
+import os
+import sys
+import time
+import random
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from reversi import reversi
+from position import Position
+from batch_simulator import BatchSimulator
+from heuristic_functions import heuristic_nic, heuristic_nic_batch
+from utils import WEIGHT_MATRIX, CENTER_BONUS, get_legal_moves
+import batch_engine
+
+# Differential fuzzing of the fast engines against the reference rules in reversi.step.
+#
+# Games are played by the reference implementation (reversi.step, square by square) and,
+# at the same time, by every fast backend:
+#   position      Position bitboards: legal moves, flips, play(), counts, passes / game over
+#   reversi       reversi.legal_moves_with_flips, utils.get_legal_moves and the incremental
+#                 white_count / black_count kept by step()
+#   batch         batch_engine.legal_masks, flip_counts and play_moves on stacked boards
+#   heuristic     heuristic_nic and heuristic_nic_batch against the formula with the
+#                 reference's own mobility
+#   simulator     BatchSimulator replaying the same moves: boards, side to move, passes
+#                 and finished games after every ply
+# Every ply of every game is compared. Games start from the initial position or from a
+# random (usually unreachable) board, and each side follows a random or adversarial policy:
+# most flips, edges first, or the move that leaves the opponent fewest replies (which forces
+# passes). A mismatch is shrunk to a minimal position by removing discs for as long as the
+# same check still fails.
+#
+#     python3 src/fuzz.py [games] [--workers=<n>] [--seed=<s>] [--checks=position,batch,...]
+
+GAMES_PER_BATCH = 64       # games a worker plays side by side (the batched checks run on all of them)
+RANDOM_START = 0.25        # share of games started from a random board
+MAX_REPORTED = 3           # mismatches kept per check
+
+
+# ── Reference ─────────────────────────────────────────────────────────────────
+
+class Reference:
+    """
+    Everything the reference rules say about one position, computed with reversi.step only.
+
+    Attributes:
+        moves:    {(x, y): (discs flipped, board after the move, (white_count, black_count) after)}
+        replies:  number of legal moves of the other side
+    """
+
+    def __init__(self, board, turn):
+        self.board = board
+        self.turn = turn
+        self.moves = {}
+        game = reversi()
+        white, black = int((board == 1).sum()), int((board == -1).sum())
+        for x, y in zip(*np.nonzero(board == 0)):
+            x, y = int(x), int(y)
+            game.board = board.copy()
+            game.white_count, game.black_count = white, black
+            flipped = game.step(x, y, turn)
+            if flipped > 0:
+                self.moves[(x, y)] = (flipped, game.board, (game.white_count, game.black_count))
+        game.board = board
+        self.replies = sum(game.step(int(x), int(y), -turn, False) > 0 for x, y in zip(*np.nonzero(board == 0)))
+
+    def heuristic(self, player):
+        """heuristic_nic's formula, with the mobility counted by the reference."""
+        board = self.board
+        net_mask = (board == player).astype(float) - (board == -player).astype(float)
+        positional_score = float(np.sum(net_mask * WEIGHT_MATRIX))
+        player_count = int(np.sum(board == player))
+        opponent_count = int(np.sum(board == -player))
+        total_pieces = player_count + opponent_count
+        center_scale = max(0.0, (36 - total_pieces) / 32.0)
+        if center_scale > 0:
+            positional_score += center_scale * float(np.sum(net_mask * CENTER_BONUS))
+        piece_score = 100.0 * (player_count - opponent_count) / total_pieces if total_pieces > 0 else 0.0
+        own, other = (len(self.moves), self.replies) if player == self.turn else (self.replies, len(self.moves))
+        mobility_score = 100.0 * (own - other) / (own + other) if own + other != 0 else 0.0
+        if total_pieces > 52:
+            return positional_score + 3.0 * piece_score + mobility_score
+        return 2.0 * positional_score + piece_score + 2.0 * mobility_score
+
+
+# ── Checks ────────────────────────────────────────────────────────────────────
+# Each check takes a list of Reference objects and returns [(index, description)] of the
+# positions where the backend disagrees. They work on any number of positions, so the
+# harness runs them on a whole ply of games and the shrinker on a single position.
+
+def check_position(refs):
+    failures = []
+    for index, ref in enumerate(refs):
+        position = Position.from_board(ref.board, ref.turn)
+        moves = {(x, y): (count, mask) for x, y, count, mask in position.moves_with_flips()}
+        if set(moves) != set(ref.moves) or position.legal_moves() != sorted(ref.moves):
+            failures.append((index, f'legal moves {sorted(moves)} != {sorted(ref.moves)}'))
+            continue
+        for move, (flipped, after, counts) in ref.moves.items():
+            count, mask = moves[move]
+            child = position.play(move)
+            if count != flipped or mask.bit_count() != flipped:
+                failures.append((index, f'{move} flips {count} (mask {mask.bit_count()}) != {flipped}'))
+            elif not np.array_equal(child.board(), after) or (child.count(1), child.count(-1)) != counts:
+                failures.append((index, f'{move} board after the move differs'))
+            elif child.turn != -ref.turn:
+                failures.append((index, f'{move} side to move after the move is {child.turn}'))
+            else:
+                continue
+            break
+        if position.mobility(-ref.turn) != ref.replies:
+            failures.append((index, f'opponent mobility {position.mobility(-ref.turn)} != {ref.replies}'))
+        if position.is_game_over() != (not ref.moves and not ref.replies):
+            failures.append((index, f'is_game_over {position.is_game_over()} with {len(ref.moves)} / {ref.replies} moves'))
+    return failures
+
+
+def check_reversi(refs):
+    failures = []
+    game = reversi()
+    for index, ref in enumerate(refs):
+        game.board = ref.board.copy()
+        listed = [(x, y, count) for x, y, count, _ in game.legal_moves_with_flips(ref.turn)]
+        expected = [(x, y, ref.moves[(x, y)][0]) for x, y in sorted(ref.moves)]
+        if listed != expected:
+            failures.append((index, f'legal_moves_with_flips {listed} != {expected}'))
+        elif get_legal_moves(game, ref.turn) != sorted(ref.moves):
+            failures.append((index, 'get_legal_moves differs'))
+        else:
+            for move, (_, after, counts) in ref.moves.items():
+                if counts != (int((after == 1).sum()), int((after == -1).sum())):
+                    failures.append((index, f'{move} incremental counts {counts} do not match the board'))
+                    break
+    return failures
+
+
+def check_batch(refs):
+    failures = []
+    boards = np.stack([ref.board for ref in refs])
+    turns = np.array([ref.turn for ref in refs])
+    legal = batch_engine.legal_masks(boards, turns)
+    counts = batch_engine.flip_counts(boards, turns)
+
+    # Every legal move of every position played in one play_moves call
+    jobs = [(index, move) for index, ref in enumerate(refs) for move in ref.moves]
+    if jobs:
+        played = np.array([refs[index].board for index, _ in jobs], dtype=np.int8)
+        flipped = batch_engine.play_moves(played, np.array([refs[index].turn for index, _ in jobs]),
+                                          np.array([x * 8 + y for _, (x, y) in jobs]))
+
+    bad = set()
+    for index, ref in enumerate(refs):
+        expected = np.zeros(64, dtype=np.int64)
+        for (x, y), (flips, _, _) in ref.moves.items():
+            expected[x * 8 + y] = flips
+        if not np.array_equal(legal[index], expected > 0):
+            failures.append((index, f'legal_masks {np.flatnonzero(legal[index]).tolist()} != '
+                                    f'{np.flatnonzero(expected).tolist()}'))
+            bad.add(index)
+        elif not np.array_equal(counts[index], expected):
+            failures.append((index, 'flip_counts differ'))
+            bad.add(index)
+    for job, (index, move) in enumerate(jobs):
+        if index in bad:
+            continue
+        flips, after, _ = refs[index].moves[move]
+        if flipped[job] != flips or not np.array_equal(played[job], after):
+            failures.append((index, f'play_moves {move} differs'))
+            bad.add(index)
+    return failures
+
+
+def check_heuristic(refs):
+    failures = []
+    boards = np.stack([ref.board for ref in refs])
+    for player in (1, -1):
+        batched = heuristic_nic_batch(boards, player)
+        for index, ref in enumerate(refs):
+            expected = ref.heuristic(player)
+            single = heuristic_nic(ref.board, player)
+            if single != expected:
+                failures.append((index, f'heuristic_nic({player}) {single} != {expected}'))
+            elif batched[index] != expected:
+                failures.append((index, f'heuristic_nic_batch({player}) {batched[index]} != {expected}'))
+    return failures
+
+
+def check_simulator(refs, squares=None):
+    """
+    One BatchSimulator step from each position, playing `squares` (default: each position's
+    first legal move), against the reference after the same move or pass.
+    """
+    if squares is None:
+        squares = [min(ref.moves)[0] * 8 + min(ref.moves)[1] if ref.moves else -1 for ref in refs]
+    simulator = BatchSimulator(boards=np.stack([ref.board for ref in refs]), pieces=[ref.turn for ref in refs])
+    simulator.step(lambda boards, pieces, legal: np.array([max(square, 0) for square in squares]))
+
+    failures = []
+    for index, (ref, square) in enumerate(zip(refs, squares)):
+        move = divmod(square, 8) if square >= 0 else None
+        after = ref.moves[move][1] if move in ref.moves else ref.board
+        if not np.array_equal(simulator.boards[index], after):
+            failures.append((index, f'board after {move} differs'))
+        elif simulator.pieces[index] != -ref.turn:
+            failures.append((index, f'side to move after {move} is {simulator.pieces[index]}'))
+        elif simulator.passes[index] != (0 if move in ref.moves else 1):
+            failures.append((index, f'pass count {simulator.passes[index]} after {move}'))
+    return failures
+
+
+CHECKS = {
+    'position': check_position,
+    'reversi': check_reversi,
+    'batch': check_batch,
+    'heuristic': check_heuristic,
+    'simulator': check_simulator,
+}
+
+
+# ── Shrinking ─────────────────────────────────────────────────────────────────
+
+def shrink(board, turn, check):
+    """
+    Remove discs from a failing position for as long as `check` still fails on it.
+
+    Returns:
+        (smallest failing board found, its failure description)
+    """
+    board = np.array(board, dtype=float)
+    failure = CHECKS[check]([Reference(board, turn)])[0][1]
+    progress = True
+    while progress:
+        progress = False
+        for x, y in zip(*np.nonzero(board)):
+            candidate = board.copy()
+            candidate[x, y] = 0
+            failures = CHECKS[check]([Reference(candidate, turn)])
+            if failures:
+                board, failure = candidate, failures[0][1]
+                progress = True
+    return board, failure
+
+
+# ── Games ─────────────────────────────────────────────────────────────────────
+
+def _choose(ref, policy, rng):
+    """Move (x, y) picked by `policy` from the reference's legal moves."""
+    moves = sorted(ref.moves)
+    if policy == 'random':
+        return rng.choice(moves)
+    if policy == 'max_flips':
+        return max(moves, key=lambda move: (ref.moves[move][0], rng.random()))
+    if policy == 'edges':
+        return max(moves, key=lambda move: (move[0] in (0, 7) or move[1] in (0, 7), rng.random()))
+    # 'starve': leave the opponent as few replies as possible (counted with Position for speed;
+    # the policy only picks among the reference's moves, so it cannot hide a mismatch)
+    return min(moves, key=lambda move: (Position.from_board(ref.moves[move][1], -ref.turn).mobility(),
+                                         rng.random()))
+
+
+POLICIES = ['random', 'max_flips', 'edges', 'starve']
+
+
+def random_board(rng):
+    """A random board, usually not reachable in a real game."""
+    fill = rng.uniform(0.2, 0.95)
+    board = np.zeros((8, 8))
+    for x in range(8):
+        for y in range(8):
+            if rng.random() < fill:
+                board[x, y] = rng.choice((1, -1))
+    return board
+
+
+def fuzz_games(job):
+    """
+    Play `games` games in batches of GAMES_PER_BATCH, comparing every backend at every ply.
+    Runs in a worker process.
+
+    Returns:
+        dict with the number of games, plies and positions checked, and the shrunk mismatches
+        as (check, board, turn, description)
+    """
+    seed, games, checks = job
+    rng = random.Random(seed)
+    stats = {'games': 0, 'plies': 0, 'positions': 0, 'mismatches': []}
+    found = {check: 0 for check in checks}
+
+    def report(check, ref, failure):
+        if found[check] < MAX_REPORTED:
+            found[check] += 1
+            board, description = shrink(ref.board, ref.turn, check)
+            stats['mismatches'].append((check, board.astype(int).tolist(), ref.turn, description))
+
+    while stats['games'] < games:
+        count = min(GAMES_PER_BATCH, games - stats['games'])
+        boards = [random_board(rng) if rng.random() < RANDOM_START else reversi().board for _ in range(count)]
+        turns = [rng.choice((1, -1)) for _ in range(count)]
+        policies = [{1: rng.choice(POLICIES), -1: rng.choice(POLICIES)} for _ in range(count)]
+        passes = [0] * count
+        simulator = BatchSimulator(boards=np.stack(boards), pieces=turns)
+
+        while True:
+            active = [game for game in range(count) if passes[game] < 2]
+            if not active:
+                break
+            refs = [Reference(boards[game], turns[game]) for game in active]
+            stats['positions'] += len(refs)
+            for check in checks:
+                if check == 'simulator':
+                    continue
+                for index, failure in CHECKS[check](refs):
+                    report(check, refs[index], failure)
+
+            moves = [_choose(ref, policies[game][ref.turn], rng) if ref.moves else None
+                     for game, ref in zip(active, refs)]
+            squares = np.full(count, -1)
+            for game, move in zip(active, moves):
+                if move is not None:
+                    squares[game] = move[0] * 8 + move[1]
+            simulator.step(lambda b, p, legal: squares[active], np.array(active))
+
+            for game, ref, move in zip(active, refs, moves):
+                if move is None:
+                    passes[game] += 1
+                else:
+                    passes[game] = 0
+                    boards[game] = ref.moves[move][1]
+                turns[game] = -turns[game]
+                if 'simulator' in checks and (not np.array_equal(simulator.boards[game], boards[game])
+                                              or simulator.pieces[game] != turns[game]
+                                              or simulator.done[game] != (passes[game] >= 2)):
+                    failures = check_simulator([ref], [-1 if move is None else move[0] * 8 + move[1]])
+                    report('simulator', ref, failures[0][1] if failures else 'state differs after the game went on')
+            stats['plies'] += 1
+        stats['games'] += count
+    return stats
+
+
+def run(games=2000, workers=None, seed=0, checks=None):
+    """Fuzz `games` games across worker processes and print throughput and mismatches."""
+    checks = checks or list(CHECKS)
+    workers = workers or os.cpu_count() or 1
+    # Small jobs keep every worker busy until the end
+    job_size = max(GAMES_PER_BATCH, min(4 * GAMES_PER_BATCH, games // (4 * workers) or 1))
+    jobs = [(seed * 1000003 + index, min(job_size, games - start), checks)
+            for index, start in enumerate(range(0, games, job_size))]
+
+    totals = {'games': 0, 'plies': 0, 'positions': 0}
+    mismatches = []
+    start = time.time()
+    with ProcessPoolExecutor(workers) as pool:
+        for future in as_completed([pool.submit(fuzz_games, job) for job in jobs]):
+            stats = future.result()
+            for key in totals:
+                totals[key] += stats[key]
+            mismatches.extend(stats['mismatches'])
+    elapsed = time.time() - start
+
+    print(f"{totals['games']} games, {totals['positions']} positions checked against reversi.step "
+          f"in {elapsed:.1f}s ({totals['games'] / elapsed:.0f} games/s, {workers} workers)")
+    print(f"checks: {', '.join(checks)}")
+    if not mismatches:
+        print("no mismatches")
+        return 0
+    for check, board, turn, description in mismatches:
+        print(f"\nMISMATCH [{check}] {description}\n  turn {turn}, board (1 = white, -1 = black):")
+        for row in board:
+            print('   ' + ' '.join(f'{v:2d}' for v in row))
+    return 1
+
+
+if __name__ == '__main__':
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    options = dict(arg[2:].split('=', 1) for arg in sys.argv[1:] if arg.startswith('--') and '=' in arg)
+    sys.exit(run(int(args[0]) if args else 2000, int(options['workers']) if 'workers' in options else None,
+                 int(options.get('seed', 0)), options['checks'].split(',') if 'checks' in options else None))
@@ -2,6 +2,7 @@
 
 import socket, pickle
 from reversi import reversi
+from utils import read_request
 
 def main():
     game_socket = socket.socket()
@@ -14,7 +15,7 @@ def main():
         #turn : 1 --> you are playing as white | -1 --> you are playing as black
         #board : 8*8 numpy array
         data = game_socket.recv(4096)
-        turn, board = pickle.loads(data)
+        turn, board = read_request(data, game)
 
         #Turn = 0 indicates game ended
         if turn == 0:
@@ -34,17 +35,10 @@ def choose_move(turn, board, game) -> list[int]:
     # Local Greedy - Replace with your algorithm
     x = -1
     y = -1
-    max = 0
     game.board = board
-    best_move_list = []
 
-    for i in range(8):
-        for j in range(8):
-            cur = game.step(i, j, turn, False)
-            # any move that leads to a flipped piece is stored in the list
-            if cur > 0:
-                # add tuple to move list where: cur=#of flipped tiles, i=x, j=y
-                best_move_list.append((cur, i, j))
+    # every legal move with its number of flipped tiles: (cur=#of flipped tiles, i=x, j=y)
+    best_move_list = [(cur, i, j) for i, j, cur, _ in game.legal_moves_with_flips(turn)]
 
     # no moves were found
     if len(best_move_list) == 0:
@@ -2,6 +2,7 @@
 
 import socket, pickle
 from reversi import reversi
+from utils import read_request
 
 def main():
     game_socket = socket.socket()
@@ -14,7 +15,7 @@ def main():
         #turn : 1 --> you are playing as white | -1 --> you are playing as black
         #board : 8*8 numpy array
         data = game_socket.recv(4096)
-        turn, board = pickle.loads(data)
+        turn, board = read_request(data, game)
 
         #Turn = 0 indicates game ended
         if turn == 0:
@@ -34,14 +35,11 @@ def choose_move(turn, board, game) -> list[int]:
     # Local Greedy - Replace with your algorithm
     x = -1
     y = -1
-    max = 0
     game.board = board
-    for i in range(8):
-        for j in range(8):
-            cur = game.step(i, j, turn, False)
-            if cur > max:
-                max = cur
-                x, y = i, j
+    moves = game.legal_moves_with_flips(turn)
+    if moves:
+        # First of the moves flipping the most discs, same as scanning the squares in order
+        x, y, _, _ = max(moves, key=lambda move: move[2])
 
     return [x, y]
 
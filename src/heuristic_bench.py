@@ -0,0 +1,211 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+
+import numpy as np
+
+from position import Position, stack_boards
+from utils import WEIGHT_MATRIX
+from heuristic_functions import HEURISTICS, BATCHED, get_heuristic
+from endgame import solve
+
+# Speed and quality of the registered heuristics (heuristic_functions.HEURISTICS).
+#
+# Under a time limit a heuristic is only as good as its accuracy per unit of time: a slower
+# one searches less deep. This harness measures both sides on a fixed corpus of self-play
+# positions (the same seed gives the same corpus), before any match is played:
+#
+#   speed     evaluations per second, one call per position and (if the heuristic has one)
+#             through its batched version
+#   deep      rank correlation of the static value with a depth-`depth` search of the
+#             position (by the reference heuristic, so it favours that one a little), and
+#             how often the heuristic's one-ply choice is the deep search's best move
+#   result    how often the sign of the value predicts who won the self-play game
+#   exact     rank correlation with, and sign accuracy on, the exact final disc difference
+#             of positions with at most EXACT_EMPTIES empties (endgame solver)
+#
+# Labels are expensive, so the corpus and its labels are cached in LABEL_DIR.
+#
+#     python3 src/heuristic_bench.py [--positions=300] [--depth=4] [--reference=nic] [--heuristics=nic,stability]
+
+EXACT_EMPTIES = 12
+RANDOM_MOVE_RATE = 0.3    # self-play policy: greedy by square weight, random this often
+SAMPLE_RATE = 0.15        # fraction of the positions of a game put in the corpus
+LABEL_DIR = 'heuristic_bench'
+
+
+# ── Corpus and labels ─────────────────────────────────────────────────────────
+
+def self_play_corpus(count, seed=0):
+    """
+    Positions from self-play games, each with the final disc difference of its game from the
+    side to move's point of view. Only positions where the side to move has a move are kept.
+    """
+    rng = random.Random(seed)
+    corpus = []
+    while len(corpus) < count:
+        position = Position.initial()
+        sampled = []
+        while not position.is_game_over():
+            moves = position.legal_moves()
+            if not moves:
+                position = position.play(None)
+                continue
+            if rng.random() < SAMPLE_RATE:
+                sampled.append(position)
+            if rng.random() < RANDOM_MOVE_RATE:
+                move = rng.choice(moves)
+            else:
+                move = max(moves, key=lambda m: WEIGHT_MATRIX[m[0], m[1]])
+            position = position.play(move)
+        difference = position.count(1) - position.count(-1)
+        corpus.extend((p, difference * p.turn) for p in sampled)
+    return corpus[:count]
+
+
+def label_corpus(count, seed, depth, reference):
+    """
+    The corpus with its labels, from the cache file if it was labelled before.
+
+    Returns:
+        list of dicts: position, result (final disc difference of the game), deep (score of a
+        depth-`depth` search by `reference`, None if decided), deep_move, exact (solved final
+        disc difference, None above EXACT_EMPTIES empties)
+    """
+    path = os.path.join(LABEL_DIR, f'labels_{count}_{seed}_{depth}_{reference}.json')
+    if os.path.exists(path):
+        with open(path) as f:
+            return [dict(item, position=Position(*item['position']), deep_move=tuple(item['deep_move']))
+                    for item in json.load(f)]
+
+    import probcut
+    import minimax_alpha_beta_h_nic as search
+    probcut.USE_PROBCUT = False   # label with plain full-width search
+    heuristic = get_heuristic(reference)
+
+    labelled = []
+    start = time.time()
+    for index, (position, result) in enumerate(self_play_corpus(count, seed)):
+        score, move = search.minimax(position, depth, float('-inf'), float('inf'), True, position.turn,
+                                     float('inf'), heuristic)
+        exact = None
+        if position.empties() <= EXACT_EMPTIES:
+            exact, _, _ = solve(position)
+        labelled.append({'position': position, 'result': result,
+                         'deep': score if abs(score) < probcut.DECIDED_SCORE else None,
+                         'deep_move': tuple(move), 'exact': exact})
+        print(f'  labelling {index + 1}/{count}, {time.time() - start:.0f}s', end='\r', file=sys.stderr)
+    print(file=sys.stderr)
+
+    os.makedirs(LABEL_DIR, exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump([dict(item, position=list(item['position'].key())) for item in labelled], f)
+    return labelled
+
+
+# ── Measurements ──────────────────────────────────────────────────────────────
+
+def rank_correlation(a, b):
+    """Spearman rank correlation (ties broken by order, which is fine for continuous scores)."""
+    if len(a) < 3:
+        return float('nan')
+    rank_a = np.argsort(np.argsort(a))
+    rank_b = np.argsort(np.argsort(b))
+    return float(np.corrcoef(rank_a, rank_b)[0, 1])
+
+
+def sign_accuracy(values, labels):
+    """Fraction of decided labels (not draws) whose sign the value gets right."""
+    pairs = [(v, l) for v, l in zip(values, labels) if l != 0]
+    if not pairs:
+        return float('nan')
+    return sum((v > 0) == (l > 0) for v, l in pairs) / len(pairs)
+
+
+def evaluations_per_second(heuristic, items, seconds=1.0):
+    """Single-call evaluations per second over the corpus, repeated for at least `seconds`."""
+    boards = [(item['position'].board(), item['position'].turn) for item in items]
+    count = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        for board, turn in boards:
+            heuristic(board, turn)
+        count += len(boards)
+    return count / (time.perf_counter() - start)
+
+
+def batch_evaluations_per_second(batch_heuristic, items, seconds=1.0):
+    """Evaluations per second through the batched heuristic, one call per side to move."""
+    groups = [[item['position'] for item in items if item['position'].turn == turn] for turn in (1, -1)]
+    stacks = [(stack_boards(group), turn) for group, turn in zip(groups, (1, -1)) if group]
+    count = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        for boards, turn in stacks:
+            batch_heuristic(boards, turn)
+            count += len(boards)
+    return count / (time.perf_counter() - start)
+
+
+def one_ply_move(heuristic, position):
+    """The move whose resulting position `heuristic` scores best for the side to move."""
+    return max(position.legal_moves(), key=lambda move: heuristic(position.play(move).board(), position.turn))
+
+
+def measure(name, items):
+    """Speed and quality figures of the heuristic registered as `name` on the labelled corpus."""
+    heuristic = get_heuristic(name)
+    values = [heuristic(item['position'].board(), item['position'].turn) for item in items]
+    deep = [(v, item['deep']) for v, item in zip(values, items) if item['deep'] is not None]
+    exact = [(v, item['exact']) for v, item in zip(values, items) if item['exact'] is not None]
+    batch = BATCHED.get(heuristic)
+    return {
+        'name': name,
+        'evals_per_sec': evaluations_per_second(heuristic, items),
+        'batch_evals_per_sec': batch_evaluations_per_second(batch, items) if batch is not None else None,
+        'deep_correlation': rank_correlation(*zip(*deep)) if deep else float('nan'),
+        'move_agreement': sum(one_ply_move(heuristic, item['position']) == item['deep_move']
+                              for item in items) / len(items),
+        'result_accuracy': sign_accuracy(values, [item['result'] for item in items]),
+        'exact_correlation': rank_correlation(*zip(*exact)) if exact else float('nan'),
+        'exact_accuracy': sign_accuracy(*zip(*exact)) if exact else float('nan'),
+        'exact_positions': len(exact),
+    }
+
+
+def format_results(results):
+    lines = [f"{'heuristic':<12} {'evals/s':>9} {'batch/s':>9} {'deep rho':>9} {'best move':>9} "
+             f"{'result':>7} {'exact rho':>9} {'exact':>7}"]
+    for r in results:
+        batch = f"{r['batch_evals_per_sec']:>9.0f}" if r['batch_evals_per_sec'] is not None else f"{'-':>9}"
+        lines.append(f"{r['name']:<12} {r['evals_per_sec']:>9.0f} {batch} {r['deep_correlation']:>9.3f} "
+                     f"{r['move_agreement']:>9.1%} {r['result_accuracy']:>7.1%} {r['exact_correlation']:>9.3f} "
+                     f"{r['exact_accuracy']:>7.1%}")
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Speed and prediction quality of the registered heuristics.')
+    parser.add_argument('--positions', type=int, default=300, help='corpus size')
+    parser.add_argument('--seed', type=int, default=0, help='corpus seed')
+    parser.add_argument('--depth', type=int, default=4, help='depth of the deep-search labels')
+    parser.add_argument('--reference', default='nic', help='heuristic used by the deep-search labels')
+    parser.add_argument('--heuristics', default=','.join(HEURISTICS), help='comma separated names')
+    args = parser.parse_args()
+
+    items = label_corpus(args.positions, args.seed, args.depth, args.reference)
+    exact = sum(item['exact'] is not None for item in items)
+    print(f"{len(items)} positions (seed {args.seed}), deep labels: depth {args.depth} by {args.reference}, "
+          f"{exact} positions solved exactly (<= {EXACT_EMPTIES} empties)\n")
+    print(format_results([measure(name, items) for name in args.heuristics.split(',')]))
+    print("\nevals/s and batch/s: evaluations per second; deep rho: rank correlation with the deep search;\n"
+          "best move: one-ply choice equals the deep search's move; result: sign predicts the game's winner;\n"
+          "exact rho / exact: rank correlation and sign accuracy against the solved endgame score.")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
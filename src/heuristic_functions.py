@@ -1,8 +1,12 @@
 import numpy as np
-from reversi import reversi
-from utils import get_legal_moves, WEIGHT_MATRIX, CENTER_BONUS
+from utils import WEIGHT_MATRIX, CENTER_BONUS
+from position import Position
+import features
+import batch_engine
+from profiling import timed
 
 
+@timed('heuristic')
 def heuristic_nic(board, player):
     """
     Evaluates the board from the perspective of `player`.
@@ -38,11 +42,9 @@ def heuristic_nic(board, player):
         piece_score = 0.0
 
     # Mobility: number of legal moves available to each side
-    game = reversi()
-    game.board = board.copy()
-    player_moves = len(get_legal_moves(game, player))
-    game.board = board.copy()
-    opponent_moves = len(get_legal_moves(game, opponent))
+    position = Position.from_board(board, player)
+    player_moves = position.mobility(player)
+    opponent_moves = position.mobility(opponent)
     if player_moves + opponent_moves != 0:
         mobility_score = 100.0 * (player_moves - opponent_moves) / (player_moves + opponent_moves)
     else:
@@ -54,4 +56,98 @@ def heuristic_nic(board, player):
         return positional_score + 3.0 * piece_score + mobility_score
     else:
         # Early/mid game: position and mobility matter more
-        return 2.0 * positional_score + piece_score + 2.0 * mobility_score
\ No newline at end of file
+        return 2.0 * positional_score + piece_score + 2.0 * mobility_score
+
+
+@timed('heuristic')
+def heuristic_stability(board, player):
+    """
+    heuristic_nic plus two features it can only see through deeper search (features.py):
+      5. Stable discs  - discs that can never be flipped again, each worth about an edge square
+      6. Frontier      - discs next to empty squares give the opponent moves, fewer is better
+    """
+    score = heuristic_nic(board, player)
+    f = features.extract(board, player)
+
+    stability_score = 10.0 * (f['stable'] - f['opponent_stable'])
+    frontier_total = f['frontier'] + f['opponent_frontier']
+    if frontier_total != 0:
+        frontier_score = -100.0 * (f['frontier'] - f['opponent_frontier']) / frontier_total
+    else:
+        frontier_score = 0.0
+
+    return score + stability_score + frontier_score
+
+
+# ── Batched heuristics ────────────────────────────────────────────────────────
+
+# Columns: the weight matrix and the center bonus, one row per square
+_POSITIONAL_WEIGHTS = np.stack([WEIGHT_MATRIX.ravel(), CENTER_BONUS.ravel()], axis=1).astype(float)
+
+
+@timed('heuristic_batch')
+def heuristic_nic_batch(boards, player):
+    """
+    heuristic_nic for a stack of boards at once.
+
+    Args:
+        boards: (N, 8, 8) array of boards
+        player: piece the boards are scored for
+
+    Returns:
+        (N,) array with the same scores heuristic_nic gives each board
+    """
+    boards = np.asarray(boards)
+    n = len(boards)
+    own_mask = (boards == player).reshape(n, 64)
+    opponent_mask = (boards == -player).reshape(n, 64)
+    net_mask = own_mask.astype(float) - opponent_mask.astype(float)
+
+    # Weight matrix and center bonus sums of every board in one matrix product
+    positional_score, center_score = (net_mask @ _POSITIONAL_WEIGHTS).T
+
+    player_count = own_mask.sum(axis=1)
+    opponent_count = opponent_mask.sum(axis=1)
+    total_pieces = player_count + opponent_count
+
+    center_scale = np.maximum(0.0, (36 - total_pieces) / 32.0)
+    positional_score = positional_score + center_scale * center_score
+
+    piece_score = 100.0 * (player_count - opponent_count) / np.maximum(total_pieces, 1)
+
+    # Mobility of both sides in one call of the vectorized move generator
+    own = np.packbits(own_mask, axis=1, bitorder='little').view('<u8')[:, 0]
+    opp = np.packbits(opponent_mask, axis=1, bitorder='little').view('<u8')[:, 0]
+    moves = np.bitwise_count(batch_engine.move_bitboards(np.concatenate([own, opp]), np.concatenate([opp, own])))
+    player_moves = moves[:n].astype(np.int64)
+    opponent_moves = moves[n:].astype(np.int64)
+    moves_total = player_moves + opponent_moves
+    mobility_score = np.where(moves_total != 0,
+                              100.0 * (player_moves - opponent_moves) / np.maximum(moves_total, 1), 0.0)
+
+    return np.where(total_pieces > 52,
+                    positional_score + 3.0 * piece_score + mobility_score,
+                    2.0 * positional_score + piece_score + 2.0 * mobility_score)
+
+# Batched version of each heuristic that has one; minimax scores the children of its
+# depth-1 nodes with a single call to it (see minimax_alpha_beta_h_nic.USE_BATCH_LEAVES)
+BATCHED = {
+    heuristic_nic: heuristic_nic_batch,
+}
+
+
+# ── Registry ──────────────────────────────────────────────────────────────────
+
+# Heuristics by name, for selecting one by configuration (REVERSI_HEURISTIC, see
+# minimax_alpha_beta_h_nic) and for comparing them (heuristic_bench.py)
+HEURISTICS = {
+    'nic': heuristic_nic,
+    'stability': heuristic_stability,
+}
+
+
+def get_heuristic(name):
+    """Return the heuristic registered as `name`."""
+    if name not in HEURISTICS:
+        raise ValueError(f"unknown heuristic {name!r}, expected one of: {', '.join(HEURISTICS)}")
+    return HEURISTICS[name]
@@ -0,0 +1,244 @@
+import os
+import sys
+import time
+import queue
+import struct
+import atexit
+import multiprocessing as mp
+from multiprocessing import shared_memory
+import numpy as np
+
+from position import Position
+from position_cache import encode_move, decode_move
+from utils import set_stop_flag, stop_requested
+
+# Lazy SMP
+#
+# Several worker processes run the normal iterative-deepening minimax on the same root.
+# They do not split the tree between them; instead they share one transposition table,
+# so whatever one worker finds (bounds, best moves) speeds up the others, and staggered
+# starting depths keep them from all searching the exact same nodes at the same time.
+# The main process just waits for the deadline and returns the deepest completed result.
+#
+# The table lives in multiprocessing.shared_memory and is written without locks. Each
+# slot stores its key, its data and  key ^ data  as a checksum, so a slot that was torn
+# by two processes writing it at once fails the check and is treated as a miss.
+
+DEFAULT_TABLE_SLOTS = 1 << 20   # 40 MB
+SLOT_WORDS = 5                  # white, black, data, score bits, checksum
+STAGGER = 3                     # worker i starts iterative deepening at depth 1 + i % STAGGER
+RESULT_MARGIN = 0.05            # seconds kept back from the time limit to collect results
+STOP_POLL = 0.02                # seconds between checks for a stop request while waiting
+
+
+def _score_bits(score):
+    return struct.unpack('<Q', struct.pack('<d', score))[0]
+
+
+def _bits_score(bits):
+    return struct.unpack('<d', struct.pack('<Q', bits))[0]
+
+
+class SharedTranspositionTable:
+    """
+    Lock-free transposition table in shared memory, with the same probe/store interface
+    as position_cache.PositionStore so minimax can use either.
+
+    Args:
+        slots:   number of entries (created by the main process)
+        name:    name of an existing shared memory block to attach to (worker processes)
+    """
+
+    def __init__(self, slots=DEFAULT_TABLE_SLOTS, name=None):
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=slots * SLOT_WORDS * 8)
+            self.owner = True
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+            self.owner = False
+        self.table = np.ndarray((self.shm.size // (SLOT_WORDS * 8), SLOT_WORDS),
+                                dtype=np.uint64, buffer=self.shm.buf)
+        if self.owner:
+            self.table[:] = 0
+        self.slots = self.table.shape[0]
+        self.torn = 0
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def _index(self, key):
+        white, black, side = key
+        return (white ^ (black * 0x9E3779B97F4A7C15) ^ (side & 0xFF)) % self.slots
+
+    def probe(self, key):
+        white, black, side = key
+        slot_white, slot_black, data, score_bits, check = self.table[self._index(key)].tolist()
+        if slot_white ^ slot_black ^ data ^ score_bits != check:
+            self.torn += 1
+            return None
+        if slot_white != white or slot_black != black or (data >> 24) - 1 != side:
+            return None
+        return data & 0xFF, (data >> 8) & 0xFF, _bits_score(score_bits), decode_move((data >> 16) & 0xFF)
+
+    def store(self, key, depth, flag, score, move):
+        white, black, side = key
+        index = self._index(key)
+        slot = self.table[index]
+        # Keep a deeper result for the same position; anything else is replaced
+        if int(slot[0]) == white and int(slot[1]) == black and (int(slot[2]) >> 24) - 1 == side \
+                and int(slot[2]) & 0xFF > depth:
+            return
+        data = depth | (flag << 8) | (encode_move(move) << 16) | ((side + 1) << 24)
+        score_bits = _score_bits(float(score))
+        self.table[index] = (white, black, data, score_bits, white ^ black ^ data ^ score_bits)
+
+    def clear(self):
+        self.table[:] = 0
+
+    def close(self):
+        del self.table
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+def _worker(index, table_name, jobs, results, stop):
+    """Worker process: iterative deepening on every root it is sent, reporting each completed depth."""
+    import minimax_alpha_beta_h_nic as search
+
+    # The main process sets the stop flag once it has its answer, so the search ends early
+    set_stop_flag(stop)
+    table = SharedTranspositionTable(name=table_name)
+    while True:
+        job = jobs.get()
+        if job is None:
+            table.close()
+            return
+        job_id, position, deadline = job
+
+        # The limits are checked as soon as the new search starts, not when it has passed the last one's node count
+        search.node_count = 0
+        search._next_check = 0
+        start = time.time()
+        for depth in range(1 + index % STAGGER, search.MAX_DEPTH + 1):
+            try:
+                score, move = search.minimax(position, depth, float('-inf'), float('inf'),
+                                             True, position.turn, deadline, search.CHOSEN_HEURISTIC, table)
+            except search.TimeUp:
+                break
+            results.put(('depth', job_id, index, depth, move, score, search.node_count, time.time() - start))
+        results.put(('done', job_id, index, search.node_count))
+
+
+class LazySMPSearch:
+    """
+    Pool of long-lived search processes sharing one transposition table.
+
+    The pool is started once and reused for every move; the table is kept between moves
+    too, since the positions searched on consecutive moves overlap.
+    """
+
+    def __init__(self, processes, table_slots=DEFAULT_TABLE_SLOTS):
+        self.processes = processes
+        self.table = SharedTranspositionTable(table_slots)
+        self.results = mp.Queue()
+        self.stop = mp.Value('b', 0, lock=False)
+        self.jobs = []
+        self.workers = []
+        for index in range(processes):
+            jobs = mp.Queue()
+            worker = mp.Process(target=_worker, args=(index, self.table.name, jobs, self.results, self.stop), daemon=True)
+            worker.start()
+            self.jobs.append(jobs)
+            self.workers.append(worker)
+        self.job_id = 0
+        atexit.register(self.close)
+
+    def search(self, board, player, time_limit, wait_for_workers=False):
+        """
+        Search `board` for `player` until the time limit.
+
+        Returns:
+            dict with the deepest completed 'move', its 'depth' and 'score', the time each depth
+            was first completed ('depth_times'), and if wait_for_workers is set, the total 'nodes'.
+        """
+        self.job_id += 1
+        self.stop.value = 0
+        deadline = time.time() + time_limit - RESULT_MARGIN
+        position = Position.from_board(board, player)
+        for jobs in self.jobs:
+            jobs.put((self.job_id, position, deadline))
+
+        best = {'move': None, 'depth': 0, 'score': None, 'depth_times': {}, 'nodes': 0}
+        done = 0
+        while done < self.processes:
+            timeout = deadline + RESULT_MARGIN - time.time()
+            if (timeout <= 0 and not wait_for_workers) or (stop_requested() and best['move'] is not None):
+                break
+            try:
+                # Short waits, so a stop request is noticed quickly
+                message = self.results.get(timeout=min(max(timeout, RESULT_MARGIN), STOP_POLL))
+            except queue.Empty:
+                if timeout > 0 or (wait_for_workers and all(worker.is_alive() for worker in self.workers)):
+                    continue
+                break
+            if message[1] != self.job_id:
+                continue  # late report from the previous move
+            if message[0] == 'done':
+                done += 1
+                best['nodes'] += message[3]
+                continue
+            _, _, _, depth, move, score, _, elapsed = message
+            best['depth_times'].setdefault(depth, elapsed)
+            if depth > best['depth']:
+                best.update(move=move, depth=depth, score=score)
+        self.stop.value = 1
+        return best
+
+    def close(self):
+        if not self.workers:
+            return
+        for jobs in self.jobs:
+            jobs.put(None)
+        for worker in self.workers:
+            worker.join(timeout=5)
+        self.workers = []
+        self.table.close()
+
+
+# ── Scaling report ────────────────────────────────────────────────────────────
+
+def scaling_report(process_counts=(1, 2, 4, 8, 16), positions=8, time_limit=2.0):
+    """Print nodes per second and time-to-depth for each number of search processes."""
+    from probcut import self_play_positions
+
+    boards = self_play_positions(positions, seed=2)
+    print(f"Lazy SMP scaling: {positions} positions, {time_limit}s per search, {os.cpu_count()} CPUs\n")
+    print(f"{'procs':>5} {'NPS':>10} {'speedup':>8} {'depth':>6}   time to depth (s)")
+
+    base_nps = None
+    for processes in process_counts:
+        smp = LazySMPSearch(processes)
+        nodes = 0
+        depths = []
+        depth_times = {}
+        for board, turn in boards:
+            smp.table.clear()
+            result = smp.search(board, turn, time_limit, wait_for_workers=True)
+            nodes += result['nodes']
+            depths.append(result['depth'])
+            for depth, elapsed in result['depth_times'].items():
+                depth_times.setdefault(depth, []).append(elapsed)
+        smp.close()
+
+        nps = nodes / (positions * time_limit)
+        base_nps = base_nps or nps
+        # Only depths every position reached, so the averages compare like with like
+        reached = [f"d{d}={np.mean(t):.2f}" for d, t in sorted(depth_times.items()) if len(t) == positions]
+        print(f"{processes:>5} {nps:>10.0f} {nps / base_nps:>7.2f}x {np.mean(depths):>6.2f}   {' '.join(reached)}")
+
+
+if __name__ == '__main__':
+    counts = tuple(int(c) for c in sys.argv[1:]) or (1, 2, 4, 8, 16)
+    scaling_report(counts)
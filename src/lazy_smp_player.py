@@ -0,0 +1,46 @@
+import os
+import time
+from player_runtime import run_client
+
+from position import Position
+from utils import move_deadline
+from minimax_alpha_beta_h_nic import TIME_LIMIT
+from lazy_smp import LazySMPSearch
+import memory
+
+# Number of search processes; defaults to one per CPU
+SMP_PROCESSES = int(os.environ.get('REVERSI_SMP_PROCESSES', os.cpu_count() or 1))
+
+_smp = None
+
+
+def get_smp():
+    # Started on first use so importing this player (e.g. from the auto server) stays cheap
+    global _smp
+    if _smp is None:
+        _smp = LazySMPSearch(SMP_PROCESSES)
+        # Shared memory of a fixed size: accounted for, but it cannot be shrunk
+        memory.register('lazy_smp_table', lambda: _smp.table.table.nbytes)
+    return _smp
+
+
+def choose_move(turn, board, game) -> list[int]:
+    legal_moves = Position.from_board(board, turn).legal_moves()
+
+    if len(legal_moves) == 0:
+        return [-1, -1]
+
+    result = get_smp().search(board, turn, move_deadline(game, TIME_LIMIT) - time.time())
+    # Fall back to the first legal move if not even depth 1 finished in time
+    x, y = result['move'] if result['move'] is not None else legal_moves[0]
+    return [x, y]
+
+
+def main():
+    # The runtime owns the connection and runs choose_move in a worker process, so the server
+    # can interrupt a search ('stop') and reuse this process for several games ('new_game')
+    run_client('lazy_smp_player')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,296 @@
+import os
+import sys
+import json
+import time
+import queue
+import socket
+import select
+import selectors
+import subprocess
+import multiprocessing as mp
+from collections import deque, Counter
+
+import numpy as np
+
+# Distributed match play: a coordinator hands out pairs to workers on any number of hosts.
+#
+# The coordinator is match_runner run with --coordinator HOST:PORT. It holds the queue of
+# pairs (openings) and writes the results to the usual results file, with the same SPRT
+# early stop and resume. Workers connect over TCP, each playing `slots` pairs at a time in
+# a local process pool:
+#
+#     python3 src/match_runner.py minimax_alpha_beta_h_nic greedy_bfs_player --coordinator 0.0.0.0:34000
+#     python3 src/match_cluster.py worker <coordinator host>:34000 [--slots=<n>]     (on every host)
+#
+# Messages are JSON lines. A worker says hello with its name and slot count, then receives
+# 'job' messages and answers each with a 'result' (the play_pair tuple) or an 'error'. It
+# sends a heartbeat every HEARTBEAT_INTERVAL seconds; a worker that disconnects or is
+# silent for HEARTBEAT_TIMEOUT seconds is dropped and its pairs go back to the front of the
+# queue. If no worker is connected for WORKER_WAIT seconds (none ever came, or every one
+# dropped), the coordinator gives up; the results so far are kept, so re-running the match
+# resumes it. Players are imported by module name on the workers, so every host needs the same
+# source tree. The protocol has no authentication: run it on a trusted network only.
+#
+# --local-workers <n> starts n workers on this machine as well, which is also how the whole
+# set-up can be tried on one host.
+
+HEARTBEAT_INTERVAL = 2.0
+HEARTBEAT_TIMEOUT = 10.0
+WORKER_WAIT = 120.0       # seconds without any worker after which the coordinator gives up
+MAX_FAILURES = 3          # a pair whose job fails this often stops the match
+POLL = 0.5                # seconds between checks when nothing arrives
+
+
+# ── Messages ──────────────────────────────────────────────────────────────────
+
+def send(sock, message):
+    sock.sendall((json.dumps(message) + '\n').encode())
+
+
+def read_lines(buffer):
+    """Split received bytes into complete JSON messages. Returns (messages, leftover bytes)."""
+    *lines, rest = buffer.split(b'\n')
+    return [json.loads(line) for line in lines if line.strip()], rest
+
+
+def encode_job(job):
+    index, player_a, player_b, board, turn, *settings = job
+    return [index, player_a, player_b, np.asarray(board).tolist(), turn, *settings]
+
+
+def decode_job(job):
+    index, player_a, player_b, board, turn, *settings = job
+    return (index, player_a, player_b, np.array(board), turn, *settings)
+
+
+def parse_address(text):
+    """'host:port' -> (host, port)."""
+    host, _, port = text.rpartition(':')
+    return host or '127.0.0.1', int(port)
+
+
+# ── Coordinator ───────────────────────────────────────────────────────────────
+
+class _Worker:
+    def __init__(self, sock):
+        self.sock = sock
+        self.name = '?'
+        self.slots = 0          # 0 until the worker said hello
+        self.buffer = b''
+        self.last_seen = time.time()
+        self.pairs = set()      # pairs sent to it and not yet answered
+
+
+class Coordinator:
+    """
+    Hands out match_runner jobs to TCP workers and collects their results.
+
+    Args:
+        address:           (host, port) to listen on
+        jobs:              play_pair job tuples
+        heartbeat_timeout: seconds of silence after which a worker is considered dead
+        worker_wait:       seconds without a connected worker after which results() raises
+    """
+
+    def __init__(self, address, jobs, heartbeat_timeout=HEARTBEAT_TIMEOUT, worker_wait=WORKER_WAIT):
+        self.jobs = {job[0]: job for job in jobs}
+        self.pending = deque(self.jobs)
+        self.done = set()
+        self.failures = Counter()
+        self.heartbeat_timeout = heartbeat_timeout
+        self.worker_wait = worker_wait
+        self.idle_since = time.time()   # since when no worker has been connected (None while one is)
+        self.workers = {}
+        self.selector = selectors.DefaultSelector()
+        self.listener = socket.create_server(address, reuse_port=False)
+        self.listener.setblocking(False)
+        self.selector.register(self.listener, selectors.EVENT_READ)
+        self.address = self.listener.getsockname()[:2]
+        self.local = []
+
+    def start_local_workers(self, count, slots=1):
+        """Start `count` worker processes on this machine, connected to this coordinator."""
+        host = '127.0.0.1' if self.address[0] in ('0.0.0.0', '') else self.address[0]
+        script = os.path.abspath(__file__)
+        for _ in range(count):
+            self.local.append(subprocess.Popen([sys.executable, script, 'worker', f'{host}:{self.address[1]}',
+                                                f'--slots={slots}']))
+
+    def results(self):
+        """
+        Yield the result of every job as the workers send them in, until all are done.
+
+        Raises RuntimeError if no worker has been connected for worker_wait seconds.
+        """
+        while len(self.done) < len(self.jobs):
+            for key, _ in self.selector.select(timeout=POLL):
+                if key.fileobj is self.listener:
+                    sock, _ = self.listener.accept()
+                    self.workers[sock] = _Worker(sock)
+                    self.selector.register(sock, selectors.EVENT_READ)
+                    continue
+                worker = self.workers.get(key.fileobj)
+                if worker is None:
+                    continue
+                try:
+                    data = worker.sock.recv(65536)
+                except OSError:
+                    data = b''
+                if not data:
+                    self._drop(worker, 'disconnected')
+                    continue
+                worker.last_seen = time.time()
+                messages, worker.buffer = read_lines(worker.buffer + data)
+                for message in messages:
+                    result = self._handle(worker, message)
+                    if result is not None:
+                        yield result
+
+            now = time.time()
+            for worker in list(self.workers.values()):
+                if now - worker.last_seen > self.heartbeat_timeout:
+                    self._drop(worker, f'silent for {now - worker.last_seen:.0f}s')
+            self._check_idle(now)
+            self._dispatch()
+
+    def _handle(self, worker, message):
+        kind = message['type']
+        if kind == 'hello':
+            worker.name, worker.slots = message['name'], message['slots']
+            print(f"worker {worker.name} connected with {worker.slots} slots")
+        elif kind == 'result':
+            result = tuple(message['result'])
+            index = result[0]
+            worker.pairs.discard(index)
+            if index not in self.done:
+                self.done.add(index)
+                return result
+        elif kind == 'error':
+            index = message['pair']
+            worker.pairs.discard(index)
+            self.failures[index] += 1
+            print(f"pair {index} failed on {worker.name}: {message['error']}")
+            if self.failures[index] >= MAX_FAILURES:
+                raise RuntimeError(f"pair {index} failed {MAX_FAILURES} times: {message['error']}")
+            self.pending.appendleft(index)
+        return None
+
+    def _check_idle(self, now):
+        # Only workers that said hello count: a connection that never does cannot take jobs
+        if any(worker.slots for worker in self.workers.values()):
+            self.idle_since = None
+        elif self.idle_since is None:
+            self.idle_since = now
+            print(f"no workers connected, {len(self.jobs) - len(self.done)} pairs left; "
+                  f"waiting up to {self.worker_wait:.0f}s for one")
+        elif now - self.idle_since > self.worker_wait:
+            raise RuntimeError(f"no worker connected for {self.worker_wait:.0f}s with "
+                               f"{len(self.jobs) - len(self.done)} pairs left; re-run the match to resume")
+
+    def _dispatch(self):
+        # Two jobs per slot, so a worker never waits for the next one
+        for worker in self.workers.values():
+            while self.pending and worker.slots and len(worker.pairs) < 2 * worker.slots:
+                index = self.pending.popleft()
+                if index in self.done:
+                    continue
+                try:
+                    send(worker.sock, {'type': 'job', 'job': encode_job(self.jobs[index])})
+                except OSError:
+                    self.pending.appendleft(index)
+                    break
+                worker.pairs.add(index)
+
+    def _drop(self, worker, reason):
+        """Forget a dead worker and put its unfinished pairs back at the front of the queue."""
+        requeued = [index for index in worker.pairs if index not in self.done]
+        self.pending.extendleft(sorted(requeued, reverse=True))
+        print(f"worker {worker.name} {reason}, {len(requeued)} pairs re-queued")
+        self.selector.unregister(worker.sock)
+        worker.sock.close()
+        del self.workers[worker.sock]
+
+    def close(self):
+        """Tell the workers to stop and close every connection."""
+        for worker in list(self.workers.values()):
+            try:
+                send(worker.sock, {'type': 'stop'})
+            except OSError:
+                pass
+            self.selector.unregister(worker.sock)
+            worker.sock.close()
+        self.workers = {}
+        self.selector.unregister(self.listener)
+        self.listener.close()
+        for process in self.local:
+            try:
+                process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                process.terminate()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+# ── Worker ────────────────────────────────────────────────────────────────────
+
+def _play(job):
+    from match_runner import play_pair
+    return play_pair(job)
+
+
+def run_worker(address, slots=None):
+    """Play the coordinator's jobs `slots` at a time until it says stop or goes away."""
+    slots = slots or os.cpu_count() or 1
+    name = f'{socket.gethostname()}:{os.getpid()}'
+    sock = socket.create_connection(address)
+    send(sock, {'type': 'hello', 'name': name, 'slots': slots})
+    finished = queue.Queue()
+    pool = mp.Pool(slots)
+    buffer = b''
+    last_sent = time.time()
+    try:
+        while True:
+            ready, _, _ = select.select([sock], [], [], POLL)
+            if ready:
+                data = sock.recv(65536)
+                if not data:
+                    return
+                messages, buffer = read_lines(buffer + data)
+                for message in messages:
+                    if message['type'] == 'stop':
+                        return
+                    job = decode_job(message['job'])
+                    pool.apply_async(_play, (job,), callback=finished.put,
+                                     error_callback=lambda error, index=job[0]: finished.put((index, error)))
+            while not finished.empty():
+                result = finished.get()
+                if isinstance(result[1], BaseException):
+                    send(sock, {'type': 'error', 'pair': result[0], 'error': repr(result[1])})
+                    continue
+                # Memory reports are kept per worker process; the pid alone is not unique across hosts
+                result[-1]['pid'] = f"{socket.gethostname()}:{result[-1]['pid']}"
+                send(sock, {'type': 'result', 'result': list(result)})
+                last_sent = time.time()
+            if time.time() - last_sent >= HEARTBEAT_INTERVAL:
+                send(sock, {'type': 'heartbeat'})
+                last_sent = time.time()
+    except (ConnectionError, BrokenPipeError):
+        return
+    finally:
+        pool.terminate()
+        sock.close()
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 3 or sys.argv[1] != 'worker':
+        print('usage: python3 src/match_cluster.py worker <host>:<port> [--slots=<n>]')
+        sys.exit(1)
+    worker_slots = None
+    for arg in sys.argv[3:]:
+        if arg.startswith('--slots='):
+            worker_slots = int(arg.split('=', 1)[1])
+    run_worker(parse_address(sys.argv[2]), worker_slots)
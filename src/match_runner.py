@@ -0,0 +1,344 @@
+import io
+import os
+import sys
+import json
+import math
+import argparse
+import importlib
+import contextlib
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+from reversi_auto_server import AutoGameServer, ADJUDICATE_NODES
+import memory
+import profiling
+import spectator
+from batch_simulator import random_openings
+from match_cluster import Coordinator, parse_address
+
+# Match manager for comparing two players.
+#
+# Games are played in pairs from an opening suite: both players get each opening once
+# as white and once as black, which cancels most of the luck of the opening. After
+# every pair the Elo difference (with a 95% error bar) and the log-likelihood ratio of
+# a sequential probability ratio test are updated, and the match stops as soon as the
+# SPRT accepts either hypothesis:
+#     H0: player A is elo0 stronger than B        H1: player A is elo1 stronger than B
+# Pairs run in parallel worker processes and each finished pair is appended to a
+# results file, so an interrupted match picks up where it stopped when re-run.
+#
+#     python3 src/match_runner.py minimax_alpha_beta_h_nic greedy_bfs_player --time-limit 0.5
+
+DEFAULT_RESULTS_DIR = 'match_results'
+PSEUDO_COUNT = 0.1     # prior count added to each of the five pair outcomes
+
+
+# ── Statistics ────────────────────────────────────────────────────────────────
+
+def elo_to_score(elo):
+    return 1.0 / (1.0 + 10.0 ** (-elo / 400.0))
+
+
+def score_to_elo(score):
+    score = min(max(score, 1e-6), 1 - 1e-6)
+    return -400.0 * math.log10(1.0 / score - 1.0)
+
+
+def pair_stats(pair_scores):
+    """
+    Mean score of player A and the variance of one pair's score, from the per-pair totals.
+
+    Each pair is scored 0, 0.5, 1, 1.5 or 2 for A (pentanomial model), which accounts for the
+    correlation between the two games played from the same opening. Every outcome gets a small
+    pseudo-count so a one-sided match still has a non-zero variance.
+    """
+    counts = [PSEUDO_COUNT] * 5
+    for s in pair_scores:
+        counts[int(round(s * 2))] += 1
+    n = sum(counts)
+    outcomes = [0.0, 0.25, 0.5, 0.75, 1.0]
+    mean = sum(c * x for c, x in zip(counts, outcomes)) / n
+    variance = sum(c * (x - mean) ** 2 for c, x in zip(counts, outcomes)) / n
+    return mean, variance
+
+
+def elo_estimate(pair_scores):
+    """Return (elo, error) where error is the half-width of the 95% confidence interval."""
+    n = len(pair_scores)
+    mean, variance = pair_stats(pair_scores)
+    margin = 1.96 * math.sqrt(variance / n)
+    elo = score_to_elo(mean)
+    error = (score_to_elo(mean + margin) - score_to_elo(mean - margin)) / 2.0
+    return elo, error
+
+
+def sprt_llr(pair_scores, elo0, elo1):
+    """Log-likelihood ratio of H1 against H0 (normal approximation, as used by Fishtest)."""
+    n = len(pair_scores)
+    mean, variance = pair_stats(pair_scores)
+    s0, s1 = elo_to_score(elo0), elo_to_score(elo1)
+    return n * (s1 - s0) * (2 * mean - s0 - s1) / (2 * variance)
+
+
+def sprt_bounds(alpha, beta):
+    return math.log(beta / (1 - alpha)), math.log((1 - beta) / alpha)
+
+
+# ── Playing ───────────────────────────────────────────────────────────────────
+
+def load_player(module_name, time_limit=None):
+    module = importlib.import_module(module_name)
+    if time_limit is not None and hasattr(module, 'TIME_LIMIT'):
+        module.TIME_LIMIT = time_limit
+    return module.choose_move
+
+
+def play_pair(job):
+    """
+    Play one opening twice, A as white then A as black. Runs in a worker process.
+
+    Returns:
+        (pair index, A's points over the two games: 1 per win, 0.5 per draw,
+         [A's overruns, B's overruns] of the move time limit,
+         [adjudication proof or None for each game], seconds spent on adjudication attempts,
+         memory.report() of the worker process after the pair)
+    """
+    index, player_a, player_b, board, turn, time_limit, move_time, adjudicate_empties, adjudicate_nodes = job
+    a = load_player(player_a, time_limit)
+    b = load_player(player_b, time_limit)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        # A is white in the first game and black in the second
+        first = AutoGameServer(a, b, board, turn, move_time, adjudicate_empties=adjudicate_empties,
+                               adjudicate_nodes=adjudicate_nodes)
+        second = AutoGameServer(b, a, board, turn, move_time, adjudicate_empties=adjudicate_empties,
+                                adjudicate_nodes=adjudicate_nodes)
+        first_result = first.play_game()
+        second_result = second.play_game()
+    points = (first_result + 1) / 2.0 + (1 - second_result) / 2.0
+    overruns = [sum(t == 1 for _, t, _ in first.overruns) + sum(t == -1 for _, t, _ in second.overruns),
+                sum(t == -1 for _, t, _ in first.overruns) + sum(t == 1 for _, t, _ in second.overruns)]
+    adjudications = [first.adjudication, second.adjudication]
+    return index, points, overruns, adjudications, first.solve_seconds + second.solve_seconds, memory.report()
+
+
+def add_adjudication_stats(stats, proofs, solve_seconds):
+    """Add one pair's games to the adjudication totals of a match."""
+    stats['games'] += len(proofs)
+    stats['solve_seconds'] += solve_seconds
+    stats['estimated_seconds_saved'] -= solve_seconds
+    for proof in proofs:
+        if proof is not None:
+            stats['adjudicated'] += 1
+            stats['estimated_seconds_saved'] += proof['estimated_seconds_remaining']
+
+
+def load_results(path, config):
+    """Pair results already in the results file, checking that they belong to this match."""
+    results = {}
+    if not os.path.exists(path):
+        return results
+    with open(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if 'config' in record:
+                if record['config'] != config:
+                    raise ValueError(f"{path} holds results of a different match: {record['config']}")
+            else:
+                results[record['pair']] = record['points']
+    return results
+
+
+def run_match(player_a, player_b, max_pairs=500, workers=None, time_limit=None, opening_plies=6,
+              opening_seed=0, elo0=0.0, elo1=20.0, alpha=0.05, beta=0.05, results_path=None, move_time=None,
+              adjudicate_empties=None, adjudicate_nodes=ADJUDICATE_NODES, coordinator=None, local_workers=0):
+    """
+    Play pairs until the SPRT is conclusive or max_pairs have been played.
+
+    With coordinator=(host, port) the pairs are not played here but handed out to TCP workers
+    (match_cluster.py; local_workers of them are started on this machine). Results go to the
+    same results file either way.
+
+    With move_time, the server enforces that per-move limit: late moves are forfeited as passes
+    and counted per player in the 'overruns' of the result.
+
+    With adjudicate_empties, games are ended as soon as the exact solver proves their result
+    (see AutoGameServer); the proofs are saved with the pair results and the result's
+    'adjudication' holds the number of adjudicated games, the time spent solving and the
+    estimated playing time saved.
+
+    Returns:
+        dict with the number of pairs, the Elo estimate and error, the LLR and the SPRT verdict
+        ('H1' = A is at least elo1 stronger, 'H0' = it is not, None = inconclusive)
+    """
+    # 'openings' names the opening generator: results of a match played with the earlier one,
+    # whose openings depended on max_pairs, cannot be resumed
+    config = {'a': player_a, 'b': player_b, 'time_limit': time_limit,
+              'opening_plies': opening_plies, 'opening_seed': opening_seed, 'openings': 2}
+    if move_time is not None:
+        config['move_time'] = move_time
+    if adjudicate_empties is not None:
+        config['adjudicate'] = [adjudicate_empties, adjudicate_nodes]
+    if results_path is None:
+        os.makedirs(DEFAULT_RESULTS_DIR, exist_ok=True)
+        results_path = os.path.join(DEFAULT_RESULTS_DIR, f'{player_a}_vs_{player_b}.jsonl')
+
+    results = load_results(results_path, config)
+    if not os.path.exists(results_path):
+        with open(results_path, 'w') as f:
+            f.write(json.dumps({'config': config}) + '\n')
+    if results:
+        print(f"Resuming from {results_path}: {len(results)} pairs already played")
+
+    lower, upper = sprt_bounds(alpha, beta)
+    boards, turns = random_openings(max_pairs, opening_plies, seed=opening_seed)
+    pending = [(i, player_a, player_b, boards[i], int(turns[i]), time_limit, move_time,
+                adjudicate_empties, adjudicate_nodes)
+               for i in range(len(boards)) if i not in results]
+    overruns = [0, 0]
+    adjudication = {'games': 0, 'adjudicated': 0, 'solve_seconds': 0.0, 'estimated_seconds_saved': 0.0}
+    workers_memory = {}   # pid -> latest memory.report() of that worker
+
+    def status():
+        scores = list(results.values())
+        llr = sprt_llr(scores, elo0, elo1)
+        verdict = 'H1' if llr >= upper else 'H0' if llr <= lower else None
+        return llr, verdict
+
+    llr, verdict = status() if results else (0.0, None)
+    workers = workers or os.cpu_count() or 1
+
+    def add_result(result, out):
+        nonlocal overruns
+        index, points, pair_overruns, proofs, solve_seconds, worker_memory = result
+        workers_memory[worker_memory['pid']] = worker_memory
+        results[index] = points
+        overruns = [total + n for total, n in zip(overruns, pair_overruns)]
+        record = {'pair': index, 'points': points, 'overruns': pair_overruns}
+        if adjudicate_empties is not None:
+            record['adjudications'] = proofs
+            add_adjudication_stats(adjudication, proofs, solve_seconds)
+        out.write(json.dumps(record) + '\n')
+        out.flush()
+
+    def report():
+        llr, verdict = status()
+        elo, error = elo_estimate(list(results.values()))
+        print(f"pairs {len(results):4d}  elo {elo:+7.1f} +/- {error:5.1f}  "
+              f"LLR {llr:+.2f} [{lower:.2f}, {upper:.2f}]")
+        return llr, verdict
+
+    if verdict is None and pending and coordinator is not None:
+        # Workers on other hosts (and local_workers on this one) pull the pairs over TCP
+        with Coordinator(coordinator, pending) as cluster, open(results_path, 'a') as out:
+            print(f"Coordinator listening on {cluster.address[0]}:{cluster.address[1]}")
+            cluster.start_local_workers(local_workers)
+            for result in cluster.results():
+                add_result(result, out)
+                llr, verdict = report()
+                if verdict is not None:
+                    break
+
+    elif verdict is None and pending:
+        with ProcessPoolExecutor(workers) as pool, open(results_path, 'a') as out:
+            running = set()
+            while (pending or running) and verdict is None:
+                # Keep only a few jobs queued so stopping early does not waste much work
+                while pending and len(running) < 2 * workers:
+                    running.add(pool.submit(play_pair, pending.pop(0)))
+                finished, running = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    add_result(future.result(), out)
+                llr, verdict = report()
+            for future in running:
+                future.cancel()
+
+    elo, error = elo_estimate(list(results.values())) if results else (0.0, float('inf'))
+    return {'pairs': len(results), 'elo': elo, 'error': error, 'llr': llr, 'verdict': verdict,
+            'overruns': overruns, 'adjudication': adjudication, 'memory': workers_memory}
+
+
+def format_memory(workers_memory):
+    """Table of every worker's RSS, peak RSS and structure sizes at their peak."""
+    width = max([8] + [len(str(pid)) for pid in workers_memory])
+    lines = [f"{'worker':>{width}} {'rss':>10} {'peak rss':>10} {'moves':>6} {'shrunk':>6}  largest structures (peak)"]
+    for pid, report in sorted(workers_memory.items()):
+        peaks = sorted(report['peak_structures'].items(), key=lambda item: item[1], reverse=True)
+        structures = ', '.join(f'{name} {memory.format_bytes(size)}' for name, size in peaks[:3]) or '-'
+        lines.append(f"{pid:>{width}} {memory.format_bytes(report['rss']):>10} {memory.format_bytes(report['peak_rss']):>10} "
+                     f"{report['moves']:>6} {report['evictions']:>6}  {structures}")
+    total = sum(report['peak_rss'] for report in workers_memory.values())
+    lines.append(f"Sum of worker peaks: {memory.format_bytes(total)} over {len(workers_memory)} workers")
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Paired-opening match between two players with SPRT early stopping.')
+    parser.add_argument('player_a', help='module name of player A, e.g. minimax_alpha_beta_h_nic')
+    parser.add_argument('player_b', help='module name of player B, e.g. greedy_bfs_player')
+    parser.add_argument('--max-pairs', type=int, default=500)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--time-limit', type=float, default=None, help="overrides the players' TIME_LIMIT")
+    parser.add_argument('--move-time', type=float, default=None,
+                        help='per-move limit enforced by the server; late moves are forfeited as passes')
+    parser.add_argument('--adjudicate', type=int, default=None, metavar='EMPTIES',
+                        help='end games whose result the exact solver proves from this many empties on')
+    parser.add_argument('--adjudicate-nodes', type=int, default=ADJUDICATE_NODES,
+                        help='node budget of each adjudication solve')
+    parser.add_argument('--opening-plies', type=int, default=6)
+    parser.add_argument('--opening-seed', type=int, default=0)
+    parser.add_argument('--elo0', type=float, default=0.0)
+    parser.add_argument('--elo1', type=float, default=20.0)
+    parser.add_argument('--alpha', type=float, default=0.05)
+    parser.add_argument('--beta', type=float, default=0.05)
+    parser.add_argument('--results', default=None, help='results file (default: match_results/<a>_vs_<b>.jsonl)')
+    parser.add_argument('--coordinator', default=None, metavar='HOST:PORT',
+                        help='hand the pairs out to TCP workers (match_cluster.py) instead of a local pool')
+    parser.add_argument('--local-workers', type=int, default=0,
+                        help='with --coordinator, also start this many workers on this machine')
+    parser.add_argument('--spectate', type=int, default=None, metavar='PORT',
+                        help='stream the games to observers (spectator.py watch <host>:PORT)')
+    parser.add_argument('--memory-mb', type=float, default=None,
+                        help='per-process budget for the players\' search structures (see memory.py)')
+    parser.add_argument('--profile', nargs='?', const='cprofile,sample', metavar='MODES',
+                        help='profile the games: cprofile, sample or both comma separated (default both)')
+    args = parser.parse_args()
+    # profiling.py reads --profile from sys.argv itself when imported (the decorators of the hot
+    # sections are set up then); this only rejects values it would not take as modes
+    if args.profile is not None and not profiling.is_modes(args.profile):
+        parser.error(f"--profile: unknown mode in {args.profile!r} (modes: {', '.join(profiling.MODE_NAMES)})")
+    if args.memory_mb is not None:
+        memory.set_budget(args.memory_mb)
+    if args.spectate is not None:
+        # Started before the workers, which inherit REVERSI_SPECTATE and publish to it
+        spectator.start_hub(args.spectate, '0.0.0.0')
+
+    result = run_match(args.player_a, args.player_b, args.max_pairs, args.workers, args.time_limit,
+                       args.opening_plies, args.opening_seed, args.elo0, args.elo1, args.alpha, args.beta,
+                       args.results, args.move_time, args.adjudicate, args.adjudicate_nodes,
+                       parse_address(args.coordinator) if args.coordinator else None, args.local_workers)
+
+    print(f"\n{args.player_a} vs {args.player_b}: {result['pairs']} pairs, "
+          f"elo {result['elo']:+.1f} +/- {result['error']:.1f}")
+    if args.move_time is not None:
+        print(f"Overruns of the {args.move_time}s move limit this run: "
+              f"{args.player_a} {result['overruns'][0]}, {args.player_b} {result['overruns'][1]}")
+    if args.adjudicate is not None:
+        stats = result['adjudication']
+        print(f"Adjudicated {stats['adjudicated']} of {stats['games']} games this run, "
+              f"{stats['solve_seconds']:.1f}s spent solving, "
+              f"about {stats['estimated_seconds_saved']:.1f}s of play saved")
+    if result['memory']:
+        print(f"\nMemory per worker{f' (budget {args.memory_mb:g} MB per process)' if args.memory_mb else ''}:")
+        print(format_memory(result['memory']))
+    if result['verdict'] == 'H1':
+        print(f"SPRT: {args.player_a} is stronger (H1, elo >= {args.elo1}) accepted.")
+    elif result['verdict'] == 'H0':
+        print(f"SPRT: H0 (elo <= {args.elo0}) accepted, {args.player_a} is not shown to be stronger.")
+    else:
+        print("SPRT: inconclusive, raise --max-pairs to keep going.")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
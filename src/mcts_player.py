@@ -0,0 +1,227 @@
+import os
+import sys
+import math
+import time
+import numpy as np
+from reversi import reversi
+from player_runtime import run_client
+
+import batch_engine
+import memory
+from batch_simulator import BatchSimulator, random_policy, weighted_policy
+from utils import WEIGHT_MATRIX, move_deadline, stop_requested
+from minimax_alpha_beta_h_nic import TIME_LIMIT
+
+# Monte Carlo Tree Search (UCT) player.
+#
+# Instead of running one playout per tree iteration, each iteration selects a batch of
+# leaves (with virtual loss so the batch spreads out over the tree), and then plays
+# PLAYOUTS_PER_LEAF games from every leaf at once in a BatchSimulator. That is
+# LEAVES_PER_BATCH * PLAYOUTS_PER_LEAF games per numpy call.
+# The tree is kept between moves and reused when the game follows a searched line.
+
+EXPLORATION = 1.4
+LEAVES_PER_BATCH = 32
+PLAYOUTS_PER_LEAF = 8
+
+# 'random' plays uniformly random playouts; 'weighted' prefers squares with a high
+# WEIGHT_MATRIX value (corners over X-squares), which is cheap and plays a lot better
+PLAYOUT_POLICY = os.environ.get('REVERSI_MCTS_POLICY', 'weighted')
+PLAYOUT_WEIGHTS = np.exp(WEIGHT_MATRIX.ravel() / 50.0)
+
+_rng = np.random.default_rng()
+_tree = None
+last_stats = {}
+
+
+class Node:
+    __slots__ = ('board', 'piece', 'parent', 'move', 'children', 'untried', 'visits', 'wins', 'terminal')
+
+    def __init__(self, board, piece, parent=None, move=None):
+        self.board = board          # int8 8x8 board
+        self.piece = piece          # side to move in this node
+        self.parent = parent
+        self.move = move            # (x, y) that led here, None for a pass
+        self.children = []
+        self.visits = 0
+        self.wins = 0.0             # from the point of view of the player who moved into this node
+        self.terminal = False
+
+        legal = np.flatnonzero(batch_engine.legal_masks(board[None], [piece])[0])
+        self.untried = [divmod(int(square), 8) for square in legal]
+        if not self.untried:
+            if batch_engine.legal_masks(board[None], [-piece])[0].any():
+                self.untried = [None]    # forced pass
+            else:
+                self.terminal = True
+
+    def uct_child(self):
+        log_visits = math.log(self.visits)
+        return max(self.children, key=lambda c: c.wins / c.visits + EXPLORATION * math.sqrt(log_visits / c.visits))
+
+    def expand(self):
+        move = self.untried.pop()
+        board = self.board.copy()
+        if move is not None:
+            batch_engine.play_moves(board[None], np.array([self.piece]), np.array([move[0] * 8 + move[1]]))
+        child = Node(board, -self.piece, self, move)
+        self.children.append(child)
+        return child
+
+
+def run_playouts(boards, pieces, rng=_rng, policy=PLAYOUT_POLICY):
+    """
+    Play every game in the batch to the end.
+
+    Args:
+        boards: (N, 8, 8) boards to play out
+        pieces: (N,) side to move on each board
+
+    Returns:
+        (N,) final disc difference, white minus black
+    """
+    sim = BatchSimulator(boards=boards, pieces=pieces)
+    if policy == 'weighted':
+        sim.run(weighted_policy(PLAYOUT_WEIGHTS, rng))
+    else:
+        sim.run(random_policy(rng))
+    return sim.disc_difference()
+
+
+def select_leaf(root):
+    """Walk down by UCT to a node that can be expanded, adding a virtual loss along the path."""
+    node = root
+    node.visits += 1
+    while not node.untried and node.children:
+        node = node.uct_child()
+        node.visits += 1
+    if node.untried:
+        node = node.expand()
+        node.visits += 1
+    return node
+
+
+def backpropagate(leaf, white_score, playouts):
+    """Add `playouts` results (white's average score in [0, 1]) to every node on the path."""
+    node = leaf
+    while node is not None:
+        # One visit was already added as virtual loss when the leaf was selected
+        node.visits += playouts - 1
+        if node.parent is not None:
+            mover_score = white_score if node.parent.piece == 1 else 1.0 - white_score
+            node.wins += mover_score * playouts
+        node = node.parent
+
+
+def search(root, deadline):
+    """Run batches of selection + batched playouts until the deadline. Returns the number of playouts."""
+    playouts = 0
+    while time.time() < deadline and not stop_requested():
+        leaves = [select_leaf(root) for _ in range(LEAVES_PER_BATCH)]
+
+        boards = np.repeat(np.stack([leaf.board for leaf in leaves]), PLAYOUTS_PER_LEAF, axis=0)
+        pieces = np.repeat([leaf.piece for leaf in leaves], PLAYOUTS_PER_LEAF)
+        diffs = run_playouts(boards, pieces).reshape(len(leaves), PLAYOUTS_PER_LEAF)
+        white_scores = ((diffs > 0) + 0.5 * (diffs == 0)).mean(axis=1)
+
+        for leaf, white_score in zip(leaves, white_scores):
+            backpropagate(leaf, white_score, PLAYOUTS_PER_LEAF)
+        playouts += len(boards)
+    return playouts
+
+
+def find_reusable(tree, board, piece):
+    """Find the node for (board, piece) among the previous root's children and grandchildren."""
+    if tree is None:
+        return None
+    for child in tree.children:
+        for node in [child] + child.children:
+            if node.piece == piece and np.array_equal(node.board, board):
+                return node
+    return None
+
+
+def choose_move(turn, board, game) -> list[int]:
+    global _tree, last_stats
+    start = time.time()
+    deadline = move_deadline(game, TIME_LIMIT)
+    board = board.astype(np.int8)
+
+    legal = batch_engine.legal_masks(board[None], [turn])[0]
+    if not legal.any():
+        _tree, last_stats = None, {}
+        return [-1, -1]
+
+    root = find_reusable(_tree, board, turn)
+    reused = root.visits if root is not None else 0
+    if root is None:
+        root = Node(board, turn)
+    root.parent = None
+
+    playouts = search(root, deadline)
+    if not root.children:
+        # Out of time (or stopped) before the first batch: the best square by static weight
+        _tree, last_stats = None, {'playouts': 0, 'seconds': time.time() - start}
+        square = max(np.flatnonzero(legal), key=lambda s: WEIGHT_MATRIX[s // 8, s % 8])
+        return [int(square // 8), int(square % 8)]
+    best = max(root.children, key=lambda c: c.visits)
+    _tree = best
+
+    elapsed = time.time() - start
+    last_stats = {'playouts': playouts, 'seconds': elapsed, 'playouts_per_sec': playouts / elapsed,
+                  'reused_visits': reused, 'win_rate': best.wins / best.visits}
+    return [best.move[0], best.move[1]]
+
+
+def new_game():
+    """Drop the tree kept from the previous game (called by the player runtime)."""
+    global _tree, last_stats
+    _tree, last_stats = None, {}
+
+
+def tree_bytes():
+    """Bytes held by the tree kept for the next move."""
+    total = 0
+    stack = [_tree] if _tree is not None else []
+    while stack:
+        node = stack.pop()
+        total += (sys.getsizeof(node) + sys.getsizeof(node.board)
+                  + sys.getsizeof(node.children) + sys.getsizeof(node.untried))
+        stack.extend(node.children)
+    return total
+
+
+def drop_tree(fraction):
+    """Memory budget: the kept tree cannot be cut partially, so anything below 1 drops it."""
+    global _tree
+    if fraction < 1:
+        _tree = None
+
+
+memory.register('mcts_tree', tree_bytes, drop_tree)
+
+
+def playout_benchmark(batch_sizes=(1, 16, 64, 256, 1024), seconds=2.0):
+    """Print playouts/sec from the opening position for each batch size."""
+    start_board = reversi().board.astype(np.int8)
+    print(f"{'batch':>6} {'playouts/s':>11}")
+    for size in batch_sizes:
+        playouts = 0
+        start = time.time()
+        while time.time() - start < seconds:
+            run_playouts(np.repeat(start_board[None], size, axis=0), np.ones(size))
+            playouts += size
+        print(f"{size:>6} {playouts / (time.time() - start):>11.0f}")
+
+
+def main():
+    # The runtime owns the connection and runs choose_move in a worker process, so the server
+    # can interrupt a search ('stop') and reuse this process for several games ('new_game')
+    run_client('mcts_player')
+
+
+if __name__ == '__main__':
+    if sys.argv[1:] == ['bench']:
+        playout_benchmark()
+    else:
+        main()
@@ -0,0 +1,232 @@
+import os
+import sys
+import time
+import weakref
+import resource
+import functools
+import tracemalloc
+from collections import deque
+
+# Memory accounting for the players' long-lived search structures.
+#
+# Structures that live from one move to the next (position stores, search contexts, the MCTS
+# tree, the lazy SMP table) register themselves here with a function giving their size in
+# bytes and, if they can give memory back, a function shrinking them to a fraction of their
+# contents. After every move (game servers call after_move once the move has been timed;
+# wrap_player does it for other callers) this module records the process RSS, its peak and the
+# size of every registered structure, and enforces the budget:
+#
+#   REVERSI_MEMORY_MB=<n>   budget for the registered structures of each process; when they
+#                           hold more, each shrinkable one is cut down in proportion (the
+#                           position stores keep their deepest entries, the MCTS tree is dropped)
+#   REVERSI_TRACEMALLOC=<n> also trace Python allocations and keep, per move, the n source
+#                           lines whose allocations grew the most during that move
+#
+# match_runner collects report() from every worker process and prints memory per worker.
+
+HEADROOM = 0.9       # shrink to this fraction of the budget so the next move has room to grow
+MOVES_KEPT = 1000    # per-move records kept in MOVES
+
+
+def _budget_from_env():
+    value = os.environ.get('REVERSI_MEMORY_MB')
+    return int(float(value) * 1024 * 1024) if value else None
+
+
+BUDGET = _budget_from_env()
+TRACEMALLOC_LINES = int(os.environ.get('REVERSI_TRACEMALLOC', '0') or 0)
+
+_registry = {}            # name -> (size ref, shrink ref or None)
+MOVES = deque(maxlen=MOVES_KEPT)
+peak_structures = {}      # name -> largest size seen after a move
+evictions = 0             # number of times a structure was shrunk to fit the budget
+_move_number = 0
+_last_snapshot = None
+
+
+def set_budget(megabytes):
+    """Set the budget of this process and of worker processes started after this call (None: no budget)."""
+    global BUDGET
+    if megabytes is None:
+        os.environ.pop('REVERSI_MEMORY_MB', None)
+    else:
+        os.environ['REVERSI_MEMORY_MB'] = str(megabytes)
+    BUDGET = _budget_from_env()
+
+
+# ── Registry ──────────────────────────────────────────────────────────────────
+
+def _ref(func):
+    # Bound methods are held weakly so registering a structure does not keep it alive
+    if func is None:
+        return None
+    if hasattr(func, '__self__'):
+        return weakref.WeakMethod(func)
+    return lambda: func
+
+
+def register(name, size, shrink=None):
+    """
+    Register a structure under `name` (replacing one registered under the same name).
+
+    Args:
+        size:   function returning the structure's size in bytes
+        shrink: function(fraction) keeping about `fraction` (0 to 1) of its contents, or None
+                if the structure cannot give memory back
+    """
+    _registry[name] = (_ref(size), _ref(shrink))
+
+
+def unregister(name):
+    _registry.pop(name, None)
+
+
+def usage():
+    """Bytes used by each live registered structure (structures that were freed are dropped)."""
+    sizes = {}
+    for name, (size, _) in list(_registry.items()):
+        func = size()
+        if func is None:
+            del _registry[name]
+            continue
+        sizes[name] = func()
+    return sizes
+
+
+def rss_bytes():
+    """Current resident set size of this process."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        # No /proc (macOS): the peak is the best estimate available
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def peak_rss_bytes():
+    """Peak resident set size of this process (at least the current one; the two are sampled differently)."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak = peak if sys.platform == 'darwin' else peak * 1024
+    try:
+        with open('/proc/self/statm') as f:
+            return max(peak, int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE'))
+    except (OSError, ValueError, IndexError):
+        return peak
+
+
+def entries_bytes(entries, sample=32):
+    """
+    Estimated size of a dict of tuple keys -> tuple values: the dict itself plus the keys,
+    values and the objects in them, measured on the first `sample` items.
+    Small ints are shared by the interpreter and not counted.
+    """
+    def deep(item):
+        total = sys.getsizeof(item)
+        for part in item:
+            if not (isinstance(part, int) and -5 <= part <= 256):
+                total += sys.getsizeof(part)
+        return total
+
+    count = len(entries)
+    if not count:
+        return sys.getsizeof(entries)
+    measured = 0
+    for index, (key, value) in enumerate(entries.items()):
+        if index == sample:
+            break
+        measured += deep(key) + deep(value)
+    return sys.getsizeof(entries) + measured * count // min(count, sample)
+
+
+# ── Budget ────────────────────────────────────────────────────────────────────
+
+def enforce(budget=None):
+    """
+    Shrink the registered structures if together they hold more than `budget` bytes
+    (default BUDGET). Every shrinkable structure keeps the same fraction of its contents,
+    chosen so the total lands at HEADROOM of the budget.
+
+    Returns:
+        {name: size} after shrinking
+    """
+    global evictions
+    budget = BUDGET if budget is None else budget
+    sizes = usage()
+    if budget is None or sum(sizes.values()) <= budget:
+        return sizes
+    fixed = sum(size for name, size in sizes.items() if _registry[name][1] is None)
+    shrinkable = sum(sizes.values()) - fixed
+    if shrinkable <= 0:
+        return sizes
+    fraction = max(0.0, min(1.0, (budget * HEADROOM - fixed) / shrinkable))
+    for name, size in sizes.items():
+        shrink = _registry[name][1]
+        func = shrink() if shrink is not None else None
+        if func is not None and size > 0:
+            func(fraction)
+            evictions += 1
+    return usage()
+
+
+# ── Per move ──────────────────────────────────────────────────────────────────
+
+def after_move(module='player', seconds=0.0):
+    """Record the memory of this process after a move and enforce the budget."""
+    global _move_number, _last_snapshot
+    _move_number += 1
+    before = usage()
+    sizes = enforce()
+    for name, size in before.items():
+        peak_structures[name] = max(peak_structures.get(name, 0), size)
+    record = {'move': _move_number, 'player': module, 'seconds': seconds, 'rss': rss_bytes(),
+              'peak_rss': peak_rss_bytes(), 'structures': sizes, 'shrunk': before != sizes}
+    if TRACEMALLOC_LINES:
+        # Leave out the snapshots' own allocations
+        snapshot = tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+        if _last_snapshot is not None:
+            growth = snapshot.compare_to(_last_snapshot, 'lineno')[:TRACEMALLOC_LINES]
+            record['allocations'] = [str(stat) for stat in growth]
+        _last_snapshot = snapshot
+    MOVES.append(record)
+    return record
+
+
+def before_move():
+    """Start tracing allocations if REVERSI_TRACEMALLOC asks for it (call before a move, with after_move after it)."""
+    if TRACEMALLOC_LINES and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+
+def wrap_player(choose_move):
+    """
+    Wrap a player's choose_move so the process's memory is recorded (and capped) after every move.
+
+    The accounting runs inside the call; where the caller times the move (game servers), call
+    before_move() and after_move() around the timed part instead.
+    """
+    module = getattr(choose_move, '__module__', 'player')
+
+    @functools.wraps(choose_move)
+    def wrapper(turn, board, game):
+        before_move()
+        start = time.perf_counter()
+        try:
+            return choose_move(turn, board, game)
+        finally:
+            after_move(module, time.perf_counter() - start)
+    return wrapper
+
+
+def report():
+    """Memory summary of this process: RSS, peak RSS, structure sizes now and at their peak, evictions."""
+    return {'pid': os.getpid(), 'rss': rss_bytes(), 'peak_rss': peak_rss_bytes(), 'structures': usage(),
+            'peak_structures': dict(peak_structures), 'evictions': evictions, 'moves': _move_number}
+
+
+def format_bytes(size):
+    for unit in ('B', 'KB', 'MB'):
+        if abs(size) < 1024:
+            return f'{size:.0f} {unit}' if unit == 'B' else f'{size:.1f} {unit}'
+        size /= 1024
+    return f'{size:.2f} GB'
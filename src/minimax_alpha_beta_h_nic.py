@@ -1,27 +1,172 @@
 #Zijie Zhang, Sep.24/2023
 
+import os
+import sys
 import time
-import socket, pickle
-import numpy as np
-from reversi import reversi
 
-from utils import get_legal_moves, apply_move, WEIGHT_MATRIX
-from heuristic_functions import heuristic_nic
+from player_runtime import run_client
+from utils import WEIGHT_MATRIX, move_deadline, stop_requested
+from heuristic_functions import get_heuristic, BATCHED
+from position import Position, stack_boards
+from position_cache import PositionStore, EXACT, LOWER, UPPER
+import probcut
+import memory
+from profiling import timed
+from search_trace import traced
 
 # ── Heuristic selection ───────────────────────────────────────────────────────
-# Set this to any function with the signature: heuristic(board, player) -> float
-CHOSEN_HEURISTIC = heuristic_nic
+# Any function with the signature: heuristic(board, player) -> float. Picked by name from
+# heuristic_functions.HEURISTICS with REVERSI_HEURISTIC=<name> (default 'nic'); compare
+# the registered heuristics with `python3 src/heuristic_bench.py`.
+CHOSEN_HEURISTIC = get_heuristic(os.environ.get('REVERSI_HEURISTIC', 'nic'))
 # ─────────────────────────────────────────────────────────────────────────────
 
 TIME_LIMIT = 4.0   # seconds per move
 MAX_DEPTH   = 12   # hard cap; iterative deepening rarely reaches this
+PROBCUT_EPSILON = 1e-3  # width of the null windows used by the ProbCut shallow searches
+
+# ── Persistent position cache ─────────────────────────────────────────────────
+# Results of earlier searches (this game, earlier games, earlier runs) are kept in
+# an on-disk store so repeated positions are answered from the cache. The file is
+# per heuristic since the stored scores are only meaningful for the heuristic that
+# produced them. Set REVERSI_CACHE=0 to disable it.
+USE_POSITION_CACHE = os.environ.get('REVERSI_CACHE', '1') != '0'
+CACHE_DIR = os.environ.get('REVERSI_CACHE_DIR', os.path.dirname(os.path.abspath(__file__)))
+# ─────────────────────────────────────────────────────────────────────────────
+
+# ── Search carried over between moves ─────────────────────────────────────────
+# The player keeps its transposition table and last principal variation between
+# choose_move calls (see SearchContext). Set REVERSI_CARRY_OVER=0 to start every
+# move from scratch.
+USE_SEARCH_CONTEXT = os.environ.get('REVERSI_CARRY_OVER', '1') != '0'
+# ─────────────────────────────────────────────────────────────────────────────
+
+# ── Batched leaf evaluation ───────────────────────────────────────────────────
+# At depth-1 nodes the children are scored with one call to the heuristic's batched
+# version (heuristic_functions.BATCHED) instead of one call per child. Scores are the
+# same; some children past a cutoff are scored for nothing, but the per-call overhead
+# is paid once. Set REVERSI_BATCH_LEAVES=0 to score each leaf on its own.
+USE_BATCH_LEAVES = os.environ.get('REVERSI_BATCH_LEAVES', '1') != '0'
+# ─────────────────────────────────────────────────────────────────────────────
+
+_position_caches = {}
+_search_contexts = {}
+
+# Number of minimax nodes visited by this process; callers reset it to measure a search
+node_count = 0
+
+# ── Node-limited search ───────────────────────────────────────────────────────
+# With REVERSI_NODE_LIMIT=<n> every move is searched for n nodes instead of TIME_LIMIT
+# seconds, without the position cache or carried-over context, so a position always gives
+# the same move on any machine and under any load (for benchmarks and regression runs).
+# Limits are only checked every CHECK_INTERVAL nodes in timed searches (and exactly at the
+# node budget otherwise); in between the per-node cost is one integer comparison.
+NODE_LIMIT = int(os.environ['REVERSI_NODE_LIMIT']) if os.environ.get('REVERSI_NODE_LIMIT') else None
+CHECK_INTERVAL = 64
+_node_limit = None   # node_count at which the current search stops, if node-limited
+_next_check = 0      # node_count at which the limits are checked next
+# ─────────────────────────────────────────────────────────────────────────────
+
+
+def get_position_cache(heuristic):
+    """Return the process-wide position store for `heuristic`, opening it on first use."""
+    if not USE_POSITION_CACHE:
+        return None
+    if heuristic not in _position_caches:
+        path = os.path.join(CACHE_DIR, f'search_cache_{heuristic.__name__}.bin')
+        store = PositionStore(path)
+        memory.register(f'position_cache:{heuristic.__name__}', store.memory_bytes, store.shrink)
+        _position_caches[heuristic] = store
+    return _position_caches[heuristic]
+
+
+class SearchContext:
+    """
+    What the player remembers from one move to the next.
+
+    The transposition table carries the bounds and best move of every node searched so far;
+    the best moves are also minimax's move ordering (after the static weights), so keeping the
+    table keeps the ordering. The principal variation of the last search is read back from
+    the table: if the game then follows it, the position now on the board was already searched
+    `depth - plies` deep as part of that line, and iterative deepening resumes one deeper.
+
+    Args:
+        heuristic: heuristic the table's scores belong to
+        table:     transposition table (the persistent position store, or memory-only if None)
+    """
+
+    def __init__(self, heuristic, table=None):
+        self.heuristic = heuristic
+        self.table = table if table is not None else PositionStore(None)
+        self.line = []        # positions along the last principal variation, its root first
+        self.pv = []          # the moves of that variation (None for a pass)
+        self.depth = 0        # depth completed at the root of the variation
+        self.searches = []    # (start depth, completed depth) of every search
+
+    def resume(self, position):
+        """Return (depth already searched, predicted move) if `position` is on the last PV, else (0, None)."""
+        for plies in range(1, len(self.pv)):
+            if self.line[plies] == position and self.pv[plies] is not None:
+                return self.depth - plies, self.pv[plies]
+        return 0, None
+
+    def remember(self, position, depth):
+        """Read the principal variation of a search of `position` completed to `depth` from the table."""
+        self.line = [position]
+        self.pv = []
+        self.depth = depth
+        for _ in range(depth):
+            if not position.moves():
+                if position.is_game_over():
+                    break
+                move = None
+            else:
+                entry = self.table.probe(position.key())
+                move = entry[3] if entry is not None else None
+                if move is None or move not in position.legal_moves():
+                    break
+            position = position.play(move)
+            self.pv.append(move)
+            self.line.append(position)
+
+
+def get_search_context(heuristic):
+    """Return the process-wide search context for `heuristic`, or None if carry-over is off."""
+    if not USE_SEARCH_CONTEXT:
+        return None
+    if heuristic not in _search_contexts:
+        context = SearchContext(heuristic, get_position_cache(heuristic))
+        if context.table is not get_position_cache(heuristic):
+            memory.register(f'search_context:{heuristic.__name__}', context.table.memory_bytes, context.table.shrink)
+        _search_contexts[heuristic] = context
+    return _search_contexts[heuristic]
+
+
+def new_game():
+    """Forget the last principal variation (called by the player runtime); the tables are kept."""
+    for context in _search_contexts.values():
+        context.line, context.pv, context.depth = [], [], 0
 
 
 class TimeUp(Exception):
-    """Raised inside minimax when the deadline has been exceeded."""
+    """Raised inside minimax when the deadline or node budget has been exceeded (or a stop was requested)."""
     pass
 
-def minimax(board, game, depth, alpha, beta, maximizing_player, player, deadline, heuristic):
+
+def check_limits(deadline):
+    """Raise TimeUp if the search is out of nodes or time, else schedule the next check."""
+    global _next_check
+    if _node_limit is not None and node_count >= _node_limit:
+        raise TimeUp()
+    if time.time() >= deadline or stop_requested():
+        raise TimeUp()
+    _next_check = node_count + CHECK_INTERVAL
+    if _node_limit is not None:
+        _next_check = min(_next_check, _node_limit)
+
+@timed('minimax')
+@traced
+def minimax(position, depth, alpha, beta, maximizing_player, player, deadline, heuristic, cache=None):
     """
     Minimax search with alpha-beta pruning and a hard time deadline.
 
@@ -29,8 +174,7 @@ def minimax(board, game, depth, alpha, beta, maximizing_player, player, deadline
     the best move found at the previous completed depth.
 
     Args:
-        board:             current board state (np.ndarray)
-        game:              reversi instance used for move simulation
+        position:          current Position; its side to move is the piece of this layer
         depth:             remaining search depth
         alpha:             best score the maximizer can guarantee
         beta:              best score the minimizer can guarantee
@@ -38,48 +182,59 @@ def minimax(board, game, depth, alpha, beta, maximizing_player, player, deadline
         player:            the piece value (1 or -1) of the original caller
         deadline:          time.time() value after which search must stop
         heuristic:         heuristic function that determines the best move
+        cache:             optional PositionStore used for move ordering and cutoffs
 
     Returns:
         (score, best_move) tuple
     """
-    if time.time() >= deadline:
-        raise TimeUp()
+    global node_count
+    node_count += 1
 
-    current_piece = player if maximizing_player else -player
+    if node_count >= _next_check:
+        check_limits(deadline)
 
-    game.board = board.copy()
-    legal_moves = get_legal_moves(game, current_piece)
+    key, cached_move, hit = probe_cache(cache, position, depth, alpha, beta, maximizing_player)
+    if hit is not None:
+        return hit
 
-    # Order moves by weight (best squares first) so alpha-beta
-    # encounters tighter bounds earlier and prunes more branches. (eliminating unnecessary searches)
-    legal_moves.sort(key=lambda m: WEIGHT_MATRIX[m[0], m[1]], reverse=True)
+    # At the leaves only whether a move exists matters, so skip building the move list
+    if depth <= 0 and position.moves():
+        return heuristic(position.board(), player), None
+
+    # Every move with its flips in one call; the flips are reused when the move is played
+    legal_moves, flips = order_moves(position.moves_with_flips(), cached_move)
+
+    # Selective pruning: skip the full-width search if a shallow search is confident it would fail
+    if probcut.USE_PROBCUT and depth in probcut.DEPTH_PAIRS and len(legal_moves) >= probcut.MIN_MOVES:
+        cut_score = probcut_cut(position, depth, alpha, beta, maximizing_player,
+                                player, deadline, heuristic, cache)
+        if cut_score is not None:
+            return cut_score, legal_moves[0]
 
     # Escape conditions: max depth or no moves for either side
-    if depth == 0 or len(legal_moves) == 0:
+    if depth <= 0 or len(legal_moves) == 0:
 
         # if no available moves it's the opponents "turn" and evaluate their options
         if len(legal_moves) == 0:
-            game.board = board.copy()
-            opponent_moves = get_legal_moves(game, -current_piece)
-
-            # if they have no moves left. The game is over (not sure if this is necessary)
-            if len(opponent_moves) == 0:
-                # Game is over - evaluate by final piece count
-                player_count = np.sum(board == player)
-                opponent_count = np.sum(board == -player)
-                if player_count > opponent_count:
-                    return 10000 + player_count - opponent_count, None
-                elif opponent_count > player_count:
-                    return -10000 - opponent_count + player_count, None
-                else:
-                    return 0, None
-            else:
-                # if opponent has moves, recursively call this function as the minimizing player
-                return minimax(board, game, depth - 1, alpha, beta,
-                               not maximizing_player, player, deadline, heuristic)
+            # if they have no moves left. The game is over - evaluate by final piece count
+            final_score = game_over_score(position, player)
+            if final_score is not None:
+                return final_score, None
+            # if opponent has moves, recursively call this function as the minimizing player
+            return minimax(position.play(None), depth - 1, alpha, beta,
+                           not maximizing_player, player, deadline, heuristic, cache)
 
         # determine the best move by calculating the score through the heuristic
-        return heuristic(board, player), None
+        return heuristic(position.board(), player), None
+
+    original_alpha, original_beta = alpha, beta
+
+    batch_heuristic = BATCHED.get(heuristic) if USE_BATCH_LEAVES and depth == 1 else None
+    if batch_heuristic is not None:
+        best_score, best_move = batched_leaves(position, legal_moves, flips, alpha, beta, maximizing_player,
+                                               player, deadline, heuristic, batch_heuristic, cache)
+        store_result(cache, key, depth, best_score, best_move, original_alpha, original_beta, maximizing_player)
+        return best_score, best_move
 
     if maximizing_player:
         max_eval = float('-inf')
@@ -88,9 +243,8 @@ def minimax(board, game, depth, alpha, beta, maximizing_player, player, deadline
         # for every move taken, you apply the "best move" to the board and evaluate the potential score through recursively calling minimax function
         # if the current move in the iteration has a greater score that's the new "best move"
         for move in legal_moves:
-            new_board = apply_move(board, game, move[0], move[1], current_piece)
-            eval_score, _ = minimax(new_board, game, depth - 1, alpha, beta,
-                                    False, player, deadline, heuristic)
+            eval_score, _ = minimax(position.play(move, flips[move]), depth - 1, alpha, beta,
+                                    False, player, deadline, heuristic, cache)
 
             if eval_score > max_eval:
                 max_eval = eval_score
@@ -100,15 +254,15 @@ def minimax(board, game, depth, alpha, beta, maximizing_player, player, deadline
             if beta <= alpha:
                 break  # Beta cutoff
 
+        store_result(cache, key, depth, max_eval, best_move, original_alpha, original_beta, True)
         return max_eval, best_move
     else: # essentially doing the same as above but looking for the "worst" score (the score that is most detrimental to us)
         min_eval = float('inf')
         best_move = legal_moves[0]
 
         for move in legal_moves:
-            new_board = apply_move(board, game, move[0], move[1], current_piece)
-            eval_score, _ = minimax(new_board, game, depth - 1, alpha, beta,
-                                    True, player, deadline, heuristic)
+            eval_score, _ = minimax(position.play(move, flips[move]), depth - 1, alpha, beta,
+                                    True, player, deadline, heuristic, cache)
 
             if eval_score < min_eval:
                 min_eval = eval_score
@@ -118,79 +272,475 @@ def minimax(board, game, depth, alpha, beta, maximizing_player, player, deadline
             if beta <= alpha:
                 break  # Alpha cutoff
 
+        store_result(cache, key, depth, min_eval, best_move, original_alpha, original_beta, False)
         return min_eval, best_move
 
 
-def get_best_move(board, game, player, heuristic):
-    deadline = time.time() + TIME_LIMIT
-    best_move = get_legal_moves(game, player)[0]  # safe fallback
-
-    for depth in range(1, MAX_DEPTH + 1):
+def batched_leaves(position, legal_moves, flips, alpha, beta, maximizing_player, player, deadline,
+                   heuristic, batch_heuristic, cache):
+    """
+    The move loop of a depth-1 node, with every child that is a plain leaf scored in one
+    batch_heuristic call. Children without a move (pass or game over) are still searched by
+    minimax. Cutoffs happen in the same order as in minimax, so the result is the same.
 
-        # try to find best move in given time-limit if time limit is reached. throw exception. return the best move so far
-        try:
-            _, move = minimax(board, game, depth,
-                              float('-inf'), float('inf'),
-                              True, player, deadline, heuristic)
-            best_move = move  # only update on a fully completed search
-            # print(f"  depth {depth} -> {best_move}")
-        except TimeUp:
-            # print(f"  time up at depth {depth}, using depth {depth - 1} result")
+    Returns:
+        (score, best_move) tuple
+    """
+    global node_count
+    best_score = float('-inf') if maximizing_player else float('inf')
+    best_move = legal_moves[0]
+    children = [position.play(move, flips[move]) for move in legal_moves]
+    scores = [None] * len(children)
+    for index, (move, child) in enumerate(zip(legal_moves, children)):
+        score = scores[index]
+        if score is None:
+            if index == 0 or not child.moves():
+                score, _ = minimax(child, 0, alpha, beta, not maximizing_player, player, deadline, heuristic, cache)
+            else:
+                # The first child often cuts on its own; past it, score every remaining leaf at once
+                leaves = [later for later in range(index, len(children)) if children[later].moves()]
+                node_count += len(leaves)
+                batch = batch_heuristic(stack_boards([children[later] for later in leaves]), player)
+                for later, leaf_score in zip(leaves, batch.tolist()):
+                    scores[later] = leaf_score
+                score = scores[index]
+        if maximizing_player:
+            if score > best_score:
+                best_score, best_move = score, move
+            alpha = max(alpha, score)
+        else:
+            if score < best_score:
+                best_score, best_move = score, move
+            beta = min(beta, score)
+        if beta <= alpha:
             break
+    return best_score, best_move
 
-    return best_move
 
+def probcut_cut(position, depth, alpha, beta, maximizing_player, player, deadline, heuristic, cache):
+    """
+    Multi-ProbCut test for a node about to be searched to `depth`.
 
-def choose_move(turn, board, game) -> list:
-    # A copy of the board allows the algo to mutate the board freely without effecting the actual game board.
-    search_game = reversi()
-    search_game.board = board.copy()
+    For each calibrated shallow depth, a null-window search checks whether the predicted
+    deep score  a * shallow + b  is at least CUT_THRESHOLD sigmas above beta (or below alpha).
 
-    legal_moves = get_legal_moves(search_game, turn)
+    Returns:
+        beta or alpha if the node can be cut, otherwise None
+    """
+    if position.empties() < probcut.MIN_EMPTIES:
+        return None
+    fits = probcut.params(heuristic).get((probcut.game_stage(position), depth))
+    if not fits:
+        return None
+
+    probcut.STATS.tries += 1
+    for shallow, a, b, sigma in fits:
+        if a <= 0:
+            continue
+        # The fit is from the side to move's point of view; at min nodes the offset flips sign
+        offset = b if maximizing_player else -b
+        margin = probcut.CUT_THRESHOLD * sigma
+
+        if beta != float('inf'):
+            bound = (beta + margin - offset) / a
+            score, _ = minimax(position, shallow, bound - PROBCUT_EPSILON, bound,
+                               maximizing_player, player, deadline, heuristic, cache)
+            if score >= bound:
+                probcut.STATS.high_cuts += 1
+                verify_cut(position, depth, alpha, beta, maximizing_player, player, deadline, heuristic, True)
+                return beta
+
+        if alpha != float('-inf'):
+            bound = (alpha - margin - offset) / a
+            score, _ = minimax(position, shallow, bound, bound + PROBCUT_EPSILON,
+                               maximizing_player, player, deadline, heuristic, cache)
+            if score <= bound:
+                probcut.STATS.low_cuts += 1
+                verify_cut(position, depth, alpha, beta, maximizing_player, player, deadline, heuristic, False)
+                return alpha
+
+    return None
+
+
+def verify_cut(position, depth, alpha, beta, maximizing_player, player, deadline, heuristic, high):
+    """In verify mode, re-search a cut node at full width and count the cut as wrong if it was."""
+    if not probcut.VERIFY_CUTS:
+        return
+    probcut.USE_PROBCUT = False
+    try:
+        score, _ = minimax(position, depth, alpha, beta, maximizing_player, player, deadline, heuristic)
+    finally:
+        probcut.USE_PROBCUT = True
+    probcut.STATS.verified += 1
+    if (high and score < beta) or (not high and score > alpha):
+        probcut.STATS.wrong += 1
+
+
+# ── Node steps ────────────────────────────────────────────────────────────────
+# The parts of a node shared by minimax and the cooperative search of player_host, which runs
+# the same search as a generator: both call these, so the two cannot drift apart.
+
+def probe_cache(cache, position, depth, alpha, beta, maximizing_player):
+    """
+    Look a node about to be searched to `depth` up in the cache.
 
-    if len(legal_moves) == 0:
-        return [-1, -1]
+    The stored score is from the side to move's point of view and is converted to `player`'s;
+    negating the score also swaps which kind of bound it is.
 
-    x, y = get_best_move(board, search_game, turn, CHOSEN_HEURISTIC)
-    return [x, y]
+    Returns:
+        (key, cached_move, hit): the key to store the node's result under (None if the node is
+        not cached), the best move of an earlier search, and (score, move) if the entry settles
+        the node without a search, else None
+    """
+    if cache is None or depth <= 0:
+        return None, None, None
+    key = position.key()
+    entry = cache.probe(key)
+    if entry is None:
+        return key, None, None
+    cached_depth, flag, score, cached_move = entry
+    if cached_depth >= depth:
+        if not maximizing_player:
+            score = -score
+            flag = {EXACT: EXACT, LOWER: UPPER, UPPER: LOWER}[flag]
+        if flag == EXACT or (flag == LOWER and score >= beta) or (flag == UPPER and score <= alpha):
+            return key, cached_move, (score, cached_move)
+    return key, cached_move, None
+
+
+def order_moves(moves, cached_move=None):
+    """
+    Order moves_with_flips() output for the search.
 
+    Moves are ordered by weight (best squares first) so alpha-beta encounters tighter bounds
+    earlier and prunes more branches; between equally weighted squares the move flipping more
+    discs goes first. The best move from an earlier search of the position is tried first.
 
-def main():
-    game_socket = socket.socket()
-    game_socket.connect(('127.0.0.1', 33333))
-    game = reversi()
+    Returns:
+        (legal_moves, flips): the ordered (x, y) moves and {move: flip mask}
+    """
+    flips = {(x, y): mask for x, y, _, mask in moves}
+    moves.sort(key=lambda m: (WEIGHT_MATRIX[m[0], m[1]], m[2]), reverse=True)
+    legal_moves = [(x, y) for x, y, _, _ in moves]
+    if cached_move in legal_moves:
+        legal_moves.remove(cached_move)
+        legal_moves.insert(0, cached_move)
+    return legal_moves, flips
+
+
+def game_over_score(position, player):
+    """Score for `player` of a position whose side to move has no move: final if the opponent has none either, else None."""
+    if position.mobility(-position.turn) != 0:
+        return None
+    player_count = position.count(player)
+    opponent_count = position.count(-player)
+    if player_count > opponent_count:
+        return 10000 + player_count - opponent_count
+    elif opponent_count > player_count:
+        return -10000 - opponent_count + player_count
+    return 0
+
+
+def store_result(cache, key, depth, score, best_move, alpha, beta, maximizing_player):
+    """Save a completed node to the cache, converted to the side to move's point of view."""
+    if cache is None:
+        return
+    if score <= alpha:
+        flag = UPPER
+    elif score >= beta:
+        flag = LOWER
+    else:
+        flag = EXACT
+    if not maximizing_player:
+        score = -score
+        flag = {EXACT: EXACT, LOWER: UPPER, UPPER: LOWER}[flag]
+    cache.store(key, depth, flag, score, best_move)
+
+
+def search_iter(position, heuristic, cache=None, context=None, deadline=None, node_limit=None):
+    """
+    Anytime search: iterative deepening from `position` for its side to move.
 
-    while True:
+    Yields (depth, move, score, nodes) after every completed depth, until MAX_DEPTH or the
+    deadline (default: TIME_LIMIT from now). `nodes` counts the whole search so far, and the
+    score is from the side to move's point of view. The caller may stop at any point and play
+    the last move it was given.
 
-        #Receive play request from the server
-        #turn : 1 --> you are playing as white | -1 --> you are playing as black
-        #board : 8*8 numpy array
-        data = game_socket.recv(4096)
-        turn, board = pickle.loads(data)
+    With node_limit the search stops after that many nodes instead and the deadline is
+    ignored; with no cache or context its result depends on nothing but the position.
 
-        #Turn = 0 indicates game ended
-        if turn == 0:
-            game_socket.close()
-            return
+    With a SearchContext, its table is used as the cache, and if the game followed the last
+    principal variation the search resumes from the depth already reached on it; the first
+    thing yielded is then that earlier result (its score is None if the table lost it).
+    """
+    global _node_limit, _next_check
+    if node_limit is not None:
+        deadline = float('inf')
+    elif deadline is None:
+        deadline = time.time() + TIME_LIMIT
+    start_nodes = node_count
+    start_depth = 1
+
+    if context is not None:
+        cache = context.table
+        known_depth, predicted = context.resume(position)
+        if known_depth >= 1:
+            start_depth = known_depth + 1
+    completed = start_depth - 1
+
+    try:
+        if completed >= 1:
+            entry = cache.probe(position.key())
+            score = entry[2] if entry is not None and entry[0] >= completed else None
+            yield completed, predicted, score, 0
+
+        for depth in range(start_depth, MAX_DEPTH + 1):
+
+            # try to find best move in given time-limit if time limit is reached. throw exception. return the best move so far
+            # (the limits are set again for every depth since the caller runs between yields)
+            _node_limit = start_nodes + node_limit if node_limit is not None else None
+            _next_check = node_count
+            try:
+                score, move = minimax(position, depth,
+                                      float('-inf'), float('inf'),
+                                      True, position.turn, deadline, heuristic, cache)
+            except TimeUp:
+                # print(f"  time up at depth {depth}, using depth {depth - 1} result")
+                return
+            completed = depth  # only report fully completed searches
+            yield depth, move, score, node_count - start_nodes
+    finally:
+        _node_limit = None
+        _next_check = node_count
+        if context is not None:
+            context.searches.append((start_depth, completed))
+            if completed >= 1:
+                context.remember(position, completed)
+
+
+def get_best_move(position, heuristic, cache=None, context=None, deadline=None, node_limit=None):
+    """Run search_iter to its end and return the deepest completed best move."""
+    best_move = position.legal_moves()[0]  # safe fallback
+    for _, move, _, _ in search_iter(position, heuristic, cache, context, deadline, node_limit):
+        best_move = move
+    return best_move
 
-        #Debug info
-        print(turn)
-        print(board)
 
-        # Find best move via iterative-deepening minimax (4-second limit)
-        game.board = board.copy()
-        legal_moves = get_legal_moves(game, turn)
+def multi_pv(position, depth, heuristic, k=3, played=None, cache=None, deadline=float('inf')):
+    """
+    Multi-PV search: the k best root moves of a depth-`depth` search with exact scores, and the
+    score and rank of the move `played` (if given).
 
-        if len(legal_moves) == 0:
-            x, y = -1, -1
+    `played` is searched first with a full window. Every other move is searched with alpha at
+    the lower of the played score and the k-th best score so far, so a move only fails low
+    when it is neither in the top k nor better than the played move.
+
+    Returns:
+        (lines, played_score, played_rank): lines = [(move, score)] best first, at most k;
+        the scores are from the side to move's point of view and the rank is 1 for the best
+        move (moves scoring the same as the played move do not push it down)
+    """
+    moves = position.moves_with_flips()
+    if not moves:
+        return [], None, None
+    order, flips = order_moves(moves, played)
+
+    exact = {}
+    played_score = None
+    for move in order:
+        if move == played:
+            bound = float('-inf')
         else:
-            best_move = get_best_move(board, game, turn, CHOSEN_HEURISTIC)
-            x, y = best_move
-            print(f"Best move: ({x}, {y})")
+            scores = sorted(exact.values(), reverse=True)
+            bound = scores[k - 1] if len(scores) >= k else float('-inf')
+            if played_score is not None:
+                bound = min(bound, played_score)
+        score, _ = minimax(position.play(move, flips[move]), depth - 1, bound, float('inf'),
+                           False, position.turn, deadline, heuristic, cache)
+        if score > bound or move == played:
+            exact[move] = score
+        if move == played:
+            played_score = score
+
+    lines = sorted(exact.items(), key=lambda item: item[1], reverse=True)[:k]
+    played_rank = None
+    if played_score is not None:
+        played_rank = 1 + sum(score > played_score for move, score in exact.items() if move != played)
+    return lines, played_score, played_rank
+
+
+def multi_pv_search(position, heuristic, k=3, played=None, depth=None, node_limit=None, cache=None):
+    """
+    Iterative deepening multi_pv up to `depth` (default MAX_DEPTH) or until `node_limit` nodes.
 
-        #Send your move to the server. Send (x,y) = (-1,-1) to tell the server you have no hand to play
-        game_socket.send(pickle.dumps([x, y]))
+    Returns:
+        (depth, lines, played_score, played_rank) of the deepest completed depth, or None if
+        not even depth 1 finished within the node limit
+    """
+    global _node_limit, _next_check
+    start_nodes = node_count
+    result = None
+    try:
+        for current in range(1, (depth or MAX_DEPTH) + 1):
+            _node_limit = start_nodes + node_limit if node_limit is not None else None
+            _next_check = node_count
+            try:
+                result = (current,) + multi_pv(position, current, heuristic, k, played, cache)
+            except TimeUp:
+                break
+    finally:
+        _node_limit = None
+        _next_check = node_count
+    return result
+
+
+def choose_move(turn, board, game) -> list:
+    # Position is immutable, so the search never needs its own copy of the game board
+    position = Position.from_board(board, turn)
+
+    if not position.moves():
+        return [-1, -1]
+
+    if NODE_LIMIT is not None:
+        x, y = get_best_move(position, CHOSEN_HEURISTIC, node_limit=NODE_LIMIT)
+        return [x, y]
+
+    x, y = get_best_move(position, CHOSEN_HEURISTIC, get_position_cache(CHOSEN_HEURISTIC),
+                         get_search_context(CHOSEN_HEURISTIC), move_deadline(game, TIME_LIMIT))
+    return [x, y]
+
+
+def main():
+    # The runtime owns the connection and runs choose_move in a worker process, so the server
+    # can interrupt a search ('stop') and reuse this process for several games ('new_game')
+    run_client('minimax_alpha_beta_h_nic')
+
+
+def depth_gain_report(games=2, time_limit=0.5):
+    """
+    Play games against greedy_bfs_player with and without the carried-over search context and
+    print the depth completed per move in each case.
+    """
+    import io
+    import contextlib
+    from reversi_auto_server import AutoGameServer
+    from greedy_bfs_player import choose_move as greedy
+
+    global TIME_LIMIT
+    TIME_LIMIT = time_limit
+    print(f"Depth reached per move, {games} games per colour, {time_limit}s per move\n")
+
+    for carry_over in (False, True):
+        searches = []
+        for game_index in range(games):
+            for colour in (1, -1):
+                context = SearchContext(CHOSEN_HEURISTIC)
+
+                def player(turn, board, game):
+                    position = Position.from_board(board, turn)
+                    if not position.moves():
+                        return [-1, -1]
+                    # Without carry-over every move gets a fresh context, i.e. nothing remembered
+                    move_context = context if carry_over else SearchContext(CHOSEN_HEURISTIC)
+                    move = get_best_move(position, CHOSEN_HEURISTIC, context=move_context)
+                    searches.append(move_context.searches[-1])
+                    return list(move)
+
+                with contextlib.redirect_stdout(io.StringIO()):
+                    if colour == 1:
+                        AutoGameServer(player, greedy).play_game()
+                    else:
+                        AutoGameServer(greedy, player).play_game()
+
+        starts = [start for start, _ in searches]
+        depths = [depth for _, depth in searches]
+        resumed = sum(start > 1 for start in starts)
+        label = 'carried over' if carry_over else 'from scratch'
+        print(f"{label}: {len(searches)} moves, mean depth {sum(depths) / len(depths):.2f}, "
+              f"resumed on the predicted line {resumed} times (mean start depth {sum(starts) / len(starts):.2f})")
+
+
+def leaf_benchmark(count=40, depths=(3, 4, 5)):
+    """
+    Compare per-node and batched leaf evaluation: heuristic throughput on the children of
+    self-play positions, then fixed-depth searches of the same positions in both modes.
+    """
+    global USE_BATCH_LEAVES
+    from probcut import self_play_positions
+    from endgame import random_endgames
+
+    positions = [Position.from_board(board, turn) for board, turn in self_play_positions(count, seed=4)]
+    positions += random_endgames(count // 4, 12, seed=4)
+    batch_heuristic = BATCHED.get(CHOSEN_HEURISTIC)
+
+    children = [[position.play(move) for move in position.legal_moves()] for position in positions]
+    leaves = sum(len(c) for c in children)
+    start = time.perf_counter()
+    for group in children:
+        for child in group:
+            CHOSEN_HEURISTIC(child.board(), positions[0].turn)
+    per_node = time.perf_counter() - start
+    print(f"Children of {len(positions)} positions ({leaves} leaves, {leaves / len(positions):.1f} per call)")
+    if batch_heuristic is None:
+        # Searches in batched mode then score every leaf on its own as well, as batched_leaves is skipped
+        print(f"  per-node {leaves / per_node:9.0f} leaves/s    ({CHOSEN_HEURISTIC.__name__} has no batched version)\n")
+    else:
+        start = time.perf_counter()
+        for group in children:
+            batch_heuristic(stack_boards(group), positions[0].turn)
+        batched = time.perf_counter() - start
+        print(f"  per-node {leaves / per_node:9.0f} leaves/s    batched {leaves / batched:9.0f} leaves/s\n")
+
+    saved = USE_BATCH_LEAVES
+    try:
+        for depth in depths:
+            results = {}
+            for batch in (False, True):
+                USE_BATCH_LEAVES = batch
+                start_nodes = node_count
+                start = time.perf_counter()
+                results[batch] = [minimax(position, depth, float('-inf'), float('inf'), True, position.turn,
+                                          float('inf'), CHOSEN_HEURISTIC) for position in positions]
+                elapsed = time.perf_counter() - start
+                nodes = node_count - start_nodes
+                print(f"depth {depth} {'batched ' if batch else 'per-node'}  {elapsed:6.2f}s  {nodes:7d} nodes  "
+                      f"{nodes / elapsed:7.0f} nodes/s")
+            print(f"  same scores and moves: {results[False] == results[True]}")
+    finally:
+        USE_BATCH_LEAVES = saved
+
+
+def node_benchmark(node_limit=20000, count=40):
+    """
+    Node-limited searches of fixed self-play positions. The digest of the moves, scores and
+    depths is the same on every machine, so two hosts (or two versions of the search) can be
+    compared by it; only the nodes/s differ.
+    """
+    import hashlib
+    from probcut import self_play_positions
+
+    positions = [Position.from_board(board, turn) for board, turn in self_play_positions(count, seed=11)]
+    digest = hashlib.sha256()
+    depths = []
+    start_nodes = node_count
+    start = time.perf_counter()
+    for position in positions:
+        depth, move, score, _ = list(search_iter(position, CHOSEN_HEURISTIC, node_limit=node_limit))[-1]
+        digest.update(repr((depth, move, score)).encode())
+        depths.append(depth)
+    elapsed = time.perf_counter() - start
+    nodes = node_count - start_nodes
+    print(f"{len(positions)} positions, {node_limit} nodes each: mean depth {sum(depths) / len(depths):.2f}, "
+          f"{nodes / elapsed:.0f} nodes/s")
+    print(f"digest {digest.hexdigest()[:16]}")
 
 
 if __name__ == '__main__':
-    main()
+    if sys.argv[1:2] == ['node-bench']:
+        node_benchmark(int(sys.argv[2]) if len(sys.argv) > 2 else 20000)
+    elif sys.argv[1:2] == ['depth-gain']:
+        depth_gain_report()
+    elif sys.argv[1:2] == ['leaf-bench']:
+        leaf_benchmark()
+    else:
+        main()
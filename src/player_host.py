@@ -0,0 +1,507 @@
+import sys
+import time
+import pickle
+import socket
+import selectors
+from types import SimpleNamespace
+from collections import defaultdict
+
+import numpy as np
+
+from player_runtime import HOST, PORT, read_messages
+from utils import move_deadline
+from heuristic_functions import BATCHED
+import batch_engine
+from position import Position, stack_boards
+import minimax_alpha_beta_h_nic as search
+import memory
+
+# One player process for many games at once.
+#
+# With player_runtime every game needs a player process (and a worker process) per side, most
+# of them idle while the server or the other side is busy. A PlayerHost searches the moves of
+# any number of games in one process: each search is a generator (a cooperative task) that
+# yields whenever it needs leaves scored or a node's moves generated. The host answers the
+# requests of every waiting task together, with one batched heuristic call and one vectorized
+# move generation (batch_engine) per round, then resumes them all. The batches are about as
+# many times larger as there are games searching, and the numpy cost per position falls
+# steeply with the batch size.
+#
+# The search is minimax's (same move ordering, memory-only transposition table carried between
+# moves, batched depth-1 nodes), without ProbCut: the cache probe, move ordering, game-over scores
+# and cache stores are minimax's own node steps, only the control flow is a generator here.
+# Under a node limit it plays exactly the moves minimax plays with ProbCut off. Time limits are
+# wall clock (utils.move_deadline, as for every player), and the games share the core, so
+# under load a node limit (--nodes) keeps the strength independent of the number of games.
+#
+#     python3 src/player_host.py connect <games> [--nodes=<n>] [--host=<h>] [--port=<p>]
+#     python3 src/player_host.py bench [games] [--nodes=<n>]
+#
+# `connect` opens one connection per game to the game server(s), each speaking the
+# player_runtime protocol (moves, 'stop', 'ping', 'new_game').
+
+BENCH_NODES = 2000     # node limit per move in the benchmark
+
+# What a search task yields: (SCORES, positions, player) is answered with the heuristic score of
+# each position for `player`, None where the side to move has no move; (MOVES, positions, None)
+# with the moves_with_flips() list of each position
+SCORES = 'scores'
+MOVES = 'moves'
+
+
+# ── Search tasks ──────────────────────────────────────────────────────────────
+
+class Budget:
+    """Node count and limits of one move's search; mirrors minimax.check_limits."""
+
+    __slots__ = ('nodes', 'node_limit', 'deadline', 'stopped', 'next_check')
+
+    def __init__(self, node_limit=None, deadline=float('inf')):
+        self.nodes = 0
+        self.node_limit = node_limit
+        self.deadline = deadline
+        self.stopped = False
+        self.next_check = 0
+
+    def check(self):
+        if self.node_limit is not None and self.nodes >= self.node_limit:
+            raise search.TimeUp()
+        if self.stopped or time.time() >= self.deadline:
+            raise search.TimeUp()
+        self.next_check = self.nodes + search.CHECK_INTERVAL
+        if self.node_limit is not None:
+            self.next_check = min(self.next_check, self.node_limit)
+
+
+def minimax_task(position, depth, alpha, beta, maximizing_player, player, budget, cache):
+    """
+    minimax as a generator, yielding SCORES and MOVES requests instead of calling the heuristic
+    and the move generator. Returns (score, best_move) like minimax.
+    """
+    budget.nodes += 1
+    if budget.nodes >= budget.next_check:
+        budget.check()
+
+    key, cached_move, hit = search.probe_cache(cache, position, depth, alpha, beta, maximizing_player)
+    if hit is not None:
+        return hit
+
+    if depth <= 0:
+        # Whether the side to move has a move is found out along with the score
+        scores = yield SCORES, [position], player
+        if scores[0] is not None:
+            return scores[0], None
+
+    legal_moves, flips = search.order_moves((yield MOVES, [position], None)[0], cached_move)
+
+    if not legal_moves:
+        final_score = search.game_over_score(position, player)
+        if final_score is not None:
+            return final_score, None
+        return (yield from minimax_task(position.play(None), depth - 1, alpha, beta,
+                                        not maximizing_player, player, budget, cache))
+
+    original_alpha, original_beta = alpha, beta
+    best_score = float('-inf') if maximizing_player else float('inf')
+    best_move = legal_moves[0]
+    if depth == 1:
+        best_score, best_move = yield from _leaves_task(position, legal_moves, flips, alpha, beta,
+                                                        maximizing_player, player, budget, cache)
+    else:
+        for move in legal_moves:
+            score, _ = yield from minimax_task(position.play(move, flips[move]), depth - 1, alpha, beta,
+                                               not maximizing_player, player, budget, cache)
+            if maximizing_player:
+                if score > best_score:
+                    best_score, best_move = score, move
+                alpha = max(alpha, score)
+            else:
+                if score < best_score:
+                    best_score, best_move = score, move
+                beta = min(beta, score)
+            if beta <= alpha:
+                break
+
+    search.store_result(cache, key, depth, best_score, best_move, original_alpha, original_beta, maximizing_player)
+    return best_score, best_move
+
+
+def _leaves_task(position, legal_moves, flips, alpha, beta, maximizing_player, player, budget, cache):
+    """
+    minimax.batched_leaves as a generator: the first child alone, then every remaining child in
+    one request. Children without a move (pass or game over) are searched on, as in minimax.
+    """
+    best_score = float('-inf') if maximizing_player else float('inf')
+    best_move = legal_moves[0]
+    children = [position.play(move, flips[move]) for move in legal_moves]
+    scores = mobile = None
+    counted = False
+    for index, (move, child) in enumerate(zip(legal_moves, children)):
+        if index > 0 and scores is None:
+            # The first child often cuts on its own; past it, ask for every remaining leaf at once
+            scores = [None] * index + (yield SCORES, children[index:], player)
+            mobile = [score is not None for score in scores]
+        if index == 0 or not mobile[index]:
+            score, _ = yield from minimax_task(child, 0, alpha, beta, not maximizing_player, player, budget, cache)
+        else:
+            if not counted:
+                # Counted where batched_leaves counts them, so node-limited searches stop at the same node
+                budget.nodes += sum(mobile[index:])
+                counted = True
+            score = scores[index]
+        if maximizing_player:
+            if score > best_score:
+                best_score, best_move = score, move
+            alpha = max(alpha, score)
+        else:
+            if score < best_score:
+                best_score, best_move = score, move
+            beta = min(beta, score)
+        if beta <= alpha:
+            break
+    return best_score, best_move
+
+
+def move_task(position, context, budget):
+    """Iterative deepening of one move (as search.search_iter); returns the deepest completed move."""
+    best_move = position.legal_moves()[0]
+    start_depth = 1
+    known_depth, predicted = context.resume(position)
+    if known_depth >= 1:
+        start_depth, best_move = known_depth + 1, predicted
+    completed = start_depth - 1
+    try:
+        for depth in range(start_depth, search.MAX_DEPTH + 1):
+            budget.next_check = budget.nodes
+            try:
+                _, best_move = yield from minimax_task(position, depth, float('-inf'), float('inf'), True,
+                                                       position.turn, budget, context.table)
+            except search.TimeUp:
+                break
+            completed = depth
+    finally:
+        context.searches.append((start_depth, completed))
+        if completed >= 1:
+            context.remember(position, completed)
+    return best_move
+
+
+def _bitboards(positions):
+    """(own, opponent) uint64 arrays of the side to move of each position."""
+    own = np.array([p.white if p.turn == 1 else p.black for p in positions], dtype=np.uint64)
+    opponent = np.array([p.black if p.turn == 1 else p.white for p in positions], dtype=np.uint64)
+    return own, opponent
+
+
+def moves_with_flips(positions):
+    """Position.moves_with_flips() of every position, worked out for all of them at once."""
+    own, opponent = _bitboards(positions)
+    rows, squares = np.nonzero(batch_engine.from_bitboard(batch_engine.move_bitboards(own, opponent)))
+    flips = batch_engine.flip_bitboards(own[rows], opponent[rows], squares).tolist()
+    result = [[] for _ in positions]
+    for row, square, mask in zip(rows.tolist(), squares.tolist(), flips):
+        result[row].append((square >> 3, square & 7, mask.bit_count(), mask))
+    return result
+
+
+# ── Host ──────────────────────────────────────────────────────────────────────
+
+class _Task:
+    __slots__ = ('generator', 'budget', 'request')
+
+    def __init__(self, generator, budget):
+        self.generator = generator
+        self.budget = budget
+        self.request = None
+
+
+class PlayerHost:
+    """
+    Searches the moves of many games in one process, pooling their leaf evaluations.
+
+    Games are identified by any hashable (one per seat: a host playing both sides of a game
+    uses two ids). Each keeps its own search context from move to move.
+
+    Args:
+        heuristic:  heuristic function (default minimax's CHOSEN_HEURISTIC)
+        node_limit: nodes per move, or None to search until the deadline
+        time_limit: seconds per move (default minimax's TIME_LIMIT); as for every player, a
+                    server time limit in the request caps it (utils.move_deadline)
+    """
+
+    def __init__(self, heuristic=None, node_limit=None, time_limit=None):
+        self.heuristic = heuristic or search.CHOSEN_HEURISTIC
+        self.batch_heuristic = BATCHED.get(self.heuristic)
+        self.node_limit = node_limit
+        self.time_limit = time_limit or search.TIME_LIMIT
+        self.tasks = {}
+        self.contexts = {}
+        self.batches = 0     # heuristic calls made
+        # Seconds a round of step() takes (the longest of the recent ones): a timed search is
+        # ended when the next round would end past its deadline, since it only checks the
+        # clock between rounds
+        self.round_seconds = 0.0
+        self.leaves = 0      # positions evaluated by them
+        memory.register('player_host', self.memory_bytes, self.shrink)
+
+    def context(self, game):
+        if game not in self.contexts:
+            self.contexts[game] = search.SearchContext(self.heuristic)
+        return self.contexts[game]
+
+    def start(self, game, turn, board, seconds=None):
+        """
+        Start searching a move for `game`. Returns the move at once if there is nothing to
+        search (a pass), else None: the move comes out of step() later.
+        """
+        position = Position.from_board(board, turn)
+        if not position.moves():
+            return [-1, -1]
+        if self.node_limit is not None:
+            budget = Budget(self.node_limit)
+        else:
+            request = SimpleNamespace(deadline=time.time() + seconds if seconds is not None else None)
+            budget = Budget(deadline=move_deadline(request, self.time_limit))
+        task = _Task(move_task(position, self.context(game), budget), budget)
+        self.tasks[game] = task
+        move = self._resume(game, task, None)
+        return list(move) if move is not None else None
+
+    def stop(self, game):
+        """Make the search of `game` return the best move found so far, at its next check."""
+        if game in self.tasks:
+            self.tasks[game].budget.stopped = True
+            self.tasks[game].budget.next_check = 0
+
+    def new_game(self, game):
+        """Forget the last principal variation of `game` (its table is kept)."""
+        context = self.context(game)
+        context.line, context.pv, context.depth = [], [], 0
+
+    def forget(self, game):
+        self.tasks.pop(game, None)
+        self.contexts.pop(game, None)
+
+    def memory_bytes(self):
+        return sum(context.table.memory_bytes() for context in self.contexts.values())
+
+    def shrink(self, fraction):
+        for context in self.contexts.values():
+            context.table.shrink(fraction)
+
+    def step(self):
+        """
+        Answer the waiting requests of every task, one batch per kind of request, and resume the tasks.
+
+        Returns:
+            {game: move} for the searches that finished
+        """
+        start = time.time()
+        finished = {}
+        for game, task in list(self.tasks.items()):
+            if start + self.round_seconds >= task.budget.deadline:
+                # Another round would end past the deadline: end the search where it waits
+                finished[game] = list(self._resume(game, task, None, search.TimeUp()))
+
+        waiting = list(self.tasks.items())
+        answers = {}
+        for kind in (SCORES, MOVES):
+            requests = [(game, task.request) for game, task in waiting if task.request[0] == kind]
+            if not requests:
+                continue
+            positions = [position for _, (_, batch, _) in requests for position in batch]
+            if kind == SCORES:
+                players = [player for _, (_, batch, player) in requests for _ in batch]
+                results = self._scores(positions, players)
+            else:
+                results = moves_with_flips(positions)
+            used = 0
+            for game, (_, batch, _) in requests:
+                answers[game] = results[used:used + len(batch)]
+                used += len(batch)
+
+        for game, task in waiting:
+            move = self._resume(game, task, answers[game])
+            if move is not None:
+                finished[game] = list(move)
+        self.round_seconds = max(time.time() - start, 0.9 * self.round_seconds)
+        return finished
+
+    def _scores(self, positions, players):
+        own, opponent = _bitboards(positions)
+        mobile = np.flatnonzero(batch_engine.move_bitboards(own, opponent)).tolist()
+        scores = [None] * len(positions)
+        if not mobile:
+            return scores
+        self.batches += 1
+        self.leaves += len(mobile)
+        if self.batch_heuristic is not None:
+            # The heuristic tells the sides apart only by `player`, so the boards of both sides
+            # go in one call: each board from its player's side (board * player) scored for 1
+            sides = np.array([players[i] for i in mobile], dtype=float)[:, None, None]
+            values = self.batch_heuristic(stack_boards([positions[i] for i in mobile]) * sides, 1).tolist()
+        else:
+            values = [self.heuristic(positions[i].board(), players[i]) for i in mobile]
+        for i, value in zip(mobile, values):
+            scores[i] = value
+        return scores
+
+    def _resume(self, game, task, scores, error=None):
+        # Run the task to its next request (or raise `error` where it waits); returns its move
+        # if the search ended instead
+        try:
+            if error is not None:
+                task.request = task.generator.throw(error)
+            else:
+                task.request = task.generator.send(scores)
+        except StopIteration as done:
+            del self.tasks[game]
+            return done.value
+        return None
+
+
+# ── Connections ───────────────────────────────────────────────────────────────
+
+def connect(games, node_limit=None, host=HOST, port=PORT):
+    """
+    Open `games` connections to the game server and play on all of them from this process,
+    until the server has closed every one.
+    """
+    player_host = PlayerHost(node_limit=node_limit)
+    selector = selectors.DefaultSelector()
+    buffers = {}
+    for _ in range(games):
+        sock = socket.create_connection((host, port))
+        selector.register(sock, selectors.EVENT_READ)
+        buffers[sock] = b''
+
+    def handle(sock, message):
+        if message[0] == 'stop':
+            player_host.stop(sock)
+        elif message[0] == 'ping':
+            sock.send(pickle.dumps(['pong']))
+        elif message[0] in ('new_game', 0):
+            player_host.new_game(sock)
+        else:
+            move = player_host.start(sock, message[0], message[1], message[2] if len(message) > 2 else None)
+            if move is not None:
+                sock.send(pickle.dumps(move))
+
+    try:
+        while buffers:
+            # Poll the connections between batches; block only when no search is running
+            for key, _ in selector.select(timeout=0 if player_host.tasks else None):
+                sock = key.fileobj
+                data = sock.recv(4096)
+                if not data:
+                    selector.unregister(sock)
+                    sock.close()
+                    del buffers[sock]
+                    player_host.forget(sock)
+                    continue
+                messages, buffers[sock] = read_messages(buffers[sock] + data)
+                for message in messages:
+                    handle(sock, message)
+            finished = player_host.step()
+            for sock, move in finished.items():
+                if sock in buffers:
+                    sock.send(pickle.dumps(move))
+            if finished:
+                memory.after_move('player_host')
+    finally:
+        for sock in buffers:
+            sock.close()
+        selector.close()
+
+
+# ── Benchmark ─────────────────────────────────────────────────────────────────
+
+def _self_play(openings, choose):
+    """
+    Play every opening to the end, both sides chosen by choose(moves_wanted) -> moves, which is
+    given {(game, side): position} for every game waiting for a move. Returns the moves played.
+    """
+    positions = dict(enumerate(openings))
+    played = defaultdict(list)
+    while positions:
+        wanted = {}
+        for game, position in list(positions.items()):
+            while not position.moves() and not position.is_game_over():
+                position = position.play(None)
+            if position.is_game_over():
+                del positions[game]
+                continue
+            positions[game] = position
+            wanted[(game, position.turn)] = position
+        for (game, _), move in choose(wanted).items():
+            played[game].append(move)
+            positions[game] = positions[game].play(move)
+    return dict(played)
+
+
+def benchmark(games=32, node_limit=BENCH_NODES):
+    """
+    Self-play the same openings twice at `node_limit` nodes per move: one game after another
+    with minimax (what a process per game does, per core), then all at once on a PlayerHost.
+    """
+    import probcut
+    from batch_simulator import random_openings
+
+    probcut.USE_PROBCUT = False   # the host searches full width
+    boards, pieces = random_openings(games, 6, seed=5)
+    openings = [Position.from_board(board, int(piece)) for board, piece in zip(boards, pieces)]
+
+    contexts = {}
+
+    def one_at_a_time(wanted):
+        moves = {}
+        for seat, position in wanted.items():
+            context = contexts.setdefault(seat, search.SearchContext(search.CHOSEN_HEURISTIC))
+            moves[seat] = tuple(search.get_best_move(position, search.CHOSEN_HEURISTIC, context=context,
+                                                     node_limit=node_limit))
+        return moves
+
+    player_host = PlayerHost(node_limit=node_limit)
+
+    def hosted(wanted):
+        moves = {}
+        for seat, position in wanted.items():
+            move = player_host.start(seat, position.turn, position.board())
+            if move is not None:
+                moves[seat] = tuple(move)
+        while player_host.tasks:
+            moves.update((seat, tuple(move)) for seat, move in player_host.step().items())
+        return moves
+
+    print(f"{len(openings)} self-play games, {node_limit} nodes per move\n")
+    results = {}
+    for label, choose in (('one game at a time', one_at_a_time), ('player host', hosted)):
+        start = time.perf_counter()
+        results[label] = _self_play(openings, choose)
+        elapsed = time.perf_counter() - start
+        moves = sum(len(m) for m in results[label].values())
+        print(f"{label:<20} {elapsed:7.1f}s  {moves / elapsed:6.1f} moves/s  "
+              f"{len(openings) * 3600 / elapsed:7.0f} games/hour")
+    print(f"\nhost batches: {player_host.batches}, {player_host.leaves / max(player_host.batches, 1):.1f} "
+          f"leaves per heuristic call")
+    print(f"same moves: {results['one game at a time'] == results['player host']}")
+
+
+def _option(name, default=None):
+    for arg in sys.argv[2:]:
+        if arg.startswith(f'--{name}='):
+            return arg.split('=', 1)[1]
+    return default
+
+
+if __name__ == '__main__':
+    count = [arg for arg in sys.argv[2:] if not arg.startswith('--')]
+    nodes = _option('nodes')
+    if sys.argv[1:2] == ['connect'] and count:
+        connect(int(count[0]), int(nodes) if nodes else search.NODE_LIMIT,
+                _option('host', HOST), int(_option('port', PORT)))
+    elif sys.argv[1:2] == ['bench']:
+        benchmark(int(count[0]) if count else 32, int(nodes) if nodes else BENCH_NODES)
+    else:
+        print("usage: python3 src/player_host.py connect <games> [--nodes=<n>] [--host=<h>] [--port=<p>]\n"
+              "       python3 src/player_host.py bench [games] [--nodes=<n>]")
@@ -0,0 +1,254 @@
+import io
+import sys
+import time
+import pickle
+import socket
+import importlib
+import multiprocessing as mp
+from multiprocessing.connection import wait
+
+from reversi import reversi
+from utils import set_stop_flag
+import memory
+
+# Client runtime shared by the player scripts.
+#
+# The runtime owns the server connection and runs the player's choose_move in a worker
+# process, so the connection stays responsive while the player thinks. Besides the usual
+# play requests ([turn, board] or [turn, board, seconds], turn 0 = game over) the server
+# may send three control messages:
+#
+#   ['stop']      answer the current request now with the best move found so far
+#   ['new_game']  a new game starts on this connection (the player's new_game() hook is called)
+#   ['ping']      answered with ['pong'], even in the middle of a search
+#
+# The worker and its imports live as long as the connection, so a server can play many
+# games with one player process (see RemotePlayer below and `serve`).
+#
+#     python3 src/player_runtime.py minimax_alpha_beta_h_nic          connect a player
+#     python3 src/player_runtime.py serve [games] [--move-time=<s>]   play games between two connected players
+
+HOST = '127.0.0.1'
+PORT = 33333
+STOP_LEAD = 0.05   # RemotePlayer sends 'stop' this long before the deadline
+
+
+# ── Message framing ───────────────────────────────────────────────────────────
+
+def read_messages(buffer):
+    """
+    Split received bytes into complete pickled messages (a recv may hold several, or part of one).
+
+    Returns:
+        (messages, leftover bytes of an incomplete message)
+    """
+    stream = io.BytesIO(buffer)
+    messages = []
+    used = 0
+    while used < len(buffer):
+        try:
+            messages.append(pickle.load(stream))
+        except (EOFError, pickle.UnpicklingError):
+            break
+        used = stream.tell()
+    return messages, buffer[used:]
+
+
+# ── Worker process ────────────────────────────────────────────────────────────
+
+def _worker(module_name, conn, stop):
+    """Import the player and answer ('play', turn, board, deadline) / ('new_game',) / ('quit',) jobs."""
+    set_stop_flag(stop)
+    player = importlib.import_module(module_name)
+    choose_move = player.choose_move
+    game = reversi()
+    while True:
+        job = conn.recv()
+        if job[0] == 'quit':
+            return
+        if job[0] == 'new_game':
+            game = reversi()
+            if hasattr(player, 'new_game'):
+                player.new_game()
+            continue
+        _, turn, board, deadline = job
+        game.deadline = deadline
+        memory.before_move()
+        start = time.perf_counter()
+        move = choose_move(turn, board, game)
+        conn.send(move)
+        # After the answer is sent, so the memory budget is never paid for on the clock
+        memory.after_move(module_name, time.perf_counter() - start)
+
+
+class PlayerRuntime:
+    """
+    Connection to a game server for the player in module `module_name`.
+
+    The worker process is started once and reused for every move and game on the connection.
+    """
+
+    def __init__(self, module_name, host=HOST, port=PORT):
+        self.module_name = module_name
+        self.host = host
+        self.port = port
+        self.stop = mp.Value('b', 0, lock=False)
+        self.conn, worker_conn = mp.Pipe()
+        # Not a daemon: players such as lazy_smp_player start processes of their own
+        self.worker = mp.Process(target=_worker, args=(module_name, worker_conn, self.stop))
+        self.worker.start()
+        self.thinking = False
+
+    def run(self):
+        """Serve requests until the server closes the connection."""
+        game_socket = socket.socket()
+        game_socket.connect((self.host, self.port))
+        buffer = b''
+        try:
+            while True:
+                ready = wait([game_socket, self.conn])
+                if self.conn in ready:
+                    move = self.conn.recv()
+                    self.thinking = False
+                    game_socket.send(pickle.dumps(move))
+                if game_socket in ready:
+                    data = game_socket.recv(4096)
+                    if not data:
+                        return
+                    messages, buffer = read_messages(buffer + data)
+                    for message in messages:
+                        self.handle(message, game_socket)
+        finally:
+            game_socket.close()
+            self.close()
+
+    def handle(self, message, game_socket):
+        if message[0] == 'stop':
+            if self.thinking:
+                self.stop.value = 1
+        elif message[0] == 'ping':
+            game_socket.send(pickle.dumps(['pong']))
+        elif message[0] == 'new_game':
+            self.conn.send(('new_game',))
+        elif message[0] == 0:
+            # Game over; the connection stays open in case the server starts another game
+            self.conn.send(('new_game',))
+        else:
+            turn, board = message[0], message[1]
+            deadline = time.time() + message[2] if len(message) > 2 else None
+            self.stop.value = 0
+            self.thinking = True
+            self.conn.send(('play', turn, board, deadline))
+
+    def close(self):
+        if self.worker.is_alive():
+            self.conn.send(('quit',))
+            self.worker.join(timeout=5)
+            if self.worker.is_alive():
+                self.worker.terminate()
+
+
+def run_client(module_name, host=HOST, port=PORT):
+    """Entry point for the player scripts' main(): connect and play until the server hangs up."""
+    PlayerRuntime(module_name, host, port).run()
+
+
+# ── Server side ───────────────────────────────────────────────────────────────
+
+class RemotePlayer:
+    """
+    A connected PlayerRuntime as a choose_move callable for AutoGameServer.
+
+    If the server set game.deadline, 'stop' is sent shortly before it so the answer arrives in time.
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.buffer = b''
+        self.pending = []
+        self.__module__ = 'remote'
+
+    def _receive(self, timeout=None):
+        while not self.pending:
+            self.connection.settimeout(timeout)
+            try:
+                data = self.connection.recv(4096)
+            except socket.timeout:
+                return None
+            finally:
+                self.connection.settimeout(None)
+            if not data:
+                raise ConnectionError('player disconnected')
+            messages, self.buffer = read_messages(self.buffer + data)
+            self.pending.extend(messages)
+        return self.pending.pop(0)
+
+    def __call__(self, turn, board, game):
+        deadline = getattr(game, 'deadline', None)
+        request = [turn, board] if deadline is None else [turn, board, deadline - time.time()]
+        self.connection.send(pickle.dumps(request))
+        if deadline is not None:
+            move = self._receive(max(deadline - STOP_LEAD - time.time(), 0.001))
+            if move is not None:
+                return move
+            self.connection.send(pickle.dumps(['stop']))
+        return self._receive()
+
+    def ping(self):
+        """Round-trip time in seconds (the player answers even while searching)."""
+        start = time.time()
+        self.connection.send(pickle.dumps(['ping']))
+        reply = self._receive()
+        assert reply == ['pong'], reply
+        return time.time() - start
+
+    def new_game(self):
+        self.connection.send(pickle.dumps(['new_game']))
+
+    def close(self):
+        self.connection.close()
+
+
+def serve(games=10, move_time=None, host=HOST, port=PORT):
+    """Accept two players and play `games` games between them, swapping colours every game."""
+    from reversi_auto_server import AutoGameServer
+
+    server_socket = socket.socket()
+    server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server_socket.bind((host, port))
+    server_socket.listen()
+    print(f"Waiting for two players on {host}:{port}...")
+    players = [RemotePlayer(server_socket.accept()[0]) for _ in range(2)]
+
+    wins = [0, 0]
+    overruns = [0, 0]
+    start = time.time()
+    for index in range(games):
+        white, black = (0, 1) if index % 2 == 0 else (1, 0)
+        for player in players:
+            player.new_game()
+        game_server = AutoGameServer(players[white], players[black], move_time=move_time)
+        result = game_server.play_game()
+        for _, turn, _ in game_server.overruns:
+            overruns[white if turn == 1 else black] += 1
+        if result == 1:
+            wins[white] += 1
+        elif result == -1:
+            wins[black] += 1
+    print(f"{games} games in {time.time() - start:.1f}s: player 1 won {wins[0]}, player 2 won {wins[1]}, "
+          f"{games - sum(wins)} draws, overruns {overruns[0]} / {overruns[1]}")
+
+    for player in players:
+        player.close()
+    server_socket.close()
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['serve']:
+        from utils import parse_move_time
+        count = [arg for arg in sys.argv[2:] if not arg.startswith('--')]
+        serve(int(count[0]) if count else 10, parse_move_time(sys.argv[2:]))
+    elif len(sys.argv) > 1:
+        run_client(sys.argv[1])
+    else:
+        print("usage: python3 src/player_runtime.py <player module> | serve [games] [--move-time=<seconds>]")
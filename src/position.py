@@ -0,0 +1,190 @@
+import numpy as np
+
+# Immutable game position.
+#
+# reversi.step changes game.board in place and the game object is shared between the
+# server and the players, so every layer used to copy the board before touching it.
+# A Position never changes: play() returns a new Position and leaves the old one as it
+# was, so it can be handed around, cached and used as a dict key without copying.
+#
+# The board is stored as two 64-bit integers (bit x * 8 + y set for each white / black
+# disc) plus the side to move. The bit layout is the same as batch_engine's bitboards and
+# position_cache's keys, so Position.key() can be used with the position store directly.
+
+FULL = (1 << 64) - 1
+NOT_COL_0 = 0xFEFEFEFEFEFEFEFE
+NOT_COL_7 = 0x7F7F7F7F7F7F7F7F
+
+# (shift amount, mask applied after shifting) for each of the 8 directions
+SHIFTS = []
+for _dx, _dy in [(1, 1), (1, 0), (1, -1), (0, 1), (0, -1), (-1, 1), (-1, 0), (-1, -1)]:
+    _mask = NOT_COL_0 if _dy == 1 else NOT_COL_7 if _dy == -1 else FULL
+    SHIFTS.append((_dx * 8 + _dy, _mask))
+
+
+def _shift(bits, amount, mask):
+    if amount > 0:
+        return (bits << amount) & mask & FULL
+    return (bits >> -amount) & mask
+
+
+def _bits(board, piece):
+    return int.from_bytes(np.packbits(np.asarray(board).ravel() == piece, bitorder='little').tobytes(), 'little')
+
+
+def move_bits(own, opponent):
+    """Bitboard of the legal moves for `own` against `opponent`."""
+    empty = ~(own | opponent) & FULL
+    moves = 0
+    for amount, mask in SHIFTS:
+        run = _shift(own, amount, mask) & opponent
+        for _ in range(5):
+            run |= _shift(run, amount, mask) & opponent
+        moves |= _shift(run, amount, mask) & empty
+    return moves
+
+
+def flip_bits(own, opponent, square):
+    """Bitboard of the discs flipped when `own` plays on `square` (0 if the move is illegal)."""
+    start = 1 << square
+    flips = 0
+    for amount, mask in SHIFTS:
+        run = 0
+        cursor = _shift(start, amount, mask)
+        while cursor & opponent:
+            run |= cursor
+            cursor = _shift(cursor, amount, mask)
+        if cursor & own:
+            flips |= run
+    return flips
+
+
+def stack_boards(positions):
+    """(N, 8, 8) float array of the boards of several positions, built in one go."""
+    squares = np.arange(64, dtype=np.uint64)
+    white = (np.array([p.white for p in positions], dtype=np.uint64)[:, None] >> squares) & np.uint64(1)
+    black = (np.array([p.black for p in positions], dtype=np.uint64)[:, None] >> squares) & np.uint64(1)
+    return (white.astype(float) - black.astype(float)).reshape(-1, 8, 8)
+
+
+class Position:
+    """
+    Immutable, hashable position: white and black bitboards plus the side to move (1 or -1).
+    """
+
+    __slots__ = ('white', 'black', 'turn')
+
+    def __init__(self, white, black, turn):
+        object.__setattr__(self, 'white', white)
+        object.__setattr__(self, 'black', black)
+        object.__setattr__(self, 'turn', turn)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('Position is immutable, use play() to get a new one')
+
+    def __reduce__(self):
+        return Position, (self.white, self.black, self.turn)
+
+    @classmethod
+    def from_board(cls, board, turn):
+        """Position of a reversi board array with `turn` to move."""
+        return cls(_bits(board, 1), _bits(board, -1), int(turn))
+
+    @classmethod
+    def initial(cls):
+        # Same start as reversi(): white on (3,3) and (4,4), black on (3,4) and (4,3), white to move
+        return cls((1 << 27) | (1 << 36), (1 << 28) | (1 << 35), 1)
+
+    def key(self):
+        """(white, black, turn), the key format of position_cache."""
+        return self.white, self.black, self.turn
+
+    def __eq__(self, other):
+        return isinstance(other, Position) and self.key() == other.key()
+
+    def __hash__(self):
+        return hash(self.key())
+
+    def __repr__(self):
+        return f'Position(white={self.white:#018x}, black={self.black:#018x}, turn={self.turn})'
+
+    def own_and_opponent(self):
+        if self.turn == 1:
+            return self.white, self.black
+        return self.black, self.white
+
+    def board(self):
+        """The position as a fresh 8x8 reversi board array (1 = white, -1 = black)."""
+        squares = np.arange(64, dtype=np.uint64)
+        white = (np.uint64(self.white) >> squares) & np.uint64(1)
+        black = (np.uint64(self.black) >> squares) & np.uint64(1)
+        return (white.astype(float) - black.astype(float)).reshape(8, 8)
+
+    def moves(self):
+        """Legal moves of the side to move, as a bitboard."""
+        return move_bits(*self.own_and_opponent())
+
+    def legal_moves(self):
+        """Legal moves of the side to move as (x, y) tuples, in the same order as utils.get_legal_moves."""
+        moves = self.moves()
+        result = []
+        while moves:
+            low = moves & -moves
+            result.append(divmod(low.bit_length() - 1, 8))
+            moves ^= low
+        return result
+
+    def moves_with_flips(self):
+        """
+        Every legal move of the side to move with the discs it flips.
+
+        Returns:
+            [(x, y, flip count, flip bitboard)] in the same order as legal_moves()
+        """
+        own, opponent = self.own_and_opponent()
+        moves = move_bits(own, opponent)
+        result = []
+        while moves:
+            low = moves & -moves
+            square = low.bit_length() - 1
+            flips = flip_bits(own, opponent, square)
+            result.append((square // 8, square % 8, flips.bit_count(), flips))
+            moves ^= low
+        return result
+
+    def mobility(self, piece=None):
+        """Number of legal moves for `piece` (default: the side to move)."""
+        own, opponent = self.own_and_opponent()
+        if piece is not None and piece != self.turn:
+            own, opponent = opponent, own
+        return move_bits(own, opponent).bit_count()
+
+    def play(self, move, flips=None):
+        """
+        Return the position after the side to move plays `move` ((x, y), or None to pass).
+
+        `flips` may be the flip bitboard from moves_with_flips(), which saves working it out
+        again. Raises ValueError for an illegal move.
+        """
+        if move is None:
+            return Position(self.white, self.black, -self.turn)
+        square = move[0] * 8 + move[1]
+        own, opponent = self.own_and_opponent()
+        if flips is None:
+            flips = flip_bits(own, opponent, square) if not (own | opponent) >> square & 1 else 0
+        if not flips:
+            raise ValueError(f'illegal move {move} for {self.turn}')
+        own |= flips | (1 << square)
+        opponent &= ~flips
+        if self.turn == 1:
+            return Position(own, opponent, -1)
+        return Position(opponent, own, 1)
+
+    def count(self, piece):
+        return (self.white if piece == 1 else self.black).bit_count()
+
+    def empties(self):
+        return 64 - (self.white | self.black).bit_count()
+
+    def is_game_over(self):
+        return not self.moves() and not move_bits(*reversed(self.own_and_opponent()))
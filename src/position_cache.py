@@ -0,0 +1,307 @@
+import os
+import time
+import fcntl
+import queue
+import atexit
+import threading
+import contextlib
+import numpy as np
+
+import memory
+
+# Persistent position store shared across games (and across runs).
+#
+# Every searched position is keyed by (white bitboard, black bitboard, side to move)
+# and maps to the deepest result found for it: (depth, bound flag, score, best move).
+# Scores are stored from the point of view of the side to move so the same entry can
+# be used no matter which colour the searching player is.
+#
+# On disk the store is a small header followed by fixed-size records. The file is
+# mapped with np.memmap when the store is opened, new results are appended by a
+# background thread so the search never waits on disk, and the file is compacted
+# (size cap + age/depth eviction) when it grows past its limit.
+#
+# Several processes may share one file (match_runner workers). Appends and compactions take an
+# exclusive flock on <path>.lock and loads a shared one; compaction merges what is on disk with
+# what is in memory so records appended by other processes survive. Records that cannot be valid
+# (a torn or misaligned file) are skipped on load, and the file is rewritten without them.
+
+FILE_MAGIC = b'RVSC'
+FILE_VERSION = 1
+HEADER_SIZE = 16
+
+# Bound flags, same meaning as in any transposition table
+EXACT = 0
+LOWER = 1   # true score >= stored score (search failed high)
+UPPER = 2   # true score <= stored score (search failed low)
+
+NO_MOVE = 255
+
+RECORD_DTYPE = np.dtype([
+    ('white', '<u8'),
+    ('black', '<u8'),
+    ('side',  'i1'),
+    ('depth', 'i1'),
+    ('flag',  'i1'),
+    ('move',  'u1'),
+    ('stamp', '<u4'),   # unix time of the store, used for age eviction
+    ('score', '<f8'),
+])
+
+DEFAULT_MAX_ENTRIES = 200_000
+DEFAULT_MAX_AGE = 30 * 24 * 3600       # seconds; older entries are dropped on compaction
+DEFAULT_PERSIST_MIN_DEPTH = 3          # shallow results are cheap to redo, keep them in memory only
+COMPACT_SLACK = 1.5                    # compact once the file holds this many times max_entries
+
+
+def board_key(board, piece):
+    """Return the hashable key (white_bits, black_bits, side) of a board with `piece` to move."""
+    white = int.from_bytes(np.packbits(board.ravel() == 1, bitorder='little').tobytes(), 'little')
+    black = int.from_bytes(np.packbits(board.ravel() == -1, bitorder='little').tobytes(), 'little')
+    return white, black, int(piece)
+
+
+def encode_move(move):
+    return NO_MOVE if move is None else move[0] * 8 + move[1]
+
+
+def decode_move(code):
+    return None if code == NO_MOVE else (code // 8, code % 8)
+
+
+class PositionStore:
+    """
+    hash -> (depth, flag, score, best move) store backed by an append-only record file.
+
+    Args:
+        path:              file the store is loaded from and written to (None = memory only)
+        max_entries:       size cap, both in memory and on disk after compaction
+        max_age:           entries older than this many seconds are evicted on compaction
+        persist_min_depth: only results searched at least this deep are written to disk
+    """
+
+    def __init__(self, path, max_entries=DEFAULT_MAX_ENTRIES, max_age=DEFAULT_MAX_AGE,
+                 persist_min_depth=DEFAULT_PERSIST_MIN_DEPTH):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.persist_min_depth = persist_min_depth
+
+        self.entries = {}
+        self.file_records = 0
+        self.hits = 0
+        self.probes = 0
+
+        self._pending = queue.Queue()
+        self._writer = None
+        self._lock = threading.Lock()
+
+        if path is not None:
+            self._load()
+            atexit.register(self.close)
+
+    # ── Loading ───────────────────────────────────────────────────────────────
+
+    @contextlib.contextmanager
+    def _file_lock(self, exclusive=True):
+        """Hold the lock shared by every process using this store's file (and this process's threads)."""
+        with self._lock, open(self.path + '.lock', 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read_file(self):
+        """
+        Read the record file (the caller holds the file lock).
+
+        Returns:
+            (records as tuples, number of records in the file, whether any were invalid), or
+            None if the file is missing or of an unknown format
+        """
+        if not os.path.exists(self.path):
+            return None
+        with open(self.path, 'rb') as f:
+            header = f.read(HEADER_SIZE)
+        if len(header) < HEADER_SIZE or header[:4] != FILE_MAGIC \
+                or int.from_bytes(header[4:8], 'little') != FILE_VERSION:
+            return None
+
+        size = os.path.getsize(self.path) - HEADER_SIZE
+        count = size // RECORD_DTYPE.itemsize
+        if count == 0:
+            return [], 0, size != 0
+        records = np.memmap(self.path, dtype=RECORD_DTYPE, mode='r', offset=HEADER_SIZE, shape=(count,))
+        valid = (((records['white'] & records['black']) == 0)
+                 & np.isin(records['side'], (1, -1))
+                 & np.isin(records['flag'], (EXACT, LOWER, UPPER))
+                 & (records['depth'] >= 0)
+                 & ((records['move'] < 64) | (records['move'] == NO_MOVE))
+                 & np.isfinite(records['score']))
+        kept = records[valid].tolist()
+        del records
+        return kept, count, size % RECORD_DTYPE.itemsize != 0 or len(kept) < count
+
+    @staticmethod
+    def _merge(entries, records):
+        # A record replaces the entry of its key unless that one is deeper, or as deep and newer
+        for white, black, side, depth, flag, move, stamp, score in records:
+            key = (white, black, side)
+            old = entries.get(key)
+            if old is None or (depth, stamp) >= (old[0], old[4]):
+                entries[key] = (depth, flag, score, move, stamp)
+
+    def _load(self):
+        with self._file_lock(exclusive=False):
+            contents = self._read_file()
+        if contents is None:
+            if os.path.exists(self.path):
+                # Unknown or old format: start over rather than trusting the contents
+                with self._file_lock():
+                    if self._read_file() is None and os.path.exists(self.path):
+                        os.remove(self.path)
+            return
+
+        records, count, damaged = contents
+        self._merge(self.entries, records)
+        self.file_records = count
+
+        if len(self.entries) > self.max_entries:
+            self._evict_memory()
+        if damaged or count > self.max_entries * COMPACT_SLACK:
+            self.compact()
+
+    # ── Search interface ──────────────────────────────────────────────────────
+
+    def probe(self, key):
+        """Return (depth, flag, score, move) for the key, or None if it has never been searched."""
+        self.probes += 1
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        self.hits += 1
+        depth, flag, score, move, _ = entry
+        return depth, flag, score, decode_move(move)
+
+    def store(self, key, depth, flag, score, move):
+        """Record a search result. Results shallower than the one already stored are ignored."""
+        old = self.entries.get(key)
+        if old is not None and old[0] > depth:
+            return
+
+        stamp = int(time.time())
+        entry = (depth, flag, float(score), encode_move(move), stamp)
+        self.entries[key] = entry
+
+        if len(self.entries) > self.max_entries:
+            self._evict_memory()
+
+        if self.path is not None and depth >= self.persist_min_depth:
+            self._pending.put((key, entry))
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write_loop, daemon=True)
+                self._writer.start()
+
+    # ── Writing and eviction ──────────────────────────────────────────────────
+
+    def _write_loop(self):
+        while True:
+            item = self._pending.get()
+            batch = [item]
+            # Drain whatever else is queued so the disk sees one write per batch
+            while True:
+                try:
+                    batch.append(self._pending.get_nowait())
+                except queue.Empty:
+                    break
+
+            stop = None in batch
+            batch = [b for b in batch if b is not None]
+            if batch:
+                self._append(batch)
+            if stop:
+                return
+
+    def _append(self, batch):
+        records = np.zeros(len(batch), dtype=RECORD_DTYPE)
+        for i, ((white, black, side), (depth, flag, score, move, stamp)) in enumerate(batch):
+            records[i] = (white, black, side, depth, flag, move, stamp, score)
+
+        with self._file_lock():
+            with open(self.path, 'ab') as f:
+                # Under the lock, so only one process ever writes the header
+                if f.tell() == 0:
+                    f.write(self._header())
+                f.write(records.tobytes())
+            self.file_records += len(batch)
+
+    def _header(self):
+        return FILE_MAGIC + FILE_VERSION.to_bytes(4, 'little') + bytes(HEADER_SIZE - 8)
+
+    def _ranked_keys(self, keep, entries=None):
+        """Keys of the `keep` entries worth keeping: not expired, deepest first, then newest."""
+        entries = self.entries if entries is None else entries
+        cutoff = int(time.time()) - self.max_age
+        alive = [(entry[0], entry[4], key) for key, entry in entries.items() if entry[4] >= cutoff]
+        alive.sort(reverse=True)
+        return [key for _, _, key in alive[:keep]]
+
+    def _evict_memory(self):
+        # Drop down to 3/4 of the cap so eviction is not re-run on every store
+        keep = self._ranked_keys(self.max_entries * 3 // 4)
+        self.entries = {key: self.entries[key] for key in keep}
+
+    # ── Memory accounting ─────────────────────────────────────────────────────
+
+    def memory_bytes(self):
+        """Estimated bytes held by the in-memory entries."""
+        return memory.entries_bytes(self.entries)
+
+    def shrink(self, fraction):
+        """
+        Keep the best `fraction` of the in-memory entries (memory budget). The size cap, and with
+        it the file, are left alone: the budget is enforced again after every move.
+        """
+        keep = int(len(self.entries) * fraction)
+        self.entries = {key: self.entries[key] for key in self._ranked_keys(keep)}
+
+    def compact(self):
+        """
+        Rewrite the file with only the entries that survive the size cap and age/depth eviction,
+        chosen among the records on disk (including other processes') and the entries in memory.
+        """
+        if self.path is None:
+            return
+        with self._file_lock():
+            contents = self._read_file()
+            merged = {}
+            if contents is not None:
+                self._merge(merged, contents[0])
+            for key, entry in self.entries.items():
+                old = merged.get(key)
+                if old is None or (entry[0], entry[4]) >= (old[0], old[4]):
+                    merged[key] = entry
+            keep = [key for key in self._ranked_keys(self.max_entries, merged)
+                    if merged[key][0] >= self.persist_min_depth]
+
+            records = np.zeros(len(keep), dtype=RECORD_DTYPE)
+            for i, key in enumerate(keep):
+                depth, flag, score, move, stamp = merged[key]
+                records[i] = (key[0], key[1], key[2], depth, flag, move, stamp, score)
+
+            tmp_path = f'{self.path}.{os.getpid()}.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(self._header())
+                f.write(records.tobytes())
+            os.replace(tmp_path, self.path)
+            self.file_records = len(keep)
+
+    def close(self):
+        """Flush pending writes, compacting the file if it has grown past its cap."""
+        if self._writer is not None:
+            self._pending.put(None)
+            self._writer.join()
+            self._writer = None
+        if self.path is not None and self.file_records > self.max_entries * COMPACT_SLACK:
+            self.compact()
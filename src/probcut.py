@@ -0,0 +1,249 @@
+import os
+import sys
+import json
+import random
+import numpy as np
+
+# Multi-ProbCut (Buro, 1997)
+#
+# A shallow search is a good predictor of a deep search of the same position:
+#     v_deep ~= a * v_shallow + b    with normally distributed error of std. dev. sigma
+# so if the shallow result says the deep result is outside the (alpha, beta) window with
+# enough confidence, the deep search is skipped. Multi-ProbCut tries several shallow
+# depths per deep depth (cheapest first) and uses separate parameters per game stage.
+#
+# The (a, b, sigma) parameters are fitted on self-play positions by running this file, once
+# per heuristic (REVERSI_HEURISTIC) since the fits only hold for the heuristic they were made with:
+#     python3 src/probcut.py calibrate [positions]
+# and how often the cuts fire and how often they are wrong can be checked with:
+#     python3 src/probcut.py check [positions]
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
+USE_PROBCUT = os.environ.get('REVERSI_PROBCUT', '1') != '0'
+VERIFY_CUTS = os.environ.get('REVERSI_PROBCUT_VERIFY', '0') == '1'
+
+CUT_THRESHOLD = 1.5      # cut when the prediction is this many sigmas outside the window
+MIN_MOVES = 10           # only worth it in wide midgame nodes
+MIN_EMPTIES = 14         # leave the endgame to the full-width search
+STAGE_SIZE = 12          # discs per game stage bucket
+MIN_SAMPLES = 30         # fewer samples than this and the stage falls back to the all-stage fit
+
+# Depth pairs tried by Multi-ProbCut: deep depth -> shallow depths, cheapest first
+DEPTH_PAIRS = {
+    3: [1],
+    4: [2],
+    5: [1, 3],
+    6: [2, 4],
+    7: [3, 5],
+    8: [4, 6],
+}
+
+DECIDED_SCORE = 10000    # terminal scores are not predictable by regression, skip them
+
+
+def game_stage(position):
+    discs = 64 - position.empties()
+    return (discs - 4) // STAGE_SIZE
+
+
+class ProbCutStats:
+    """Counts of ProbCut attempts, cuts and (in verify mode) wrong cuts."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.tries = 0
+        self.high_cuts = 0
+        self.low_cuts = 0
+        self.verified = 0
+        self.wrong = 0
+
+    def report(self):
+        cuts = self.high_cuts + self.low_cuts
+        line = (f"ProbCut: {self.tries} tries, {cuts} cuts "
+                f"({self.high_cuts} high / {self.low_cuts} low, "
+                f"{100.0 * cuts / max(self.tries, 1):.1f}% of tries)")
+        if self.verified:
+            line += f", {self.wrong}/{self.verified} verified cuts wrong ({100.0 * self.wrong / self.verified:.1f}%)"
+        return line
+
+
+STATS = ProbCutStats()
+
+
+def params_path(heuristic_name):
+    """Calibration file of the heuristic whose function is named `heuristic_name`."""
+    return os.path.join(DATA_DIR, f'probcut_params_{heuristic_name}.json')
+
+
+def load_params(path, heuristic_name=None):
+    """
+    Load calibrated parameters as {(stage, deep): [(shallow, a, b, sigma), ...]}.
+
+    Stages without enough samples use the all-stage fit (stored with stage -1).
+    Returns an empty table, which turns ProbCut off, if the calibration file does not exist
+    or was fitted for another heuristic than `heuristic_name`.
+    """
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        data = json.load(f)
+    if heuristic_name is not None and data.get('heuristic') != heuristic_name:
+        return {}
+    entries = data['pairs']
+
+    fits = {(e['stage'], e['deep'], e['shallow']): e for e in entries}
+    table = {}
+    stages = {e['stage'] for e in entries if e['stage'] >= 0}
+    for stage in stages:
+        for deep, shallows in DEPTH_PAIRS.items():
+            for shallow in shallows:
+                fit = fits.get((stage, deep, shallow))
+                if fit is None or fit['samples'] < MIN_SAMPLES:
+                    fit = fits.get((-1, deep, shallow))
+                if fit is not None:
+                    table.setdefault((stage, deep), []).append((shallow, fit['a'], fit['b'], fit['sigma']))
+    return table
+
+
+_params = {}   # heuristic function name -> loaded table
+
+
+def params(heuristic):
+    """The calibrated parameters of `heuristic` (loaded on first use; empty if it has none)."""
+    name = heuristic.__name__
+    if name not in _params:
+        _params[name] = load_params(params_path(name), name)
+    return _params[name]
+
+
+# ── Calibration ───────────────────────────────────────────────────────────────
+
+def self_play_positions(count, seed=0):
+    """
+    Sample midgame positions from self-play games.
+
+    Games are played by the greedy-by-weight policy with random moves mixed in,
+    so the sample covers the sort of positions the search actually meets.
+    """
+    from reversi import reversi
+    from utils import get_legal_moves, WEIGHT_MATRIX
+
+    rng = random.Random(seed)
+    positions = []
+    while len(positions) < count:
+        game = reversi()
+        turn = 1
+        passes = 0
+        while passes < 2:
+            moves = get_legal_moves(game, turn)
+            if not moves:
+                passes += 1
+            else:
+                passes = 0
+                empties = 64 - int(np.count_nonzero(game.board))
+                if empties >= MIN_EMPTIES and rng.random() < 0.15:
+                    positions.append((game.board.copy(), turn))
+                if rng.random() < 0.3:
+                    x, y = rng.choice(moves)
+                else:
+                    x, y = max(moves, key=lambda m: WEIGHT_MATRIX[m[0], m[1]])
+                game.step(x, y, turn)
+            turn = -turn
+    return positions[:count]
+
+
+def calibrate(count=200):
+    """
+    Fit (a, b, sigma) per stage and depth pair on `count` self-play positions searched with the
+    chosen heuristic, and save them as that heuristic's parameters.
+    """
+    import minimax_alpha_beta_h_nic as search
+    from position import Position
+
+    name = search.CHOSEN_HEURISTIC.__name__
+    path = params_path(name)
+
+    global USE_PROBCUT
+    USE_PROBCUT = False  # calibrate against plain full-width search
+
+    positions = self_play_positions(count)
+    depths = sorted({d for deep, shallows in DEPTH_PAIRS.items() for d in [deep] + shallows})
+    max_depth = int(os.environ.get('REVERSI_PROBCUT_MAX_DEPTH', 6))
+    depths = [d for d in depths if d <= max_depth]
+
+    samples = {}
+    for index, (board, turn) in enumerate(positions):
+        position = Position.from_board(board, turn)
+        values = {}
+        for depth in depths:
+            score, _ = search.minimax(position, depth, float('-inf'), float('inf'),
+                                      True, turn, float('inf'), search.CHOSEN_HEURISTIC)
+            values[depth] = score
+        if any(abs(v) >= DECIDED_SCORE for v in values.values()):
+            continue
+        stage = game_stage(position)
+        for deep, shallows in DEPTH_PAIRS.items():
+            for shallow in shallows:
+                if deep in values and shallow in values:
+                    for s in (stage, -1):
+                        samples.setdefault((s, deep, shallow), []).append((values[shallow], values[deep]))
+        print(f"  position {index + 1}/{len(positions)}", end='\r')
+    print()
+
+    entries = []
+    for (stage, deep, shallow), pairs in sorted(samples.items()):
+        v_shallow, v_deep = np.array(pairs).T
+        if len(pairs) < 3 or np.ptp(v_shallow) == 0:
+            continue
+        a, b = np.polyfit(v_shallow, v_deep, 1)
+        sigma = float(np.std(v_deep - (a * v_shallow + b)))
+        entries.append({'stage': stage, 'deep': deep, 'shallow': shallow,
+                        'a': float(a), 'b': float(b), 'sigma': sigma, 'samples': len(pairs)})
+        print(f"stage {stage:2d}  {deep}<-{shallow}  a={a:.3f} b={b:8.2f} sigma={sigma:8.2f} n={len(pairs)}")
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump({'heuristic': name, 'pairs': entries}, f, indent=1)
+    _params.pop(name, None)
+    print(f"Saved {len(entries)} depth-pair fits to {path}")
+
+
+def check(count=20):
+    """Search self-play positions with cut verification on and print the ProbCut statistics."""
+    import time
+    import minimax_alpha_beta_h_nic as search
+    from position import Position
+
+    global VERIFY_CUTS
+    VERIFY_CUTS = True
+    STATS.reset()
+
+    table = params(search.CHOSEN_HEURISTIC)
+    if not table:
+        print(f"No calibration found at {params_path(search.CHOSEN_HEURISTIC.__name__)}, run calibrate first.")
+        return
+
+    # One ply deeper than the deepest calibrated pair, so cuts can fire below the root
+    depth = max(deep for _, deep in table) + 1
+    start = time.time()
+    for board, turn in self_play_positions(count, seed=1):
+        search.minimax(Position.from_board(board, turn), depth, float('-inf'), float('inf'),
+                       True, turn, float('inf'), search.CHOSEN_HEURISTIC)
+    print(STATS.report())
+    print(f"{time.time() - start:.1f}s for {count} positions")
+
+
+if __name__ == '__main__':
+    # Run through the imported module so the search sees the same switches and stats
+    import probcut
+    command = sys.argv[1] if len(sys.argv) > 1 else 'calibrate'
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else None
+    if command == 'calibrate':
+        probcut.calibrate(count or 200)
+    elif command == 'check':
+        probcut.check(count or 20)
+    else:
+        print("usage: python3 src/probcut.py [calibrate|check] [positions]")
@@ -0,0 +1,237 @@
+import os
+import sys
+import json
+import time
+import atexit
+import pstats
+import cProfile
+import functools
+import threading
+import multiprocessing.util
+from collections import Counter
+
+# Opt-in profiling for players and servers.
+#
+# Turned on with the REVERSI_PROFILE environment variable or a --profile[=modes] (or
+# --profile <modes>) flag on the command line (reversi_auto_server.py, match_runner.py); modes are comma separated:
+#
+#   cprofile  a deterministic cProfile dump of every move (players wrapped by wrap_player)
+#   sample    low-overhead timers on the hot sections decorated with @timed (minimax, the
+#             heuristic, get_legal_moves, reversi.step) plus a stack sampler that writes
+#             collapsed stacks, the input format of flamegraph.pl / speedscope
+#
+# --profile alone means both. Everything is written to REVERSI_PROFILE_DIR (default
+# 'profiles/') with the process id in the file name, so the worker processes of a whole
+# tournament can be merged afterwards with:
+#     python3 src/profiling.py [profile dir]
+#
+# With profiling off, @timed and wrap_player return the functions unchanged.
+
+SAMPLE_EVERY = 64         # time one call in this many per section
+STACK_INTERVAL = 0.005    # seconds between stack samples
+
+
+MODE_NAMES = ('cprofile', 'sample')
+
+
+def is_modes(value):
+    """True if `value` is a comma separated list of profiling modes (or 0, 1, all)."""
+    return bool(value) and all(mode in MODE_NAMES + ('0', '1', 'all') for mode in value.split(','))
+
+
+def _modes():
+    value = os.environ.get('REVERSI_PROFILE', '')
+    args = sys.argv[1:]
+    for index, arg in enumerate(args):
+        if arg == '--profile':
+            # `--profile <modes>` (as argparse reads it in match_runner) or --profile alone
+            following = args[index + 1] if index + 1 < len(args) else ''
+            value = following if is_modes(following) else 'cprofile,sample'
+        elif arg.startswith('--profile='):
+            value = arg.split('=', 1)[1]
+    if value in ('1', 'all'):
+        value = 'cprofile,sample'
+    if value and value != '0':
+        # Exported so worker processes profile too
+        os.environ['REVERSI_PROFILE'] = value
+    return {mode for mode in value.split(',') if mode and mode != '0'}
+
+
+MODES = _modes()
+CPROFILE = 'cprofile' in MODES
+SAMPLING = 'sample' in MODES
+PROFILE_DIR = os.environ.get('REVERSI_PROFILE_DIR', 'profiles')
+
+# section name -> [calls, timed calls, seconds in timed calls]
+sections = {}
+_stacks = Counter()
+_move_number = 0
+_started_pid = None
+
+
+# ── Section timers ────────────────────────────────────────────────────────────
+
+def timed(name):
+    """
+    Decorator timing one call in SAMPLE_EVERY of `func` under `name`.
+
+    Times are inclusive (a recursive minimax call includes its children), and the
+    report scales the sampled time up by calls / timed calls.
+    """
+    def decorate(func):
+        if not SAMPLING:
+            return func
+        stats = sections.setdefault(name, [0, 0, 0.0])
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            stats[0] += 1
+            if stats[0] % SAMPLE_EVERY:
+                return func(*args, **kwargs)
+            _ensure_started()
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                stats[1] += 1
+                stats[2] += time.perf_counter() - start
+        return wrapper
+    return decorate
+
+
+# ── Per-move cProfile ─────────────────────────────────────────────────────────
+
+def wrap_player(choose_move):
+    """
+    Wrap a player's choose_move so every call is timed (sample mode) and profiled into its
+    own pstats file (cprofile mode). Moves are few, so these are not sampled.
+    """
+    if not (CPROFILE or SAMPLING):
+        return choose_move
+    module = getattr(choose_move, '__module__', 'player')
+    stats = sections.setdefault(f'choose_move:{module}', [0, 0, 0.0])
+
+    @functools.wraps(choose_move)
+    def wrapper(turn, board, game):
+        global _move_number
+        _move_number += 1
+        if SAMPLING:
+            _ensure_started()
+        start = time.perf_counter()
+        try:
+            if not CPROFILE:
+                return choose_move(turn, board, game)
+            profiler = cProfile.Profile()
+            try:
+                return profiler.runcall(choose_move, turn, board, game)
+            finally:
+                os.makedirs(PROFILE_DIR, exist_ok=True)
+                profiler.dump_stats(os.path.join(PROFILE_DIR, f'move_{module}_{os.getpid()}_{_move_number:04d}.pstats'))
+        finally:
+            stats[0] += 1
+            stats[1] += 1
+            stats[2] += time.perf_counter() - start
+    return wrapper
+
+
+# ── Stack sampler ─────────────────────────────────────────────────────────────
+
+def _frame_name(frame):
+    code = frame.f_code
+    return f'{os.path.basename(code.co_filename)}:{code.co_name}'
+
+
+def _sample_stacks():
+    # Players search on the main thread; the other threads (cache writer etc.) are mostly idle
+    main_id = threading.main_thread().ident
+    while True:
+        time.sleep(STACK_INTERVAL)
+        frame = sys._current_frames().get(main_id)
+        stack = []
+        while frame is not None:
+            stack.append(_frame_name(frame))
+            frame = frame.f_back
+        if stack:
+            _stacks[';'.join(reversed(stack))] += 1
+
+
+def write_results():
+    """Write this process's section timers and collapsed stacks to PROFILE_DIR."""
+    if not SAMPLING or not (sections or _stacks):
+        return
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    pid = os.getpid()
+    with open(os.path.join(PROFILE_DIR, f'sections_{pid}.json'), 'w') as f:
+        json.dump(sections, f)
+    # The sampler thread is still running, so copy the counts before sorting them
+    stacks = sorted(list(_stacks.items()), key=lambda item: -item[1])
+    with open(os.path.join(PROFILE_DIR, f'stacks_{pid}.collapsed'), 'w') as f:
+        for stack, count in stacks:
+            f.write(f'{stack} {count}\n')
+
+
+def _ensure_started():
+    """Start the stack sampler and the exit hook once per process (forked workers inherit neither)."""
+    global _started_pid
+    if _started_pid == os.getpid():
+        return
+    _started_pid = os.getpid()
+    _stacks.clear()
+    for stats in sections.values():
+        stats[:] = [0, 0, 0.0]
+    threading.Thread(target=_sample_stacks, daemon=True).start()
+    atexit.register(write_results)
+    # Worker processes (match_runner's pool) exit without running atexit handlers
+    multiprocessing.util.Finalize(None, write_results, exitpriority=10)
+
+
+if SAMPLING:
+    _ensure_started()
+
+
+# ── Aggregation ───────────────────────────────────────────────────────────────
+
+def aggregate(directory=PROFILE_DIR):
+    """Merge the profiles of every process (e.g. a whole tournament) and print a summary."""
+    files = sorted(os.listdir(directory))
+
+    move_files = [os.path.join(directory, f) for f in files if f.startswith('move_') and f.endswith('.pstats')]
+    if move_files:
+        stats = pstats.Stats(*move_files)
+        stats.dump_stats(os.path.join(directory, 'combined.pstats'))
+        print(f"cProfile: {len(move_files)} moves merged into {directory}/combined.pstats\n")
+        stats.sort_stats('cumulative').print_stats(20)
+
+    totals = {}
+    for f in files:
+        if f.startswith('sections_') and f.endswith('.json'):
+            with open(os.path.join(directory, f)) as section_file:
+                for name, (calls, timed_calls, seconds) in json.load(section_file).items():
+                    total = totals.setdefault(name, [0, 0, 0.0])
+                    total[0] += calls
+                    total[1] += timed_calls
+                    total[2] += seconds
+    if totals:
+        print(f"{'section':<40} {'calls':>12} {'us/call':>9} {'est. total s':>13}   (inclusive)")
+        for name, (calls, timed_calls, seconds) in sorted(totals.items(), key=lambda t: -t[1][0]):
+            per_call = seconds / timed_calls if timed_calls else 0.0
+            print(f"{name:<40} {calls:>12} {per_call * 1e6:>9.1f} {per_call * calls:>13.2f}")
+
+    stacks = Counter()
+    for f in files:
+        if f.startswith('stacks_') and f.endswith('.collapsed'):
+            with open(os.path.join(directory, f)) as stack_file:
+                for line in stack_file:
+                    stack, count = line.rsplit(' ', 1)
+                    stacks[stack] += int(count)
+    if stacks:
+        path = os.path.join(directory, 'combined.collapsed')
+        with open(path, 'w') as out:
+            for stack, count in stacks.most_common():
+                out.write(f'{stack} {count}\n')
+        print(f"\n{sum(stacks.values())} stack samples merged into {path} "
+              f"(flamegraph.pl {path} > flame.svg)")
+
+
+if __name__ == '__main__':
+    aggregate(sys.argv[1] if len(sys.argv) > 1 else PROFILE_DIR)
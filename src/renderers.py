@@ -0,0 +1,243 @@
+import os
+import sys
+import json
+import time
+import itertools
+
+import numpy as np
+
+# Renderers for the socket server (reversi_server.py) and for replaying recorded games.
+#
+#   HeadlessRenderer  draws nothing; the server runs without a display (no pygame needed).
+#   PygameRenderer    draws the background and grid once, then only the squares whose disc
+#                     changed and the sidebar lines whose text changed (dirty rects).
+#
+# The game loop does not wait for frames: moves are applied as soon as they arrive and the
+# renderer is asked to draw at most `fps` times a second (see reversi_server.main).
+#
+# A game can also be recorded as a stream of JSON lines (GameRecorder) and watched later:
+#
+#     python3 src/renderers.py <recording.jsonl> [--delay=<seconds per move>] [--headless]
+
+RECORD_DIR = 'recordings'
+_game_numbers = itertools.count(1)
+FPS = int(os.environ.get('REVERSI_FPS', '30'))
+
+SQUARE = 100
+PIECE_OFFSET = 15
+SIDEBAR_X = 1000
+SIDEBAR_WIDTH = 400
+SIDEBAR_ROW = 60
+
+
+# ── Renderers ─────────────────────────────────────────────────────────────────
+
+class HeadlessRenderer:
+    """Renderer that draws nothing. `fps` is None so the game loop never wakes up just to draw."""
+
+    fps = None
+
+    def show_message(self, text):
+        pass
+
+    def draw(self, board, turn, move_seconds=0.0):
+        pass
+
+    def poll(self):
+        """Handle window events. Returns False once the window has been closed."""
+        return True
+
+    def wait_for_click(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class PygameRenderer:
+    """
+    Window renderer that only redraws what changed.
+
+    The last drawn board and sidebar texts are kept; draw() repaints the changed squares
+    (background, grid and disc) and sidebar rows and updates just those rectangles.
+    """
+
+    def __init__(self, fps=FPS, data_dir='src/data'):
+        import pygame
+        self.pygame = pygame
+        self.fps = fps
+        pygame.init()
+        self.screen = pygame.display.set_mode((1200, 800))
+        pygame.display.set_caption('Runner')
+        self.font = pygame.font.Font('freesansbold.ttf', 32)
+
+        background = pygame.image.load(os.path.join(data_dir, 'background.jpeg'))
+        self.background = pygame.transform.scale(background, (800, 800))
+        self.pieces = {}
+        for piece, name in ((1, 'white_piece.png'), (-1, 'black_piece.png')):
+            image = pygame.image.load(os.path.join(data_dir, name))
+            self.pieces[piece] = pygame.transform.scale(image, (70, 70))
+
+        self.drawn = None      # board as last drawn (None: nothing drawn yet)
+        self.texts = {}        # sidebar row y -> (text, colour) as last drawn
+
+    def show_message(self, text):
+        self.screen.fill((0, 0, 0))
+        text_surface = self.font.render(text, True, (255, 255, 255))
+        self.screen.blit(text_surface, text_surface.get_rect(center=(600, 400)))
+        self.pygame.display.update()
+        self.drawn = None
+        self.texts = {}
+
+    def _draw_grid(self, rect):
+        self.screen.set_clip(rect)
+        for i in range(7):
+            self.pygame.draw.line(self.screen, (255, 255, 255), (SQUARE * i + SQUARE, 0), (SQUARE * i + SQUARE, 800), 2)
+            self.pygame.draw.line(self.screen, (255, 255, 255), (0, SQUARE * i + SQUARE), (800, SQUARE * i + SQUARE), 2)
+        self.screen.set_clip(None)
+
+    def _draw_square(self, x, y, piece):
+        # Board x runs left to right on screen and y top to bottom, as in the original renderer
+        rect = self.pygame.Rect(x * SQUARE, y * SQUARE, SQUARE, SQUARE)
+        self.screen.blit(self.background, rect, rect)
+        self._draw_grid(rect)
+        if piece != 0:
+            self.screen.blit(self.pieces[piece], (x * SQUARE + PIECE_OFFSET, y * SQUARE + PIECE_OFFSET))
+        return rect
+
+    def _draw_text(self, text, y, colour=(255, 255, 255)):
+        if self.texts.get(y) == (text, colour):
+            return None
+        self.texts[y] = (text, colour)
+        rect = self.pygame.Rect(SIDEBAR_X - SIDEBAR_WIDTH // 2, y - SIDEBAR_ROW // 2, SIDEBAR_WIDTH, SIDEBAR_ROW)
+        self.screen.fill((0, 0, 0), rect)
+        text_surface = self.font.render(text, True, colour)
+        self.screen.blit(text_surface, text_surface.get_rect(center=(SIDEBAR_X, y)))
+        return rect
+
+    def draw(self, board, turn, move_seconds=0.0):
+        dirty = []
+        if self.drawn is None:
+            self.screen.fill((0, 0, 0))
+            self.screen.blit(self.background, (0, 0))
+            self._draw_grid(self.background.get_rect())
+            self.drawn = np.zeros((8, 8))
+            dirty.append(self.pygame.Rect(0, 0, 1200, 800))
+        for x, y in zip(*np.nonzero(board != self.drawn)):
+            dirty.append(self._draw_square(x, y, board[x, y]))
+        self.drawn = np.array(board)
+
+        white = int((board == 1).sum())
+        black = int((board == -1).sum())
+        dirty.append(self._draw_text(f'White : {white}', 100))
+        dirty.append(self._draw_text(f'Black : {black}', 200))
+        dirty.append(self._draw_text(f'Hand : {"White" if turn == 1 else "Black"}', 500))
+        dirty.append(self._draw_text(f'Time : {int(move_seconds)}', 600,
+                                     (255, 255, 255) if move_seconds <= 5 else (255, 0, 0)))
+        dirty = [rect for rect in dirty if rect is not None]
+        if dirty:
+            self.pygame.display.update(dirty)
+
+    def poll(self):
+        for event in self.pygame.event.get():
+            if event.type == self.pygame.QUIT:
+                return False
+        return True
+
+    def wait_for_click(self):
+        while True:
+            event = self.pygame.event.wait()
+            if event.type in (self.pygame.MOUSEBUTTONDOWN, self.pygame.QUIT):
+                return
+
+    def close(self):
+        self.pygame.quit()
+
+
+def make_renderer(headless=False):
+    """PygameRenderer, or HeadlessRenderer if `headless` or REVERSI_HEADLESS=1."""
+    if headless or os.environ.get('REVERSI_HEADLESS', '0') != '0':
+        return HeadlessRenderer()
+    return PygameRenderer()
+
+
+# ── Recorded game streams ─────────────────────────────────────────────────────
+
+class GameRecorder:
+    """
+    Writes a game as JSON lines, one per position:
+    {"ply": n, "move": [x, y] or null, "turn": side to move next, "board": 8x8 ints}.
+    The first line (ply 0, move null) is the starting position. Lines are flushed as they
+    are written, so a game in progress can be watched from its file.
+    """
+
+    def __init__(self, path=None):
+        if path is None:
+            os.makedirs(RECORD_DIR, exist_ok=True)
+            path = os.path.join(RECORD_DIR, f'game_{time.strftime("%Y%m%d_%H%M%S")}_{os.getpid()}_{next(_game_numbers)}.jsonl')
+        self.path = path
+        self.file = open(path, 'w')
+        self.ply = 0
+
+    def record(self, board, turn, move=None):
+        """Record the position after `move` ([-1, -1] for a pass), with `turn` to move."""
+        frame = {'ply': self.ply, 'move': None if move is None else [int(move[0]), int(move[1])],
+                 'turn': int(turn), 'board': np.asarray(board, dtype=int).tolist()}
+        self.file.write(json.dumps(frame) + '\n')
+        self.file.flush()
+        self.ply += 1
+
+    def close(self):
+        self.file.close()
+
+
+def parse_record(argv):
+    """
+    Read `--record[=<path>]` from argv.
+
+    Returns:
+        None if absent, '' for the default path (recordings/game_<time>_<pid>_<n>.jsonl), or the path
+    """
+    for arg in argv:
+        if arg == '--record':
+            return ''
+        if arg.startswith('--record='):
+            return arg.split('=', 1)[1]
+    return None
+
+
+def read_recording(path):
+    """Yield the frames of a recorded game as (ply, move, turn, board array)."""
+    with open(path) as file:
+        for line in file:
+            if line.strip():
+                frame = json.loads(line)
+                yield frame['ply'], frame['move'], frame['turn'], np.array(frame['board'], dtype=float)
+
+
+def replay(path, renderer, delay=0.5):
+    """Show a recorded game with `renderer`, one move every `delay` seconds."""
+    board = None
+    for ply, move, turn, board in read_recording(path):
+        if not renderer.poll():
+            return
+        renderer.draw(board, turn)
+        if move is not None:
+            print(f"{ply:>3}: {'pass' if move == [-1, -1] else tuple(move)}")
+        time.sleep(delay)
+    if board is not None:
+        white, black = int((board == 1).sum()), int((board == -1).sum())
+        print(f"Final score: white {white}, black {black}")
+    renderer.wait_for_click()
+
+
+if __name__ == '__main__':
+    paths = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    if not paths:
+        print("usage: python3 src/renderers.py <recording.jsonl> [--delay=<seconds>] [--headless]")
+        sys.exit(1)
+    delay = 0.5
+    for arg in sys.argv[1:]:
+        if arg.startswith('--delay='):
+            delay = float(arg.split('=', 1)[1])
+    replay(paths[0], make_renderer('--headless' in sys.argv), delay)
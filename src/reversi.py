@@ -1,6 +1,8 @@
 #Zijie Zhang, Sep.24/2023
 
 import numpy as np
+from profiling import timed
+from position import Position
 
 class reversi:
     def __init__(self) -> None:
@@ -24,8 +26,10 @@ class reversi:
         ]
 
         self.time = 0
+        self.deadline = None  # time.time() by which the current move is due, if the server enforces one
         self.turn = 1
 
+    @timed('reversi.step')
     def step(self, x, y, piece = 1, commit = True) -> int:
 
         #Piece already exists
@@ -70,4 +74,10 @@ class reversi:
                         self.black_count += 1
                     self.white_count += fliped * piece
                     self.black_count -= fliped * piece
-                return fliped
\ No newline at end of file
+                return fliped
+
+    def legal_moves_with_flips(self, piece = 1) -> list:
+        # Every legal move for piece in one call, instead of step(x, y, piece, False) on all 64 squares.
+        # Returns [(x, y, number of discs flipped, flip mask)] in square order; the flip mask is a
+        # bitboard with bit x * 8 + y set for each flipped disc (see position.py).
+        return Position.from_board(self.board, piece).moves_with_flips()
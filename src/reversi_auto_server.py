@@ -1,5 +1,14 @@
 
+import sys
+import time
 from reversi import reversi
+import profiling
+import memory
+import spectator
+from utils import parse_move_time
+from renderers import GameRecorder, parse_record
+from position import Position
+from endgame import solve_outcome, SolveBudgetExceeded
 
 # Algorithm 1 -- update the 'from' to choose a different player
 from minimax_alpha_beta_h_nic import choose_move as algorithm_1
@@ -7,25 +16,111 @@ from minimax_alpha_beta_h_nic import choose_move as algorithm_1
 # Algorithm 2 -- update the 'from' to choose a different player
 from greedy_bfs_player import choose_move as algorithm_2
 
+# Seconds a move may run over move_time before it is forfeited (timer noise, not thinking time)
+OVERRUN_GRACE = 0.1
+
+# Node budget of each adjudication attempt (about a second); a position that needs more is tried
+# again on the next move, with one empty fewer
+ADJUDICATE_NODES = 50000
+
 class AutoGameServer:
-    def __init__(self, player1, player2):
+    def __init__(self, player1, player2, board=None, turn=1, move_time=None, recorder=None,
+                 adjudicate_empties=None, adjudicate_nodes=ADJUDICATE_NODES):
         """
         player1 = white (turn = 1)
         player2 = black (turn = -1)
+        board, turn = optional starting position (e.g. from an opening suite) and side to move
+        move_time = optional per-move time limit in seconds. Players see it as game.deadline;
+                    a move that comes back later than that is recorded in self.overruns and
+                    treated as a pass.
+        recorder = optional renderers.GameRecorder; every position of the game is written to it
+                   (and closed at the end) so it can be replayed with `python3 src/renderers.py <file>`
+        adjudicate_empties = optional number of empty squares from which the game is adjudicated:
+                    before each move the position is solved exactly (within adjudicate_nodes
+                    nodes), and once the result with perfect play is proven the game ends with
+                    that result. The proof is kept in self.adjudication.
         """
         self.game = reversi()
-        self.player1 = player1
-        self.player2 = player2
-        self.turn = 1  # White starts
+        if board is not None:
+            self.game.board = board.astype(float)
+            self.game.white_count = int((board == 1).sum())
+            self.game.black_count = int((board == -1).sum())
+        # Players get a read-only view of the board instead of a copy, and their own game object
+        # to simulate moves with, so nothing a player does can change the game being played
+        self.player_game = reversi()
+        self.player1 = profiling.wrap_player(player1)
+        self.player2 = profiling.wrap_player(player2)
+        self.turn = turn  # White starts unless a starting position says otherwise
+        self.move_time = move_time
+        self.overruns = []  # (ply, turn, seconds taken) of every move over the time limit
+        self.recorder = recorder
+        self.adjudicate_empties = adjudicate_empties
+        self.adjudicate_nodes = adjudicate_nodes
+        self.adjudication = None   # proof of the adjudicated result, see adjudicate()
+        self.move_seconds = 0.0    # time spent by the players
+        self.solve_seconds = 0.0   # time spent on adjudication attempts, proven or not
+        self.feed = spectator.get_feed()   # spectator stream, if REVERSI_SPECTATE names a hub
+
+    def adjudicate(self, ply):
+        """
+        Try to prove the result of the current position.
+
+        Returns:
+            the proof as a dict (winner, the line that reaches it, nodes, and an estimate of the
+            playing time the rest of the game would have taken) or None if the node budget ran out
+        """
+        position = Position.from_board(self.game.board, self.turn)
+        start = time.time()
+        try:
+            winner, line, nodes = solve_outcome(position, self.adjudicate_nodes)
+        except SolveBudgetExceeded:
+            return None
+        finally:
+            self.solve_seconds += time.time() - start
+        # The game would have gone on for about as many plies as the proof line, at the
+        # players' average time per move so far
+        per_move = self.move_seconds / ply if ply else 0.0
+        return {'ply': ply, 'empties': position.empties(), 'position': list(position.key()),
+                'winner': winner, 'line': [None if move is None else list(move) for move in line],
+                'nodes': nodes, 'estimated_seconds_remaining': len(line) * per_move}
 
     def play_game(self):
         consecutive_passes = 0
+        ply = 0
+        if self.recorder is not None:
+            self.recorder.record(self.game.board, self.turn)
+        if self.feed is not None:
+            game_id = self.feed.new_game(self.game.board, self.turn)
 
         while True:
+            if (self.adjudicate_empties is not None
+                    and 64 - self.game.white_count - self.game.black_count <= self.adjudicate_empties):
+                self.adjudication = self.adjudicate(ply)
+                if self.adjudication is not None:
+                    break
+
             current_player = self.player1 if self.turn == 1 else self.player2
 
             # Ask AI for move
-            move = current_player(self.turn, self.game.board.copy(), self.game)
+            board = self.game.board.view()
+            board.flags.writeable = False
+            memory.before_move()
+            start = time.time()
+            if self.move_time is not None:
+                self.player_game.deadline = start + self.move_time
+            move = current_player(self.turn, board, self.player_game)
+            elapsed = time.time() - start
+            self.move_seconds += elapsed
+            # Memory is recorded (and the REVERSI_MEMORY_MB budget enforced) after every move,
+            # outside the timed part so shrinking the tables never counts against the player
+            memory.after_move(getattr(current_player, '__module__', 'player'), elapsed)
+            ply += 1
+
+            if self.move_time is not None and elapsed > self.move_time + OVERRUN_GRACE:
+                self.overruns.append((ply, self.turn, elapsed))
+                print(f"{'White' if self.turn == 1 else 'Black'} took {elapsed:.2f}s, "
+                      f"over the {self.move_time}s limit → treated as pass.")
+                move = [-1, -1]
 
             x, y = move
 
@@ -43,6 +138,12 @@ class AutoGameServer:
                     # Illegal move → treat as pass
                     consecutive_passes += 1
                     print(f"Illegal move by {'White' if self.turn == 1 else 'Black'} → treated as pass.")
+                    x, y = -1, -1
+
+            if self.recorder is not None:
+                self.recorder.record(self.game.board, -self.turn, [x, y])
+            if self.feed is not None:
+                self.feed.move(game_id, ply, self.turn, [x, y], self.game.board, elapsed)
 
             # End condition
             if consecutive_passes >= 2:
@@ -51,6 +152,18 @@ class AutoGameServer:
             # Switch turn
             self.turn *= -1
 
+        if self.recorder is not None:
+            self.recorder.close()
+        if self.feed is not None:
+            self.feed.end(game_id, self.game.white_count, self.game.black_count)
+
+        if self.adjudication is not None:
+            winner = self.adjudication['winner']
+            result = 'a draw' if winner == 0 else f"won by {'White' if winner == 1 else 'Black'}"
+            print(f"Adjudicated at {self.adjudication['empties']} empties: {result} with perfect play "
+                  f"(proven in {self.adjudication['nodes']} nodes)\n")
+            return winner
+
         # print("\nFinal Board:")
         # print(self.game.board) #Note the board printed out is mirrored from the actual board
         white = self.game.white_count
@@ -66,6 +179,9 @@ class AutoGameServer:
             return 0
 
 if __name__ == "__main__":
+    move_time = parse_move_time(sys.argv[1:])
+    # --record[=<path>] writes each game to recordings/ (or <path>_1, <path>_2) for renderers.py
+    record_path = parse_record(sys.argv[1:])
     algorithm_1_wins = 0
     algorithm_2_wins = 0
     draws = 0
@@ -76,7 +192,9 @@ if __name__ == "__main__":
     print(f"Beginning game one, algorithm 1 ({algorithm_1_name}) is white, algorithm 2 ({algorithm_2_name}) is black.")
     game1 = AutoGameServer(
         player1=algorithm_1,  # White
-        player2=algorithm_2   # Black
+        player2=algorithm_2,  # Black
+        move_time=move_time,
+        recorder=None if record_path is None else GameRecorder(f"{record_path}_1" if record_path else None)
     )
 
     game1_winner = game1.play_game()
@@ -91,7 +209,9 @@ if __name__ == "__main__":
     print(f"Beginning game two, algorithm 1 ({algorithm_1_name}) is black, algorithm 2 ({algorithm_2_name}) is white.")
     game2 = AutoGameServer(
         player1=algorithm_2,  # White
-        player2=algorithm_1   # Black
+        player2=algorithm_1,  # Black
+        move_time=move_time,
+        recorder=None if record_path is None else GameRecorder(f"{record_path}_2" if record_path else None)
     )
 
     game2_winner = game2.play_game()
@@ -105,6 +225,13 @@ if __name__ == "__main__":
 
     final_result = game1_winner + game2_winner
 
+    if move_time is not None:
+        for name, game, turn in [(algorithm_1_name, game1, 1), (algorithm_1_name, game2, -1),
+                                 (algorithm_2_name, game1, -1), (algorithm_2_name, game2, 1)]:
+            for ply, overrun_turn, seconds in game.overruns:
+                if overrun_turn == turn:
+                    print(f"Overrun: {name} took {seconds:.2f}s on ply {ply} (limit {move_time}s)")
+
     if algorithm_1_wins == algorithm_2_wins:
         print(f"Final result: both algorithms tied ({algorithm_1_name} and {algorithm_2_name}).")
     elif algorithm_1_wins > algorithm_2_wins:
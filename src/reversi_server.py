@@ -1,10 +1,13 @@
 #Zijie Zhang, Sep.24/2023
 
-import pygame
+import sys
+import time
 from sys import exit
 import numpy as np
-import itertools
 from reversi import reversi
+from utils import parse_move_time
+from renderers import make_renderer, GameRecorder, parse_record
+import spectator
 import socket   
 import pickle
 import threading
@@ -15,8 +18,11 @@ RECV_EVENT_PLAYER1 = 0
 RECV_EVENT_PLAYER2 = 1
 RECV_EVENT_NOT_STARTED = -3
 
+# Seconds a move may run over the move time limit before it is forfeited (network and timer noise)
+OVERRUN_GRACE = 0.1
+
 class server:
-    def __init__(self, host = '127.0.0.1', port = 33333) -> None:
+    def __init__(self, host = '127.0.0.1', port = 33333, move_time = None) -> None:
         self.server_socket = socket.socket()
         try:
             self.server_socket.bind((host, port))
@@ -27,83 +33,92 @@ class server:
         self.player_addr = [None, None]
         self.recv_event = RECV_EVENT_WAITING
         self.recv_cords = [-1, -1]
+        # Per-move time limit in seconds (None = unlimited). It is sent with every play request as
+        # [turn, board, move_time]; a player that has not answered in time forfeits the move.
+        self.move_time = move_time
+        self.request_time = 0
+        self.overruns = []       # (player, seconds waited) of every forfeited move
+        self.stale = [0, 0]      # late replies still to come from each player, thrown away on arrival
+        self.received = threading.Event()   # set when an answer (or a forfeit) is ready
+        # Held while checking and updating stale/recv_event/recv_cords, so a reply arriving at the
+        # deadline is either the move or a stale reply, never both
+        self.lock = threading.Lock()
 
     def wait_for_players(self) -> None:
         self.player[0], self.player_addr[0] = self.server_socket.accept()
         self.player[1], self.player_addr[1] = self.server_socket.accept()
 
     def request_play(self, turn, board : np.ndarray, _player = 0):
-        package = pickle.dumps([turn, board])
+        request = [turn, board] if self.move_time is None or turn == 0 else [turn, board, self.move_time]
+        package = pickle.dumps(request)
+        self.received.clear()
+        self.request_time = time.time()
         self.player[_player].send(package)
-    
+
+    def check_deadline(self, _player):
+        """Forfeit the pending move as a pass if the player is past the time limit. Returns True if it was."""
+        if self.move_time is None:
+            return False
+        with self.lock:
+            if self.recv_event != RECV_EVENT_WAITING:
+                return False
+            waited = time.time() - self.request_time
+            if waited <= self.move_time + OVERRUN_GRACE:
+                return False
+            self.overruns.append((_player, waited))
+            self.stale[_player] += 1
+            self.recv_cords = [-1, -1]
+            self.recv_event = _player
+            self.received.set()
+        print(f"Player {_player + 1} did not answer within {self.move_time}s, move forfeited.")
+        return True
+
+    def wait_for_move(self, timeout):
+        """Block until a move has arrived, the move time has run out or `timeout` seconds have passed."""
+        if self.move_time is not None:
+            left = self.request_time + self.move_time + OVERRUN_GRACE - time.time()
+            timeout = left if timeout is None else min(timeout, left)
+        if timeout is None or timeout > 0:
+            self.received.wait(timeout)
+
     def close(self):
-        self.player[0].close()
-        self.player[1].close()
-
-class drawable_reversi(reversi):
-    def __init__(self,  _white_pic, _black_pic) -> None:
-        super().__init__()
-        self.font = pygame.font.Font('freesansbold.ttf', 32)
-        self.white_pic = _white_pic
-        self.black_pic = _black_pic
-
-    def render_text(self, _screen, _text, x, y, color = (255,255,255)):
-        text = self.font.render(_text, True, color)
-        text_rect = text.get_rect()
-        text_rect.center = (x, y)
-        _screen.fill((0,0,0), text_rect)
-        _screen.blit(text, text_rect)
-
-
-    def render(self, _screen) -> None:
-
-        if self.white_count > 0:
-            white_cords = np.c_[np.where(self.board == 1)] * 100 + 15
-            white_pics = list(zip(itertools.repeat(self.white_pic, white_cords.shape[0]), tuple(map(tuple, white_cords))))
-            _screen.blits(white_pics)
-
-        if self.black_count > 0:
-            black_cords = np.c_[np.where(self.board == -1)] * 100 + 15
-            black_pics = list(zip(itertools.repeat(self.black_pic, black_cords.shape[0]), tuple(map(tuple, black_cords))))
-            _screen.blits(black_pics)
-            
-        self.render_text(_screen, f'White : {self.white_count}', 1000, 100)
-        self.render_text(_screen, f'Black : {self.black_count}', 1000, 200)
-        self.render_text(_screen, f'Hand : {"White" if self.turn == 1 else "Black"}', 1000,500)
-        self.render_text(_screen, f'Time : {int(self.time)}', 1000,600, (255,255,255) if self.time <= 5 else (255, 0, 0))
+        # Shut the sockets down first: that wakes the handler threads blocked in recv (runtime
+        # players keep their connection open after the game-over message)
+        for player_socket in self.player:
+            try:
+                player_socket.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            player_socket.close()
 
 def player_handler(_server : server, _player):
     while True:
         if _server.recv_event == RECV_EVENT_END:
             return
         try:
-            _server.recv_cords = pickle.loads(_server.player[_player].recv(4096))
-        except ConnectionAbortedError:
-            return 
+            cords = pickle.loads(_server.player[_player].recv(4096))
+        except OSError:
+            return
         except EOFError:
             return
-        _server.recv_event = _player
+        with _server.lock:
+            if _server.stale[_player] > 0:
+                # Answer to a request that already timed out
+                _server.stale[_player] -= 1
+                continue
+            _server.recv_cords = cords
+            _server.recv_event = _player
+            _server.received.set()
 
 def main():
+    # The game loop applies every move as soon as it arrives; the renderer draws at most
+    # renderer.fps times a second in between (never, when headless)
+    renderer = make_renderer('--headless' in sys.argv)
+    game = reversi()
 
-    pygame.init()
-    screen = pygame.display.set_mode((1200,800))
-    pygame.display.set_caption('Runner')
-    clock = pygame.time.Clock()
-
-    background_surface = pygame.image.load('src/data/background.jpeg')
-    background_surface = pygame.transform.scale(background_surface, (800,800))
-
-    white_piece = pygame.image.load('src/data/white_piece.png')
-    white_piece = pygame.transform.scale(white_piece, (70,70))
-    black_piece = pygame.image.load('src/data/black_piece.png')
-    black_piece = pygame.transform.scale(black_piece, (70,70))
-    game = drawable_reversi(white_piece, black_piece)
+    renderer.show_message('Waiting for Players...')
 
-    game.render_text(screen, 'Waiting for Players...', 600, 400)
-    pygame.display.update()
-
-    game_server = server()
+    game_server = server(move_time = parse_move_time(sys.argv[1:]))
     game_server.wait_for_players()
 
     p1thread = threading.Thread(target = player_handler, args = (game_server, 0))
@@ -111,31 +126,35 @@ def main():
     p1thread.start()
     p2thread.start()
 
-    screen.blit(background_surface,(0,0))
-    for i in range(7):
-        pygame.draw.line(screen, (255,255,255), (100*i + 100, 0), (100*i + 100, 800), 2)
-        pygame.draw.line(screen, (255,255,255), (0, 100*i + 100), (800, 100*i + 100), 2)
-    game.render(screen)
+    record_path = parse_record(sys.argv[1:])
+    recorder = GameRecorder(record_path or None) if record_path is not None else None
+    if recorder is not None:
+        recorder.record(game.board, game.turn)
 
-    pygame.display.update()
+    # --spectate[=<port>]: observers can follow the game from a hub in this process
+    spectate_port = spectator.parse_spectate(sys.argv[1:])
+    if spectate_port is not None:
+        hub = spectator.start_hub(spectate_port, '0.0.0.0')
+        print(f"Spectators: python3 src/spectator.py watch <this host>:{hub.address[1]}")
+    feed = spectator.get_feed()
+    game_id = feed.new_game(game.board, game.turn) if feed is not None else None
+    ply = 0
 
-    escape_flag = False
-    while True:
-        if escape_flag:
-            break
-        for event in pygame.event.get():
-            if event.type == pygame.MOUSEBUTTONDOWN:
-                escape_flag = True
+    renderer.draw(game.board, game.turn)
+    renderer.wait_for_click()
 
     game_server.request_play(game.turn, game.board, 0 if game.turn == 1 else 1)
     endFlag = False
-    game.time = 0
+    move_start = time.time()
+    frame_time = 1.0 / renderer.fps if renderer.fps else None
+    next_frame = time.time()
     while True: 
 
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                pygame.quit()
-                exit()
+        if not renderer.poll():
+            renderer.close()
+            exit()
+
+        game_server.check_deadline(0 if game.turn == 1 else 1)
 
         if game_server.recv_event >= 0:
             x, y = game_server.recv_cords
@@ -144,39 +163,49 @@ def main():
                     break
                 else:
                     endFlag = True
+                    ply += 1
+                    if feed is not None:
+                        feed.move(game_id, ply, game.turn, [x, y], game.board, time.time() - move_start)
                     game.turn = -game.turn
-                    game.time = 0
+                    move_start = time.time()
+                    if recorder is not None:
+                        recorder.record(game.board, game.turn, [x, y])
             else:
                 if game.step(x, y, game.turn) >= 0:
+                    ply += 1
+                    if feed is not None:
+                        feed.move(game_id, ply, game.turn, [x, y], game.board, time.time() - move_start)
                     game.turn = -game.turn
-                    game.time = 0
+                    move_start = time.time()
                     endFlag = False
+                    if recorder is not None:
+                        recorder.record(game.board, game.turn, [x, y])
             game_server.recv_event = RECV_EVENT_WAITING
             game_server.request_play(game.turn, game.board, 0 if game.turn == 1 else 1)
 
-        screen.blit(background_surface,(0,0))
-        for i in range(7):
-            pygame.draw.line(screen, (255,255,255), (100*i + 100, 0), (100*i + 100, 800), 2)
-            pygame.draw.line(screen, (255,255,255), (0, 100*i + 100), (800, 100*i + 100), 2)
-        game.render(screen)
-
-        pygame.display.update()
-        dt = clock.tick(4)
-        game.time += dt / 1000.0
+        now = time.time()
+        if frame_time is not None and now >= next_frame:
+            renderer.draw(game.board, game.turn, now - move_start)
+            next_frame = now + frame_time
+        game_server.wait_for_move(None if frame_time is None else next_frame - time.time())
 
+    renderer.draw(game.board, game.turn)
     game_server.request_play(0, game.board, 0)
     game_server.request_play(0, game.board, 1)
     game_server.close()
+    if feed is not None:
+        feed.end(game_id, game.white_count, game.black_count)
+    if recorder is not None:
+        recorder.close()
+        print(f"Game recorded to {recorder.path}")
+    print(f"White {game.white_count}, Black {game.black_count}")
+    for _player, waited in game_server.overruns:
+        print(f"Overrun: player {_player + 1} ({'White' if _player == 0 else 'Black'}) forfeited a move after {waited:.2f}s")
     p1thread.join()
     p2thread.join()
 
-    escape_flag = False
-    while True:
-        if escape_flag:
-            break
-        for event in pygame.event.get():
-            if event.type == pygame.MOUSEBUTTONDOWN:
-                escape_flag = True
+    renderer.wait_for_click()
+    renderer.close()
 
 
 if __name__ == '__main__':
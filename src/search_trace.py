@@ -0,0 +1,322 @@
+import os
+import sys
+import math
+import atexit
+import struct
+import functools
+from collections import defaultdict
+
+# Opt-in search tree recorder and offline inspector.
+#
+# With REVERSI_TRACE=<file> (or REVERSI_TRACE=1 for traces/trace_<pid>.bin) every minimax
+# node is written to a compact binary file when it returns: its ply, remaining depth, the
+# move that led to it, the root move it descends from, the alpha-beta window it was searched
+# with, its score, why it returned (see REASONS), how many children it searched and the size
+# of its subtree. For leaves the score is the heuristic value.
+#
+# The file is bounded. The first RECORDS_PER_LEVEL records keep every node; after that only
+# one node in 2, then one in 4, ... is kept, each record carrying its sampling weight, so the
+# file grows with the logarithm of the nodes searched. The root and the root moves (ply 0
+# and 1) are always kept, and nothing more is written once the file reaches MAX_BYTES.
+#
+# The inspector summarizes where the nodes went, by ply, by root move and by cutoff type:
+#
+#     REVERSI_TRACE=trace.bin REVERSI_NODE_LIMIT=20000 python3 src/minimax_alpha_beta_h_nic.py node-bench
+#     python3 src/search_trace.py trace.bin [--search=<n> | --all] [--list]
+#
+# With tracing off, @traced returns minimax unchanged.
+
+MAGIC = b'RVTRACE1'
+HEADER = struct.Struct('<8sQQB')        # magic, nodes seen, records written, truncated
+RECORD = struct.Struct('<BbBbbBBfffI')  # ply, depth, reason, move, root move, children, weight shift,
+                                        # alpha, beta, score, subtree nodes
+RECORDS_PER_LEVEL = int(os.environ.get('REVERSI_TRACE_LEVEL', '200000'))
+MAX_BYTES = int(float(os.environ.get('REVERSI_TRACE_MAX_MB', '64')) * 1024 * 1024)
+TRACE_DIR = 'traces'
+
+# Why a node returned
+ABORTED, LEAF, TERMINAL, TT, PROBCUT, PASS, CUTOFF, ALL, PV = range(9)
+REASONS = {
+    ABORTED: 'aborted',    # the search ran out of time or nodes (root only)
+    LEAF: 'leaf',          # depth 0, scored by the heuristic
+    TERMINAL: 'terminal',  # game over
+    TT: 'tt',              # answered by the transposition table without searching a move
+    PROBCUT: 'probcut',    # cut by ProbCut's shallow searches
+    PASS: 'pass',          # no move, searched the pass
+    CUTOFF: 'cutoff',      # a move refuted the node (beta cutoff at max nodes, alpha cutoff at min nodes)
+    ALL: 'all',            # no move reached the window (fail low at max nodes, fail high at min nodes)
+    PV: 'pv',              # exact score inside the window
+}
+
+# Special values of the move fields
+NO_MOVE = -1    # the root of a search
+PASS_MOVE = -2
+PROBE = -3      # a ProbCut (or verification) search of the same position as its parent
+
+
+def _trace_path():
+    value = os.environ.get('REVERSI_TRACE', '')
+    if not value or value == '0':
+        return None
+    if value == '1':
+        os.makedirs(TRACE_DIR, exist_ok=True)
+        return os.path.join(TRACE_DIR, f'trace_{os.getpid()}.bin')
+    return value
+
+
+# ── Recorder ──────────────────────────────────────────────────────────────────
+
+class TreeRecorder:
+    """
+    Streams minimax nodes to a trace file.
+
+    Args:
+        path:              trace file (overwritten)
+        records_per_level: records written before the sampling rate halves
+        max_bytes:         the file is not grown past this size
+    """
+
+    def __init__(self, path, records_per_level=RECORDS_PER_LEVEL, max_bytes=MAX_BYTES):
+        self.path = path
+        self.file = open(path, 'wb')
+        self.file.write(HEADER.pack(MAGIC, 0, 0, 0))
+        self.records_per_level = records_per_level
+        self.max_records = (max_bytes - HEADER.size) // RECORD.size
+        self.stack = []       # [position, ply, root move, real children, probe children] per open node
+        self.seen = 0         # nodes that returned
+        self.written = 0
+        self.shift = 0        # keep one sampled node in 2 ** shift
+        self.level_written = 0
+        self.truncated = False
+        self.buffer = bytearray()
+
+    def enter(self, position):
+        """Open a node; returns its (ply, move, root move)."""
+        if not self.stack:
+            ply, move, root_move = 0, NO_MOVE, NO_MOVE
+        else:
+            parent = self.stack[-1]
+            parent_position = parent[0]
+            if position == parent_position:
+                ply, move = parent[1], PROBE
+                parent[4] += 1
+            else:
+                placed = (position.white | position.black) & ~(parent_position.white | parent_position.black)
+                ply, move = parent[1] + 1, placed.bit_length() - 1 if placed else PASS_MOVE
+                parent[3] += 1
+            root_move = move if ply == 1 and move != PROBE else parent[2]
+        self.stack.append([position, ply, root_move, 0, 0])
+        return ply, move, root_move
+
+    def leave(self, move, depth, alpha, beta, maximizing_player, score, nodes, aborted=False):
+        """Close the innermost node and write it (unless it is sampled out)."""
+        position, ply, root_move, children, probes = self.stack.pop()
+        self.seen += 1
+        if aborted:
+            if ply > 0:
+                return
+            reason = ABORTED
+        elif children == 0 and probes == 0:
+            reason = TT if depth > 0 and position.moves() else LEAF if position.moves() else TERMINAL
+        elif children == 0:
+            reason = PROBCUT
+        elif not position.moves():
+            reason = PASS
+        elif score >= beta:
+            reason = CUTOFF if maximizing_player else ALL
+        elif score <= alpha:
+            reason = ALL if maximizing_player else CUTOFF
+        else:
+            reason = PV
+
+        shift = 0
+        if ply > 1:
+            if self.seen & ((1 << self.shift) - 1):
+                return
+            shift = self.shift
+            self.level_written += 1
+            if self.level_written >= self.records_per_level:
+                self.shift += 1
+                self.level_written = 0
+        if self.written >= self.max_records:
+            self.truncated = True
+            return
+        self.buffer += RECORD.pack(min(ply, 255), max(-128, min(depth, 127)), reason, move, root_move,
+                                   min(children, 255), shift, alpha, beta, score, min(nodes, 0xFFFFFFFF))
+        self.written += 1
+        if len(self.buffer) >= 1 << 16:
+            self.flush()
+
+    def flush(self):
+        self.file.write(self.buffer)
+        self.buffer.clear()
+
+    def close(self):
+        if self.file.closed:
+            return
+        self.flush()
+        self.file.seek(0)
+        self.file.write(HEADER.pack(MAGIC, self.seen, self.written, self.truncated))
+        self.file.close()
+
+
+RECORDER = None
+_path = _trace_path()
+if _path is not None:
+    RECORDER = TreeRecorder(_path)
+    atexit.register(RECORDER.close)
+
+
+def traced(func):
+    """Decorator recording every call of minimax in RECORDER (no-op when tracing is off)."""
+    if RECORDER is None:
+        return func
+    recorder = RECORDER
+    search_globals = func.__globals__  # node_count lives in minimax's module
+
+    @functools.wraps(func)
+    def wrapper(position, depth, alpha, beta, maximizing_player, *rest):
+        _, move, _ = recorder.enter(position)
+        start = search_globals['node_count']
+        try:
+            result = func(position, depth, alpha, beta, maximizing_player, *rest)
+        except BaseException:
+            recorder.leave(move, depth, alpha, beta, maximizing_player, math.nan,
+                           search_globals['node_count'] - start, aborted=True)
+            raise
+        recorder.leave(move, depth, alpha, beta, maximizing_player, result[0],
+                       search_globals['node_count'] - start)
+        return result
+    return wrapper
+
+
+# ── Inspector ─────────────────────────────────────────────────────────────────
+
+def read_trace(path):
+    """
+    Returns:
+        (header dict, list of searches); a search is the list of its records as dicts, its
+        root (or an 'aborted' marker) last
+    """
+    with open(path, 'rb') as f:
+        magic, seen, written, truncated = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC:
+            raise ValueError(f'{path} is not a search trace')
+        data = f.read()
+    searches, current = [], []
+    for fields in RECORD.iter_unpack(data[:len(data) - len(data) % RECORD.size]):
+        ply, depth, reason, move, root_move, children, shift, alpha, beta, score, nodes = fields
+        current.append({'ply': ply, 'depth': depth, 'reason': reason, 'move': move, 'root_move': root_move,
+                        'children': children, 'weight': 1 << shift, 'alpha': alpha, 'beta': beta,
+                        'score': score, 'nodes': nodes})
+        if ply == 0 and move == NO_MOVE:
+            searches.append(current)
+            current = []
+    if current:
+        searches.append(current)
+    return {'nodes': seen, 'records': written, 'truncated': bool(truncated)}, searches
+
+
+def move_name(move):
+    if move == NO_MOVE:
+        return 'root'
+    if move == PASS_MOVE:
+        return 'pass'
+    if move == PROBE:
+        return 'probe'
+    return str(divmod(move, 8))
+
+
+def summarize(records):
+    """Text report of where the nodes of `records` went."""
+    lines = []
+    reason_names = [REASONS[r] for r in (LEAF, TERMINAL, TT, PROBCUT, PASS, CUTOFF, ALL, PV)]
+
+    by_ply = defaultdict(lambda: defaultdict(float))
+    leaf_evals = defaultdict(list)
+    for record in records:
+        row = by_ply[record['ply']]
+        row['nodes'] += record['weight']
+        row[REASONS[record['reason']]] += record['weight']
+        if record['reason'] == LEAF:
+            leaf_evals[record['ply']].append(record['score'])
+    total = sum(row['nodes'] for row in by_ply.values()) or 1
+    lines.append('By ply (sampled counts scaled by their weight; leaves scored in a batch are only counted in '
+                 'their parent\'s subtree):')
+    lines.append(f"{'ply':>4} {'nodes':>9} {'share':>6}  " + ' '.join(f'{name:>8}' for name in reason_names)
+                 + f"  {'leaf eval':>10}")
+    for ply in sorted(by_ply):
+        row = by_ply[ply]
+        evals = leaf_evals[ply]
+        mean = f'{sum(evals) / len(evals):>+10.1f}' if evals else f"{'':>10}"
+        lines.append(f"{ply:>4} {row['nodes']:>9.0f} {row['nodes'] / total:>6.1%}  "
+                     + ' '.join(f'{row[name]:>8.0f}' for name in reason_names) + f'  {mean}')
+
+    root_moves = [r for r in records if r['ply'] == 1 and r['move'] != PROBE]
+    if root_moves:
+        lines.append('')
+        lines.append('By root move (search order; subtree nodes are exact):')
+        lines.append(f"{'move':<8} {'nodes':>9} {'share':>6} {'score':>10} {'window':>22} {'result':>8}")
+        root_total = sum(r['nodes'] for r in root_moves) or 1
+        for record in root_moves:
+            window = f"({record['alpha']:.1f}, {record['beta']:.1f})"
+            lines.append(f"{move_name(record['move']):<8} {record['nodes']:>9} {record['nodes'] / root_total:>6.1%} "
+                         f"{record['score']:>+10.1f} {window:>22} {REASONS[record['reason']]:>8}")
+
+    lines.append('')
+    lines.append('By cutoff type:')
+    by_reason = defaultdict(float)
+    for record in records:
+        by_reason[record['reason']] += record['weight']
+    for reason in (CUTOFF, ALL, PV, TT, PROBCUT, PASS, LEAF, TERMINAL):
+        if by_reason[reason]:
+            lines.append(f"  {REASONS[reason]:<9} {by_reason[reason]:>9.0f} {by_reason[reason] / total:>6.1%}")
+    # Move ordering: a cut node whose first move refuted it searched one child. Depth-1 nodes
+    # score their later children in a batch, so only deeper nodes are counted.
+    cuts = [r for r in records if r['reason'] == CUTOFF and r['depth'] >= 2]
+    if cuts:
+        weight = sum(r['weight'] for r in cuts)
+        first = sum(r['weight'] for r in cuts if r['children'] == 1)
+        mean_children = sum(r['children'] * r['weight'] for r in cuts) / weight
+        lines.append(f"  cut nodes (depth >= 2) refuted by their first move: {first / weight:.1%}, "
+                     f"{mean_children:.2f} moves searched on average")
+    probes = sum(r['weight'] for r in records if r['move'] == PROBE)
+    if probes:
+        lines.append(f"  ProbCut probe searches: {probes:.0f}")
+    return '\n'.join(lines)
+
+
+def main():
+    paths = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    if not paths:
+        print('usage: python3 src/search_trace.py <trace.bin> [--search=<n> | --all] [--list]')
+        return 1
+    header, searches = read_trace(paths[0])
+    print(f"{paths[0]}: {header['nodes']} nodes, {header['records']} records"
+          f"{' (truncated at the size limit)' if header['truncated'] else ''}, {len(searches)} searches")
+    listed = range(len(searches)) if '--list' in sys.argv else range(max(0, len(searches) - 10), len(searches))
+    if listed and listed[0] > 0:
+        print(f'  ... {listed[0]} earlier searches (--list shows all)')
+    for index in listed:
+        root = searches[index][-1]
+        status = REASONS[root['reason']] if root['ply'] == 0 else 'incomplete'
+        print(f"  search {index}: depth {root['depth']}, score {root['score']:+.1f}, "
+              f"{root['nodes']} nodes, {status}")
+    print()
+
+    if '--all' in sys.argv:
+        print('All searches')
+        print(summarize([record for search in searches for record in search]))
+        return 0
+    selected = len(searches) - 1
+    for arg in sys.argv[1:]:
+        if arg.startswith('--search='):
+            selected = int(arg.split('=', 1)[1])
+    if searches:
+        print(f'Search {selected}')
+        print(summarize(searches[selected]))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
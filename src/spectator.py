@@ -0,0 +1,431 @@
+import os
+import sys
+import json
+import time
+import queue
+import select
+import socket
+import itertools
+import selectors
+import threading
+
+from position import Position
+
+# Spectator stream: any number of observers watch any number of games over TCP.
+#
+# Game loops (reversi_server, AutoGameServer) publish to a hub through a Feed. Publishing a
+# move costs the same no matter how many observers there are: the game loop turns the board
+# into two bitboards, queues one JSON line and returns; a feed thread sends it to the hub.
+# The hub (its own thread, or its own process) keeps the last position of every game and
+# sends each subscriber only the deltas of the games it asked for:
+#
+#   {"type": "start", "game": id, "white": bits, "black": bits, "turn": side to move}
+#   {"type": "move", "game": id, "ply": n, "turn": side that moved, "move": [x, y] or null,
+#    "flips": bitboard of the flipped discs, "clock": seconds the move took}
+#   {"type": "end", "game": id, "white": disc count, "black": disc count}
+#   (with "abandoned": true when the hub ends it because its publisher disconnected)
+#
+# Every subscriber has its own output buffer of at most SUBSCRIBER_BUFFER bytes. An observer
+# that reads too slowly does not hold anything up: when its buffer would overflow it is
+# emptied and replaced by a "snapshot" of each of its games (same fields as "start" plus
+# "ply"), so the observer skips ahead instead of falling further behind.
+#
+#     python3 src/spectator.py hub [--port=33400]                 a standalone hub
+#     python3 src/spectator.py watch <host>:<port> [game ...]     print a stream (all games by default)
+#     python3 src/spectator.py bench [observers] [games]          publish cost with many observers
+#
+# Game loops publish when REVERSI_SPECTATE=<host>:<port> names a hub; reversi_server.py
+# --spectate[=<port>] and match_runner.py --spectate <port> start one of their own.
+
+HUB_PORT = 33400
+SUBSCRIBER_BUFFER = 256 * 1024
+SOCKET_BUFFER = 64 * 1024   # kernel send buffer of each subscriber connection
+FEED_QUEUE = 10000          # events a feed holds while the hub is unreachable; older ones are dropped
+RECONNECT_INTERVAL = 2.0
+
+
+def parse_spectate(argv):
+    """Read `--spectate[=<port>]` from argv. Returns None if absent, else the port."""
+    for arg in argv:
+        if arg == '--spectate':
+            return HUB_PORT
+        if arg.startswith('--spectate='):
+            return int(arg.split('=', 1)[1])
+    return None
+
+
+# ── Hub ───────────────────────────────────────────────────────────────────────
+
+class _Connection:
+    def __init__(self, sock):
+        self.sock = sock
+        self.role = None         # 'publisher' or 'subscriber' after the hello line
+        self.games = None        # subscribed game ids, None for every game
+        self.inbox = b''
+        self.outbox = bytearray()
+        self.lagged = 0          # times the outbox overflowed and was replaced by snapshots
+        self.published = set()   # games a publisher started and has not ended
+
+
+class Hub:
+    """
+    Relays published game events to subscribers, each with a bounded buffer.
+
+    Args:
+        host, port:    address to listen on (port 0 picks a free one, see self.address)
+        buffer_bytes:  per-subscriber output buffer limit
+    """
+
+    def __init__(self, host='127.0.0.1', port=HUB_PORT, buffer_bytes=SUBSCRIBER_BUFFER):
+        self.buffer_bytes = buffer_bytes
+        self.listener = socket.create_server((host, port))
+        self.listener.setblocking(False)
+        self.address = self.listener.getsockname()[:2]
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.listener, selectors.EVENT_READ)
+        self.games = {}          # game id -> {'white', 'black', 'turn', 'ply'}
+        self.watchers = {}       # game id -> subscribers of that game
+        self.everything = set()  # subscribers of every game
+        self.delivered = 0
+        self.thread = None
+
+    def start(self):
+        """Serve in a daemon thread; returns self."""
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        return self
+
+    def run(self):
+        while True:
+            for key, events in self.selector.select(timeout=1.0):
+                if key.fileobj is self.listener:
+                    sock, _ = self.listener.accept()
+                    sock.setblocking(False)
+                    self.selector.register(sock, selectors.EVENT_READ, _Connection(sock))
+                    continue
+                connection = key.data
+                if events & selectors.EVENT_WRITE:
+                    self._flush(connection)
+                if events & selectors.EVENT_READ:
+                    self._read(connection)
+
+    def _read(self, connection):
+        try:
+            data = connection.sock.recv(65536)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            data = b''
+        if not data:
+            self._close(connection)
+            return
+        *lines, connection.inbox = (connection.inbox + data).split(b'\n')
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                message = json.loads(line)
+                if connection.role is None:
+                    self._hello(connection, message)
+                elif connection.role == 'publisher':
+                    self._event(connection, message)
+            except (ValueError, KeyError, TypeError, AttributeError):
+                # A malformed message costs its sender the connection, nobody else anything
+                self._close(connection)
+                return
+
+    def _hello(self, connection, message):
+        connection.role = message.get('role')
+        if connection.role != 'subscriber':
+            return
+        # Bound the kernel's share of a slow subscriber's backlog too
+        connection.sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SOCKET_BUFFER)
+        games = message.get('games')
+        connection.games = set(games) if games else None
+        if connection.games is None:
+            self.everything.add(connection)
+        else:
+            for game in connection.games:
+                self.watchers.setdefault(game, set()).add(connection)
+        for game in (self.games if connection.games is None else connection.games):
+            if game in self.games:
+                connection.outbox += self._snapshot(game)
+        self._flush(connection)
+
+    def _snapshot(self, game):
+        state = self.games[game]
+        return (json.dumps({'type': 'snapshot', 'game': game, **state}) + '\n').encode()
+
+    def _event(self, publisher, message):
+        game = message['game']
+        kind = message['type']
+        if kind == 'start':
+            self.games[game] = {'white': int(message['white']), 'black': int(message['black']),
+                                'turn': message['turn'], 'ply': 0}
+            publisher.published.add(game)
+            line = json.dumps(message)
+        elif kind == 'move':
+            state = self.games.get(game)
+            if state is None:
+                return
+            # The flipped discs are the ones that changed colour, found from the two positions
+            white, black = int(message['white']), int(message['black'])
+            flips = state['black'] & white if message['turn'] == 1 else state['white'] & black
+            state.update(white=white, black=black, turn=-message['turn'], ply=message['ply'])
+            line = json.dumps({'type': 'move', 'game': game, 'ply': message['ply'], 'turn': message['turn'],
+                               'move': message['move'], 'flips': flips, 'clock': message['clock']})
+        elif kind == 'end':
+            self.games.pop(game, None)
+            publisher.published.discard(game)
+            line = json.dumps(message)
+        else:
+            return
+        self._broadcast(game, (line + '\n').encode(), kind == 'end')
+
+    def _broadcast(self, game, data, ended):
+        # (a copy: a subscriber whose connection failed is removed while pushing)
+        for connection in list(itertools.chain(self.everything, self.watchers.get(game, ()))):
+            self._push(connection, data, game)
+        if ended:
+            self.watchers.pop(game, None)
+
+    def _push(self, connection, data, game):
+        if len(connection.outbox) + len(data) > self.buffer_bytes:
+            # Too slow: drop what it has not read and let it catch up from snapshots
+            connection.lagged += 1
+            connection.outbox.clear()
+            for watched in (self.games if connection.games is None else connection.games):
+                if watched in self.games:
+                    connection.outbox += self._snapshot(watched)
+            if game not in self.games:
+                connection.outbox += data
+        else:
+            connection.outbox += data
+        self._flush(connection)
+
+    def _flush(self, connection):
+        if connection.outbox:
+            try:
+                sent = connection.sock.send(connection.outbox)
+                del connection.outbox[:sent]
+                self.delivered += sent
+            except (BlockingIOError, InterruptedError):
+                pass
+            except OSError:
+                self._close(connection)
+                return
+        events = selectors.EVENT_READ | (selectors.EVENT_WRITE if connection.outbox else 0)
+        key = self.selector.get_key(connection.sock)
+        if key.events != events:
+            self.selector.modify(connection.sock, events, connection)
+
+    def _close(self, connection):
+        self.everything.discard(connection)
+        for game in connection.games or ():
+            self.watchers.get(game, set()).discard(connection)
+        try:
+            self.selector.unregister(connection.sock)
+        except (KeyError, ValueError):
+            pass
+        connection.sock.close()
+        # A publisher that went away will not end its games: end them for their subscribers
+        published, connection.published = connection.published, set()
+        for game in published:
+            state = self.games.pop(game, None)
+            if state is not None:
+                line = json.dumps({'type': 'end', 'game': game, 'white': state['white'].bit_count(),
+                                   'black': state['black'].bit_count(), 'abandoned': True})
+                self._broadcast(game, (line + '\n').encode(), True)
+
+
+# ── Feed (publisher side) ─────────────────────────────────────────────────────
+
+_game_ids = itertools.count(1)
+
+
+class Feed:
+    """
+    Publishes a process's games to a hub. Every call only queues a line; a daemon thread sends
+    them, so a slow or missing hub never blocks the game loop.
+    """
+
+    def __init__(self, host, port):
+        self.address = (host, port)
+        self.events = queue.Queue(FEED_QUEUE)
+        self.dropped = 0
+        threading.Thread(target=self._send_loop, daemon=True).start()
+
+    def new_game(self, board, turn):
+        """Announce a game starting from `board` with `turn` to move; returns its id."""
+        game = f'{socket.gethostname()}-{os.getpid()}-{next(_game_ids)}'
+        position = Position.from_board(board, turn)
+        self._put({'type': 'start', 'game': game, 'white': position.white, 'black': position.black, 'turn': turn})
+        return game
+
+    def move(self, game, ply, turn, move, board, clock):
+        """Publish `turn`'s move ([x, y], or [-1, -1] for a pass) and the board after it."""
+        position = Position.from_board(board, -turn)
+        self._put({'type': 'move', 'game': game, 'ply': ply, 'turn': turn,
+                   'move': None if move is None or list(move) == [-1, -1] else [int(move[0]), int(move[1])],
+                   'white': position.white, 'black': position.black, 'clock': round(clock, 3)})
+
+    def end(self, game, white, black):
+        self._put({'type': 'end', 'game': game, 'white': int(white), 'black': int(black)})
+
+    def _put(self, message):
+        try:
+            self.events.put_nowait((json.dumps(message) + '\n').encode())
+        except queue.Full:
+            self.dropped += 1
+
+    def _send_loop(self):
+        sock = None
+        while True:
+            data = self.events.get()
+            while sock is None:
+                try:
+                    sock = socket.create_connection(self.address, timeout=5)
+                    sock.sendall(b'{"role": "publisher"}\n')
+                except OSError:
+                    sock = None
+                    time.sleep(RECONNECT_INTERVAL)
+            try:
+                sock.sendall(data)
+            except OSError:
+                sock.close()
+                sock = None
+
+
+_feed = None
+_feed_pid = None
+
+
+def get_feed():
+    """The process's Feed to the hub named by REVERSI_SPECTATE, or None if spectating is off."""
+    global _feed, _feed_pid
+    address = os.environ.get('REVERSI_SPECTATE')
+    if not address:
+        return None
+    if _feed is None or _feed_pid != os.getpid():
+        # A forked worker process gets a feed (and thread) of its own
+        host, _, port = address.rpartition(':')
+        _feed, _feed_pid = Feed(host or '127.0.0.1', int(port)), os.getpid()
+    return _feed
+
+
+def start_hub(port=HUB_PORT, host='127.0.0.1'):
+    """Start a hub in this process and point REVERSI_SPECTATE (this process and its children) at it."""
+    hub = Hub(host, port).start()
+    os.environ['REVERSI_SPECTATE'] = f'127.0.0.1:{hub.address[1]}'
+    return hub
+
+
+# ── Observers ─────────────────────────────────────────────────────────────────
+
+def subscribe(address, games=None):
+    """Connect to a hub and yield its messages for `games` (every game if None)."""
+    sock = socket.create_connection(address)
+    sock.sendall((json.dumps({'role': 'subscriber', 'games': games}) + '\n').encode())
+    buffer = b''
+    with sock:
+        while True:
+            data = sock.recv(65536)
+            if not data:
+                return
+            *lines, buffer = (buffer + data).split(b'\n')
+            for line in lines:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def watch(address, games=None):
+    """Print a hub's stream, one line per event."""
+    for message in subscribe(address, games):
+        game = message['game']
+        if message['type'] in ('start', 'snapshot'):
+            position = Position(message['white'], message['black'], message['turn'])
+            print(f"{game}: {message['type']}, white {position.count(1)}, black {position.count(-1)}")
+        elif message['type'] == 'move':
+            side = 'White' if message['turn'] == 1 else 'Black'
+            move = 'pass' if message['move'] is None else tuple(message['move'])
+            print(f"{game}: {message['ply']:>3} {side} {move} flips {bin(message['flips']).count('1')} "
+                  f"({message['clock']:.2f}s)")
+        elif message['type'] == 'end':
+            print(f"{game}: game over, white {message['white']}, black {message['black']}")
+
+
+def benchmark(observers=300, games=8, moves=60):
+    """
+    Publish `games` x `moves` moves to an in-process hub watched by `observers` subscribers
+    (half of them never read) and report the game loop's cost per published move.
+    """
+    import random
+    hub = Hub('127.0.0.1', 0, buffer_bytes=16 * 1024).start()
+    feed = Feed(*hub.address)
+    sockets = []
+    for index in range(observers):
+        sock = socket.socket()
+        # Small kernel buffers so the stalled observers fill up their hub buffers quickly
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+        sock.connect(hub.address)
+        sock.sendall(b'{"role": "subscriber", "games": null}\n')
+        sockets.append(sock)
+    readers = sockets[::2]
+
+    def drain():
+        try:
+            while True:
+                ready, _, _ = select.select(readers, [], [], 0.5)
+                for sock in ready:
+                    sock.recv(65536)
+        except (OSError, ValueError):
+            return   # sockets closed at the end of the benchmark
+
+    threading.Thread(target=drain, daemon=True).start()
+    time.sleep(0.5)
+
+    rng = random.Random(0)
+    costs = []
+    for _ in range(games):
+        position = Position.initial()
+        game = feed.new_game(position.board(), position.turn)
+        for ply in range(1, moves + 1):
+            legal = position.legal_moves()
+            if position.is_game_over():
+                break
+            move = rng.choice(legal) if legal else None
+            turn = position.turn
+            position = position.play(move)
+            board = position.board()
+            start = time.perf_counter()
+            feed.move(game, ply, turn, move or [-1, -1], board, 0.0)
+            costs.append(time.perf_counter() - start)
+        feed.end(game, position.count(1), position.count(-1))
+    time.sleep(1.0)
+    lagged = sum(connection.lagged for connection in
+                 (key.data for key in hub.selector.get_map().values()) if connection is not None)
+    print(f"{len(costs)} moves published to {observers} observers ({len(readers)} reading, the rest stalled): "
+          f"{sum(costs) / len(costs) * 1e6:.1f} us per move in the game loop, max {max(costs) * 1e6:.0f} us; "
+          f"{hub.delivered / 1e6:.1f} MB delivered, {lagged} buffer overflows resynced")
+    for sock in sockets:
+        sock.close()
+
+
+if __name__ == '__main__':
+    command = sys.argv[1] if len(sys.argv) > 1 else ''
+    if command == 'hub':
+        port = HUB_PORT
+        for arg in sys.argv[2:]:
+            if arg.startswith('--port='):
+                port = int(arg.split('=', 1)[1])
+        hub = Hub('0.0.0.0', port)
+        print(f"Spectator hub on port {hub.address[1]}")
+        hub.run()
+    elif command == 'watch' and len(sys.argv) > 2:
+        host, _, port = sys.argv[2].rpartition(':')
+        watch((host or '127.0.0.1', int(port)), sys.argv[3:] or None)
+    elif command == 'bench':
+        benchmark(*(int(arg) for arg in sys.argv[2:4]))
+    else:
+        print('usage: python3 src/spectator.py hub [--port=<port>] | watch <host>:<port> [game ...] | bench [observers] [games]')
+        sys.exit(1)
@@ -1,4 +1,63 @@
+import os
+import sys
+import time
+import pickle
 import numpy as np
+from profiling import timed
+
+# ── Server deadlines ──────────────────────────────────────────────────────────
+# A server that enforces a per-move time limit sends it as a third element of the play
+# request, [turn, board, seconds], and sets game.deadline for in-process players. Players
+# stop thinking at their own time limit or DEADLINE_MARGIN before the server deadline,
+# whichever is first; with REVERSI_SERVER_DEADLINE=1 (or --server-deadline) they use the
+# whole server budget instead of their own limit.
+DEADLINE_MARGIN = 0.05
+USE_SERVER_DEADLINE = os.environ.get('REVERSI_SERVER_DEADLINE', '0') != '0' or '--server-deadline' in sys.argv
+
+
+def parse_move_time(argv):
+    """--move-time=<seconds> on a server's command line, or None."""
+    for arg in argv:
+        if arg.startswith('--move-time='):
+            return float(arg.split('=', 1)[1])
+    return None
+
+
+def read_request(data, game):
+    """Unpickle a play request, setting game.deadline if the server sent a time limit. Returns (turn, board)."""
+    request = pickle.loads(data)
+    game.deadline = time.time() + request[2] if len(request) > 2 else None
+    return request[0], request[1]
+
+
+def move_deadline(game, time_limit):
+    """time.time() value at which a player with `time_limit` seconds per move should stop thinking."""
+    deadline = time.time() + time_limit
+    server_deadline = getattr(game, 'deadline', None)
+    if server_deadline is not None:
+        if USE_SERVER_DEADLINE:
+            deadline = server_deadline - DEADLINE_MARGIN
+        else:
+            deadline = min(deadline, server_deadline - DEADLINE_MARGIN)
+    return deadline
+
+
+# ── Stop requests ─────────────────────────────────────────────────────────────
+# player_runtime runs choose_move in a worker process and gives it a shared flag that is
+# set when the server says "stop now"; searches poll stop_requested() along with their
+# deadline and return the best move found so far.
+_stop_flag = None
+
+
+def set_stop_flag(flag):
+    """Install the shared flag (a multiprocessing.Value) polled by stop_requested()."""
+    global _stop_flag
+    _stop_flag = flag
+
+
+def stop_requested():
+    return _stop_flag is not None and bool(_stop_flag.value)
+
 
 def calculate_final_score(board):
     black_tiles = 0
@@ -13,14 +72,10 @@ def calculate_final_score(board):
 
     return white_tiles, black_tiles
 
+@timed('get_legal_moves')
 def get_legal_moves(game, piece):
     """Return list of (x, y) legal moves for the given piece."""
-    moves = []
-    for i in range(8):
-        for j in range(8):
-            if game.step(i, j, piece, False) > 0:
-                moves.append((i, j))
-    return moves
+    return [(x, y) for x, y, _, _ in game.legal_moves_with_flips(piece)]
 
 def apply_move(board, game, x, y, piece):
     """Apply a move on a copy of the board and return the new board state."""